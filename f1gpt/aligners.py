@@ -0,0 +1,108 @@
+import numpy
+import pandas
+
+# channels with discrete values are resampled with the last sample before each
+# grid point instead of being interpolated (e.g. there is no gear 3.5)
+DISCRETE_CHANNELS = ['nGear', 'Brake', 'DRS']
+
+def rolling_mean(values: numpy.ndarray, window_size: int) -> numpy.ndarray:
+    '''Calculates the rolling mean of the last axis of an array, the first
+    window_size - 1 points (without a full window) are set to 0
+    Args:
+        values: (numpy.ndarray) array to be smoothed
+        window_size: (int) size of the rolling window
+    Returns:
+        numpy.ndarray with the same shape of values'''
+    result = numpy.zeros(values.shape, dtype=float)
+    if window_size <= 1:
+        result[...] = values
+        return result
+    cumsum = numpy.cumsum(values, axis=-1, dtype=float)
+    window_sum = cumsum[..., window_size - 1:].copy()
+    window_sum[..., 1:] -= cumsum[..., :-window_size]
+    result[..., window_size - 1:] = window_sum / window_size
+    return result
+
+class TelemetryAligner:
+    '''Class to resample the telemetry of any number of drivers on a common distance grid
+    Attributes:
+        cars: list of the drivers numbers
+        distance: numpy.ndarray with the distance grid in meters
+        time: numpy.ndarray (drivers x distance) with the lap time in seconds
+        channels: dictionary with a numpy.ndarray (drivers x distance) for each channel
+    Methods:
+        time_delta: time difference of every driver to a reference driver
+        channel_delta: channel difference of every driver to a reference driver
+        gap: smoothed time gap of a driver to a reference driver
+        '''
+    def __init__(self,
+                 telemetries: list[pandas.DataFrame],
+                 cars: list[str],
+                 step: float = 1.0,
+                 channels: list[str] = ['Speed', 'Throttle', 'Brake', 'nGear']) -> None:
+        '''Creates a TelemetryAligner object
+        Args:
+            telemetries: (list[pandas.DataFrame]) telemetry of a lap of each driver, with "Distance" and "Time" columns
+            cars: (list[str]) drivers numbers in the same order of telemetries
+            step: (float) [optional] distance between grid points in meters
+            channels: (list[str]) [optional] telemetry channels to be resampled
+        Returns:
+            None'''
+        self.cars = list(cars)
+        # the grid stops at the shortest lap, so no driver is extrapolated
+        lap_length = min(telemetry['Distance'].max() for telemetry in telemetries)
+        self.distance = numpy.arange(0, lap_length, step)
+        self.time = numpy.empty((len(telemetries), len(self.distance)))
+        self.channels = {channel: numpy.empty((len(telemetries), len(self.distance)))
+                         for channel in channels}
+
+        for index, telemetry in enumerate(telemetries):
+            distance = telemetry['Distance'].to_numpy(dtype=float)
+            time = telemetry['Time'].to_numpy(dtype='timedelta64[ns]').astype('int64') / 1e9
+            self.time[index] = numpy.interp(self.distance, distance, time)
+            previous = numpy.searchsorted(distance, self.distance, side='right') - 1
+            previous = previous.clip(0, len(distance) - 1)
+            for channel in channels:
+                values = telemetry[channel].to_numpy(dtype=float)
+                if channel in DISCRETE_CHANNELS:
+                    self.channels[channel][index] = values[previous]
+                else:
+                    self.channels[channel][index] = numpy.interp(self.distance, distance, values)
+
+    def _reference_index(self, reference: str | None) -> int:
+        if reference is None:
+            return 0
+        return self.cars.index(reference)
+
+    def time_delta(self, reference: str | None = None) -> numpy.ndarray:
+        '''Calculates the time difference of every driver to a reference driver
+        Args:
+            reference: (str) [optional] reference driver number, by default the first driver
+        Returns:
+            numpy.ndarray (drivers x distance) with the time difference in seconds, positive when slower'''
+        return self.time - self.time[self._reference_index(reference)]
+
+    def channel_delta(self, channel: str, reference: str | None = None) -> numpy.ndarray:
+        '''Calculates the difference of a channel of every driver to a reference driver
+        Args:
+            channel: (str) name of the channel (e.g. "Speed")
+            reference: (str) [optional] reference driver number, by default the first driver
+        Returns:
+            numpy.ndarray (drivers x distance) with the channel difference'''
+        values = self.channels[channel]
+        return values - values[self._reference_index(reference)]
+
+    def gap(self,
+            car: str,
+            reference: str | None = None,
+            window_size: int = 1) -> numpy.ndarray:
+        '''Calculates the smoothed time gap of a driver to a reference driver
+        Args:
+            car: (str) driver number
+            reference: (str) [optional] reference driver number, by default the first driver
+            window_size: (int) [optional] size of the rolling window (in grid points) used to smooth the gap
+        Returns:
+            numpy.ndarray with the time gap in seconds along the distance grid'''
+        reference_index = self._reference_index(reference)
+        delta = self.time[self.cars.index(car)] - self.time[reference_index]
+        return rolling_mean(delta, window_size)
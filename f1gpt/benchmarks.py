@@ -0,0 +1,220 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Offline benchmarks of the hot paths on synthetic sessions (see f1gpt.fixtures), run with:
+# python -m f1gpt.benchmarks [save [stage ...]]
+# Results are compared with the baselines file and any regression exits with an error.
+# "save" adds the stages without a baseline, and re-baselines only the stages named after it
+# (e.g. "save calculate_gap"), so unrelated baselines are never overwritten by noise.
+# Timings are not compared in absolute seconds: each result keeps the time of a fixed reference
+# workload measured in the same run, and baselines are scaled by the ratio of the reference times,
+# so baselines saved on one machine hold on a slower or faster one (e.g. CI).
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks.json')
+# a stage regresses when it is slower / uses more memory than scaled baseline * tolerance + floor,
+# the floors (seconds, MB) are an absolute slack for timer and allocator noise
+TIME_TOLERANCE = 1.5
+MEMORY_TOLERANCE = 1.25
+TIME_FLOOR = 0.002
+MEMORY_FLOOR = 0.05
+# each timing runs a stage (with a new setup per call) until this many seconds are measured, and
+# reports the mean per call, so the timings of the fastest stages are well above timer noise
+MIN_SECONDS = 0.05
+# simulated latency in seconds of each call of the stub model of the prompt executor stage
+EXECUTOR_DELAY = 0.01
+# (name, drivers, laps, sample rate) of each scenario
+SCENARIOS = [('small', 10, 5, 4.0),
+             ('default', 20, 10, 10.0),
+             ('high_rate', 20, 10, 50.0),
+             ('long', 20, 60, 10.0)]
+
+def measure(function, repeat: int = 3, setup=None, min_seconds: float = MIN_SECONDS) -> dict[str, float]:
+    '''Measures the time and the peak of memory allocated by a function
+    Args:
+        function: (callable) function to be measured, called with the result of setup if given
+        repeat: (int) [optional] number of timed repetitions, the fastest one is reported
+        setup: (callable) [optional] function called before each call (e.g. a new session), it is not measured
+        min_seconds: (float) [optional] minimum measured time of a repetition, the function is called
+                     until it is reached and the mean time per call is reported
+    Returns:
+        dictionary with "seconds" (per call) and "peak_mb" keys'''
+    seconds = []
+    for _ in range(repeat):
+        total = 0.0
+        calls = 0
+        while total < min_seconds:
+            args = [setup()] if setup else []
+            start = time.perf_counter()
+            function(*args)
+            total += time.perf_counter() - start
+            calls += 1
+        seconds.append(total / calls)
+    # memory is traced in a separate run, tracing slows down every allocation
+    args = [setup()] if setup else []
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': round(min(seconds), 5), 'peak_mb': round(peak / 2 ** 20, 3)}
+
+def reference_workload() -> None:
+    '''Fixed numpy and pandas workload, its time in a run gives the speed of the machine'''
+    import numpy
+    import pandas
+
+    values = numpy.random.default_rng(0).random(200000)
+    numpy.sort(values)
+    pandas.Series(values).groupby((values * 100).astype(int)).mean()
+
+def run_scenario(path: str, drivers: int, laps: int, sample_rate: float, repeat: int = 3) -> dict[str, dict]:
+    '''Runs every stage on a synthetic session
+    Args:
+        path: (str) directory where the synthetic session store is written
+        drivers: (int) number of drivers
+        laps: (int) number of laps of each driver
+        sample_rate: (float) telemetry samples per second
+        repeat: (int) [optional] number of repetitions of each stage
+    Returns:
+        dictionary with the measure of each stage'''
+    from f1gpt import tracks
+    from f1gpt.briefiers import SessionBriefer
+    from f1gpt.executors import PromptExecutor
+    from f1gpt.fixtures import FixtureSession, create_fixture_session
+    from f1gpt.pacers import lap_pace
+    from f1gpt.ploters import Ploter
+    from f1gpt.prompts import StubModel
+    from f1gpt.skills import range_messages
+
+    session = create_fixture_session(path, drivers, laps, sample_rate)
+    session.get_data()
+    car_data = session.car_data
+    # telemetries of every driver are read from the store once, and the track map is cached on disk
+    session.get_telemetry_arrays()
+    session.get_track()
+
+    # every call starts from a new session, so no stage measures the analysis cached by a previous call
+    def new_session() -> FixtureSession:
+        fresh = FixtureSession(session.store, session.drivers)
+        fresh._laps = session.laps
+        return fresh
+
+    def ranked_session() -> FixtureSession:
+        fresh = new_session()
+        fresh.get_cars()
+        return fresh
+
+    def loaded_session() -> FixtureSession:
+        # telemetries already read, track map only cached on disk
+        fresh = ranked_session()
+        fresh._telemetries = dict(session._telemetries)
+        fresh.get_data()
+        tracks._tracks.clear()
+        return fresh
+
+    # one range prompt per corner against a stub model with latency, the calls must overlap
+    prompts = {name: range_messages(session, [start, end], name) for name, start, end in session.get_track().corners}
+    executor = PromptExecutor(StubModel(delay=EXECUTOR_DELAY), concurrency=4, retries=0)
+
+    def run_prompts() -> None:
+        responses = executor.run_all(prompts)
+        failed = [name for name, response in responses.items() if isinstance(response, Exception)]
+        if failed or len(responses) != len(prompts):
+            raise RuntimeError(f'PromptExecutor failed on {failed or "missing prompts"}')
+
+    return {'fastests_lap': measure(lambda fresh: fresh.fastests_lap(), repeat, new_session),
+            'get_telemetries': measure(lambda fresh: fresh.get_telemetries(), repeat, ranked_session),
+            'calculate_gap': measure(lambda ploter: ploter.calculate_gap(), repeat,
+                                     lambda: Ploter(loaded_session())),
+            'create_range_briefing': measure(lambda briefer: briefer.create_range_briefing([1100, 1300], 'fixture'),
+                                             repeat, lambda: SessionBriefer(loaded_session())),
+            'plot_comparison': measure(lambda ploter: ploter.plot_comparison(save_png=False), repeat,
+                                       lambda: Ploter(loaded_session())),
+            'lap_pace': measure(lambda: lap_pace(session.laps, car_data), repeat),
+            'mini_sectors': measure(lambda fresh: fresh.get_mini_sectors(), repeat, loaded_session),
+            'prompt_executor': measure(run_prompts, repeat)}
+
+def run_benchmarks(scenarios: list[tuple] = SCENARIOS, repeat: int = 5) -> dict[str, dict]:
+    '''Runs every scenario in a temporary directory
+    Args:
+        scenarios: (list[tuple]) [optional] (name, drivers, laps, sample rate) of each scenario
+        repeat: (int) [optional] number of repetitions of each stage
+    Returns:
+        dictionary with the results of each scenario by name, each result with the time of the
+        reference workload of the run ("reference" key)'''
+    reference = measure(reference_workload, repeat)['seconds']
+    results = {}
+    for name, drivers, laps, sample_rate in scenarios:
+        with tempfile.TemporaryDirectory() as path:
+            results[name] = run_scenario(path, drivers, laps, sample_rate, repeat)
+        for result in results[name].values():
+            result['reference'] = reference
+    return results
+
+def compare_baselines(results: dict[str, dict], baselines: dict[str, dict]) -> list[str]:
+    '''Compares benchmark results with the baselines
+    Args:
+        results: (dict) results of run_benchmarks
+        baselines: (dict) baselines with the same structure of the results
+    Returns:
+        regressions: list of messages, one per regressed stage'''
+    regressions = []
+    for scenario, stages in results.items():
+        for stage, result in stages.items():
+            baseline = baselines.get(scenario, {}).get(stage)
+            if baseline is None:
+                continue
+            # machine speed of this run relative to the run of the baseline
+            speed = result['reference'] / baseline.get('reference', result['reference'])
+            for key, scale, tolerance, floor in [('seconds', speed, TIME_TOLERANCE, TIME_FLOOR),
+                                                 ('peak_mb', 1.0, MEMORY_TOLERANCE, MEMORY_FLOOR)]:
+                if result[key] > baseline[key] * scale * tolerance + floor:
+                    regressions.append(f'{scenario}/{stage}: {key} {result[key]} > baseline '
+                                       f'{baseline[key]} (x{scale:.2f} machine speed)')
+    return regressions
+
+def update_baselines(results: dict[str, dict],
+                     baselines: dict[str, dict],
+                     stages: list[str]) -> dict[str, dict]:
+    '''Updates the baselines with the results of some stages
+    Args:
+        results: (dict) results of run_benchmarks
+        baselines: (dict) current baselines
+        stages: (list[str]) stages to be re-baselined, stages without a baseline are always added
+    Returns:
+        dictionary with the updated baselines'''
+    updated = {scenario: dict(values) for scenario, values in baselines.items()}
+    for scenario, values in results.items():
+        current = updated.setdefault(scenario, {})
+        for stage, result in values.items():
+            if stage in stages or stage not in current:
+                current[stage] = result
+    return updated
+
+def print_results(results: dict[str, dict], baselines: dict[str, dict]) -> None:
+    for scenario, stages in results.items():
+        print(scenario)
+        for stage, result in stages.items():
+            baseline = baselines.get(scenario, {}).get(stage, {})
+            print(f'    {stage:<24}{result["seconds"]:>9.4f}s ({baseline.get("seconds", "-")})'
+                  f'{result["peak_mb"]:>10.3f}MB ({baseline.get("peak_mb", "-")})')
+
+if __name__ == '__main__':
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as f:
+            baselines = json.load(f)
+    results = run_benchmarks()
+    print_results(results, baselines)
+    if 'save' in sys.argv:
+        stages = sys.argv[sys.argv.index('save') + 1:]
+        with open(BASELINES_PATH, 'w') as f:
+            json.dump(update_baselines(results, baselines, stages), f, indent=4)
+        print(f'baselines saved to {BASELINES_PATH}')
+        sys.exit(0)
+    regressions = compare_baselines(results, baselines)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    sys.exit(1 if regressions else 0)
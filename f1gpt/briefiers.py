@@ -1,14 +1,58 @@
 import datetime
 
+import numpy
 import pandas
 
 from f1gpt.connectors import F1Session
+from f1gpt.indexes import LapIndex
+from f1gpt.metrics import timed
+from f1gpt.sectors import MINI_SECTORS
+from f1gpt.serializers import serialize_lines, serialize_table
+from f1gpt.tracks import compare_lines
+
+# abbreviated keys of the results columns sent to the race prompt, in presentation order
+RESULTS_COLUMNS = {'Position': 'pos',
+                   'Name': 'name',
+                   'TeamName': 'team',
+                   'GridPosition': 'grid',
+                   'Time': 'time_s',
+                   'Status': 'status',
+                   'Points': 'pts'}
+
+# abbreviated keys of the race pace columns sent to the race prompt (see RacePace.table)
+PACE_COLUMNS = {'Driver': 'drv',
+                'Pace': 'pace_s',
+                'Consistency': 'std_s',
+                'Stints': 'stints_laps_deg_s_per_lap',
+                'top_speed': 'top_kmh',
+                'top_speed_trend': 'top_kmh_per_lap'}
+
+def compare(p1_value: float, p2_value: float) -> list[float]:
+    '''Compares a metric of two drivers
+    Args:
+        p1_value: (float) metric of the first driver
+        p2_value: (float) metric of the second driver
+    Returns:
+        list with both values, the absolute difference and the difference in % of the first value'''
+    difference = abs(p1_value - p2_value)
+    difference_percent = round(difference / p1_value * 100, 2) if p1_value else 0
+    return [p1_value, p2_value, difference, difference_percent]
+
+def format_lap_time(lap_time: datetime.timedelta) -> str:
+    '''Formats a lap time for presentation
+    Args:
+        lap_time: (datetime.timedelta) lap time
+    Returns:
+        lap time as a string in "MM:SS.fff" format'''
+    total_milliseconds = int(round(pandas.Timedelta(lap_time).total_seconds() * 1000))
+    minutes, milliseconds = divmod(total_milliseconds, 60000)
+    return f'{minutes:02d}:{milliseconds / 1000:06.3f}'
 
 class SessionBriefer:
     '''Class to create a briefing of a session
     Attributes:
         session: F1Session object (see f1gpt.connectors)
-        drivers: DriversAttribute object (see f1gpt.connectors)
+        drivers: DriversAttribute object (see f1gpt.rosters)
         location: location of the event
         name: name of the session
         telemetries: list of pandas.DataFrame with the telemetry data of the two drivers
@@ -19,6 +63,9 @@ class SessionBriefer:
         create_session_brief: creates a briefing of a session (pratice or qualify)
         create_race_brief: creates a briefing of a race
         create_range_briefing: create briefing for a specific range of the lap
+        analyse_ranges: calculate metrics of many ranges of the lap for many drivers
+        decisive_corner: find the corner with the largest time difference between the two drivers
+        create_sectors_brief: creates a briefing of the mini-sectors won by every driver
         '''
     def __init__(self, session: F1Session) -> None:
         '''Creates a SessionBriefer object
@@ -26,20 +73,30 @@ class SessionBriefer:
             session: (F1Session) object with the session data
         Returns:
             None'''
+        self.session = session
         self.drivers = session.drivers
         self.location = session.event.Location
         self.name = session.session.name
-        self.telemetries = session.get_data()
-        self.cars = session.top_2
+        self.cars = session.get_cars()
         self.fastest_lap = session.fastest_lap
-        self.results = session.session.results
+        self.results = session.results
+        self._telemetries = None
+
+    @property
+    def telemetries(self) -> list[pandas.DataFrame]:
+        # telemetry is only loaded by the skills that use it (not by race brief)
+        if self._telemetries is None:
+            self._telemetries = self.session.get_data(self.cars)
+        return self._telemetries
+
+    @property
+    def indexes(self) -> list[LapIndex]:
+        return [self.session.get_index(car) for car in self.cars]
 
     def calculate_gap_number(self) -> datetime.timedelta:
-        time_format = '%M:%S.%f'
-        p1_time = datetime.datetime.strptime(self.fastest_lap['Fastest Lap'][0], time_format)
-        p2_time = datetime.datetime.strptime(self.fastest_lap['Fastest Lap'][1], time_format)
-        return p2_time - p1_time
+        return self.fastest_lap['Gap'].iloc[1]
 
+    @timed('briefer.create_session_brief')
     def create_session_brief(self) -> dict[str]:
         '''Creates a briefing of a session (pratice or qualify)
         args:   
@@ -64,12 +121,12 @@ class SessionBriefer:
         gap = self.calculate_gap_number()
         p1_number = self.fastest_lap.index[0]
         p1_name = self.drivers[p1_number]["name"]
-        p1_time = self.fastest_lap['Fastest Lap'][0][:9]
+        p1_time = format_lap_time(self.fastest_lap['Fastest Lap'].iloc[0])
         p2_number = self.fastest_lap.index[1]
         p2_name = self.drivers[p2_number]["name"]
-        p2_time = self.fastest_lap['Fastest Lap'][1][:9]
+        p2_time = format_lap_time(self.fastest_lap['Fastest Lap'].iloc[1])
         
-        others = ', '.join(self.drivers[i]["name"] for i in self.fastest_lap.index[2:10])
+        others = ', '.join(self.drivers.map(self.fastest_lap.index[2:10], 'name'))
         
         p1_top_speed = self.telemetries[0]["Speed"].max()
         p1_avg_speed = round(self.telemetries[0]["Speed"].mean(), 2)
@@ -92,114 +149,178 @@ class SessionBriefer:
                         'others': others}
         return info_dict
     
-    def create_race_brief(self) -> dict[str]:
+    @timed('briefer.create_race_brief')
+    def create_race_brief(self, car_data: bool | None = None) -> dict[str]:
         '''creates a briefing of a race
          args:
-            None
+            car_data: [optional] add the top speed of each driver from the car data (see F1Session.get_race_pace),
+                      by default only when the car data is already loaded
         Returns:
             info_dict: dictionary with the following keys:
                 name: name of the session
                 location: location of the session
-                results: results table
+                results: compact results table (see RESULTS_COLUMNS), lower positions are dropped to fit the token budget
                 fastest_lap_time: time of the fastest lap
                 fastest_lap_name: name of the driver with the fastest lap
+                pace: compact race pace table (see PACE_COLUMNS) of the top 10 drivers, without the
+                      top speed columns when there is no car data
                 '''
+        results = self.results.assign(Name=self.drivers.map(self.results['DriverNumber']))
+        pace = self.session.get_race_pace(car_data).table(list(self.results['DriverNumber']), top=10)
+        pace = pace.drop(columns=[column for column in ['top_speed', 'top_speed_trend'] if pace[column].isna().all()])
         
         fastest_lap_number = self.fastest_lap.index[0]
         fastest_lap_name = self.drivers[fastest_lap_number]["name"]
-        fastest_lap_time = self.fastest_lap['Fastest Lap'][0][:9]
+        fastest_lap_time = format_lap_time(self.fastest_lap['Fastest Lap'].iloc[0])
 
         info_dict = {   'name': self.name,
                         'location': self.location,
-                        'results': self.results,
+                        'results': serialize_table('race.results', results, RESULTS_COLUMNS,
+                                                   precision={'Position': 0, 'GridPosition': 0, 'Points': 0}),
                         'fastest_lap_time': fastest_lap_time,
-                        'fastest_lap_name':fastest_lap_name}
+                        'fastest_lap_name':fastest_lap_name,
+                        'pace': serialize_table('race.pace', pace, PACE_COLUMNS,
+                                                precision={'top_speed': 1, 'top_speed_trend': 2})}
         return info_dict 
 
+    @timed('briefer.create_sectors_brief')
+    def create_sectors_brief(self, sectors: int = MINI_SECTORS) -> dict[str]:
+        '''Creates a briefing of the mini-sectors of the fastest lap of every driver
+        args:
+            sectors: [optional] number of mini-sectors
+        Returns:
+            info_dict: dictionary with the following keys:
+                name: name of the session
+                location: location of the session
+                sectors: number of mini-sectors
+                p1_name: name of the driver with the fastest lap
+                p1_time: time of the fastest lap
+                theoretical_best: sum of the best time of each mini-sector
+                gain: difference between the mini-sectors of the fastest lap and the theoretical best in seconds
+                      (the Loss of the fastest driver, see MiniSectors.dominance)
+                dominance: mini-sectors won and time lost to the theoretical best of the top 5 drivers
+                leaders: fastest driver along the lap (distance ranges in meters)
+                '''
+        mini_sectors = self.session.get_mini_sectors(sectors)
+        p1_number = self.fastest_lap.index[0]
+        p1_time = self.fastest_lap['Fastest Lap'].iloc[0]
+        leaders = ', '.join(f'{start:.0f}-{end:.0f}m {self.drivers[car]["abv"]}'
+                            for start, end, car in mini_sectors.leaders())
+
+        info_dict = {   'name': self.name,
+                        'location': self.location,
+                        'sectors': sectors,
+                        'p1_name': self.drivers[p1_number]["name"],
+                        'p1_time': format_lap_time(p1_time),
+                        'theoretical_best': format_lap_time(pandas.Timedelta(seconds=mini_sectors.theoretical_best)),
+                        'gain': round(float(mini_sectors.times[mini_sectors.cars.index(p1_number)].sum()) -
+                                      mini_sectors.theoretical_best, 3),
+                        'dominance': serialize_lines('sectors.dominance',
+                                                     mini_sectors.summary(self.drivers, top=5).split('\n')),
+                        'leaders': leaders}
+        return info_dict
+
+    @timed('briefer.create_range_briefing')
     def create_range_briefing(self, 
                        chart_range: list[int], 
-                       turn_name,) -> str:
+                       turn_name: str | None = None) -> str:
         '''Create briefing for a specific range of the lap
         args:
             chart_range: list with the start and end distance of the range
-            turn_name: name of the turn
+            turn_name: [optional] name of the turn, by default the corner of the range in the track map
+                       (the track map is only loaded in this case)
         Returns:
             briefing: string with the briefing
             '''
-        # filter telemetry data to requested range
-        p1_telemetry = self.telemetries[0][self.telemetries[0]['Distance'].between(chart_range[0],chart_range[1])]
-        p2_telemetry = self.telemetries[1][self.telemetries[1]['Distance'].between(chart_range[0],chart_range[1])]
+        if turn_name is None:
+            turn_name = self.session.get_track().corner_at(chart_range[0], chart_range[1]) or 'corner'
+        # query the lap indexes of both drivers for the requested range
+        p1_info = self.indexes[0].range_info(chart_range[0], chart_range[1])
+        p2_info = self.indexes[1].range_info(chart_range[0], chart_range[1])
         # get drivers names
         p1_name = self.drivers[self.cars[0]]["name"]
         p2_name = self.drivers[self.cars[1]]["name"]
-        # create pandas DataFrame with range info
-        infos_df = pandas.DataFrame(columns=[p1_name, p2_name, 'difference','difference %'])
-        # start calculating infos
-        # calculate top speed
-        p1_top_speed = round(p1_telemetry['Speed'].max(), 2)
-        p2_top_speed = round(p2_telemetry['Speed'].max(), 2)
-        difference = abs(p1_top_speed - p2_top_speed)
-        difference_percent = round(difference / p1_top_speed * 100, 2)
-        infos_df.loc['top_speed km/h'] = [p1_top_speed, p2_top_speed, difference, difference_percent]
-        # calculate average speed
-        p1_avg_speed = round(p1_telemetry['Speed'].mean(), 2)
-        p2_avg_speed = round(p2_telemetry['Speed'].mean(), 2)
-        difference = abs(p1_avg_speed - p2_avg_speed)
-        difference_percent = round(difference / p1_avg_speed * 100, 2)
-        infos_df.loc['avg_speed km/h'] = [p1_avg_speed, p2_avg_speed, difference, difference_percent]
-        # calculate lowest speed
-        p1_lowest_speed = round(p1_telemetry['Speed'].min(), 2)
-        p2_lowest_speed = round(p2_telemetry['Speed'].min(), 2)
-        difference = abs(p1_lowest_speed - p2_lowest_speed)
-        difference_percent = round(difference / p1_lowest_speed * 100, 2)
-        infos_df.loc['lowest_speed km/h'] = [p1_lowest_speed, p2_lowest_speed, difference, difference_percent]
-        # calculate speed difference
-        p1_speed_difference = round(p1_top_speed - p1_lowest_speed, 2)
-        p2_speed_difference = round(p2_top_speed - p2_lowest_speed, 2)
-        difference = abs(p1_speed_difference - p2_speed_difference)
-        difference_percent = round(difference / p1_speed_difference * 100, 2)
-        infos_df.loc['speed_difference km/h'] = [p1_speed_difference, p2_speed_difference, difference, difference_percent]
-        # calculate time
-        p1_time = (p1_telemetry['Time'].values[-1] - p1_telemetry['Time'].values[0]).astype(datetime.timedelta) / 1000000000
-        p2_time = (p2_telemetry['Time'].values[-1] - p2_telemetry['Time'].values[0]).astype(datetime.timedelta) / 1000000000
-        difference = abs(p1_time - p2_time)
-        difference_percent = round(difference / p1_time * 100, 2)
-        infos_df.loc['time s'] = [p1_time, p2_time, difference, difference_percent]
-        # calculate brake start
-        p1_brake_start = p1_telemetry[p1_telemetry['Brake'] == True]['Distance'].values[0]
-        p2_brake_start = p2_telemetry[p2_telemetry['Brake'] == True]['Distance'].values[0]
-        difference = abs(p1_brake_start - p2_brake_start)
-        difference_percent = round(difference / p1_brake_start * 100, 2)
-        infos_df.loc['brake_start m'] = [p1_brake_start, p2_brake_start, difference, difference_percent]
-        # calculate brake release
-        p1_brake_release = p1_telemetry[(p1_telemetry['Distance'] > p1_brake_start) & (p1_telemetry['Brake'] == False)]['Distance'].values[0]
-        p2_brake_release = p2_telemetry[(p2_telemetry['Distance'] > p2_brake_start) & (p2_telemetry['Brake'] == False)]['Distance'].values[0]
-        difference = abs(p1_brake_release - p2_brake_release)
-        difference_percent = round(difference / p1_brake_release * 100, 2)
-        infos_df.loc['brake_release m'] = [p1_brake_release, p2_brake_release, difference, difference_percent]
-        # calculate brake distance
-        p1_brake_distance = p1_brake_release - p1_brake_start
-        p2_brake_distance = p2_brake_release - p2_brake_start
-        difference = abs(p1_brake_distance - p2_brake_distance)
-        difference_percent = round(difference / p1_brake_distance * 100, 2)
-        infos_df.loc['brake_distance m'] = [p1_brake_distance, p2_brake_distance, difference, difference_percent]
-        # identify brake-throttle overlap
-        p1_overlap = p1_telemetry[(p1_telemetry['Throttle'] > 20) & (p1_telemetry['Brake'] == True)]
-        p2_overlap = p2_telemetry[(p2_telemetry['Throttle'] > 20) & (p2_telemetry['Brake'] == True)]
-        if len(p1_overlap) > 0: 
-            p1_overlap_distance = p1_overlap['Distance'].values[-1] - p1_overlap['Distance'].values[0]
-        else: 
-            p1_overlap_distance = 0
-        if len(p2_overlap) > 0: 
-            p2_overlap_distance = p2_overlap['Distance'].values[-1] - p2_overlap['Distance'].values[0]
-        else:   
-            p2_overlap_distance = 0
-        difference = abs(p1_overlap_distance - p2_overlap_distance)
-        if p1_overlap_distance: 
-            difference_percent = round(difference / p1_overlap_distance * 100, 2)
-        else: 
-            difference_percent = 0
-        infos_df.loc['brake_throttle_overlap m'] = [p1_overlap_distance, p2_overlap_distance, difference, difference_percent]
-        #print(infos_df)
-
-        return f'Curve is {turn_name}, session is {self.name} in {self.location} and partial lap comparison info is: {infos_df}'
\ No newline at end of file
+        p1_abv = self.drivers[self.cars[0]]["abv"]
+        p2_abv = self.drivers[self.cars[1]]["abv"]
+        # range info rows in order of importance, the last ones are dropped to fit the token budget
+        p1_speed_drop = p1_info['top_speed'] - p1_info['lowest_speed']
+        p2_speed_drop = p2_info['top_speed'] - p2_info['lowest_speed']
+        rows = {'time_s': compare(p1_info['time'], p2_info['time']),
+                'lowest_speed_kmh': compare(p1_info['lowest_speed'], p2_info['lowest_speed']),
+                'top_speed_kmh': compare(p1_info['top_speed'], p2_info['top_speed']),
+                'avg_speed_kmh': compare(p1_info['avg_speed'], p2_info['avg_speed']),
+                'brake_start_m': compare(p1_info['brake_start'], p2_info['brake_start']),
+                'brake_distance_m': compare(p1_info['brake_release'] - p1_info['brake_start'],
+                                            p2_info['brake_release'] - p2_info['brake_start']),
+                'speed_drop_kmh': compare(p1_speed_drop, p2_speed_drop),
+                'brake_release_m': compare(p1_info['brake_release'], p2_info['brake_release']),
+                'brake_throttle_overlap_m': compare(p1_info['overlap_distance'], p2_info['overlap_distance'])}
+        infos_df = pandas.DataFrame.from_dict(rows, orient='index', columns=['p1', 'p2', 'difference', 'difference %'])
+        # the prompt does not use percentages
+        table = serialize_table('range.comparison', infos_df.rename_axis('metric').reset_index(),
+                                {'metric': 'metric', 'p1': p1_abv, 'p2': p2_abv, 'difference': 'diff'}, precision=2)
+
+        # racing lines, nearest point of each position of P2 on the line of P1
+        lines = compare_lines(self.telemetries[0], self.telemetries[1], chart_range[0], chart_range[1])
+        lines_text = (f'The line of {p2_abv} is on average {lines["mean_offset"]:.1f}m (at most {lines["max_offset"]:.1f}m) '
+                      f'from the line of {p1_abv}, {lines["inside_offset"]:+.1f}m towards the inside of the corner.')
+
+        return (f'Curve is {turn_name}, session is {self.name} in {self.location}, {p1_abv} is {p1_name} and {p2_abv} is {p2_name}. '
+                f'Partial lap comparison info (diff is the absolute difference) is:\n{table}\n{lines_text}')
+
+    @timed('briefer.analyse_ranges')
+    def analyse_ranges(self,
+                       ranges: list[tuple[str, float, float]],
+                       cars: list[str] | None = None) -> pandas.DataFrame:
+        '''Calculate metrics of many ranges of the lap (e.g. every corner) for many drivers,
+        each driver is processed in a single vectorized pass over all ranges
+        args:
+            ranges: list of (turn_name, start, end) tuples, start and end distances in meters
+            cars: [optional] list of drivers numbers, by default the two selected drivers
+        Returns:
+            pandas.DataFrame indexed by (Turn, DriverNumber) with the following columns:
+                Driver: driver abbreviation
+                Start, End: distance range in meters
+                top_speed, avg_speed, lowest_speed: speeds in km/h
+                time: time to complete the range in seconds
+                brake_start, brake_release, brake_distance: brake points and distance in meters
+                brake_throttle_overlap: brake-throttle overlap distance in meters
+                '''
+        if cars is None:
+            cars = self.cars
+        turns = [turn for turn, _, _ in ranges]
+        starts = numpy.array([start for _, start, _ in ranges], dtype=float)
+        ends = numpy.array([end for _, _, end in ranges], dtype=float)
+
+        frames = []
+        for car in cars:
+            info = self.session.get_index(car).ranges_info(starts, ends)
+            frames.append(pandas.DataFrame({
+                'Turn': turns,
+                'DriverNumber': car,
+                'Driver': self.fastest_lap.loc[car, 'Driver'],
+                'Start': starts,
+                'End': ends,
+                'top_speed': info['top_speed'],
+                'avg_speed': info['avg_speed'],
+                'lowest_speed': info['lowest_speed'],
+                'time': info['time'],
+                'brake_start': info['brake_start'],
+                'brake_release': info['brake_release'],
+                'brake_distance': info['brake_release'] - info['brake_start'],
+                'brake_throttle_overlap': info['overlap_distance']}))
+        return pandas.concat(frames).set_index(['Turn', 'DriverNumber'])
+
+    @timed('briefer.decisive_corner')
+    def decisive_corner(self) -> tuple[str, float, float]:
+        '''Finds the corner of the track map where the two selected drivers differ the most
+        Returns:
+            (turn_name, start, end) tuple of the corner with the largest time difference, distances in meters
+            '''
+        corners = self.session.get_track().corners
+        if not corners:
+            raise ValueError(f'No corners detected in the track map of {self.location}')
+        times = self.analyse_ranges(corners)['time'].unstack('DriverNumber')
+        difference = (times[self.cars[0]] - times[self.cars[1]]).abs()
+        turn = difference.idxmax() if difference.notna().any() else corners[0][0]
+        return next(corner for corner in corners if corner[0] == turn)
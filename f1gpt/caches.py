@@ -0,0 +1,210 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from f1gpt.metrics import count_tokens, recorder, span
+
+if TYPE_CHECKING:
+    from langchain.schema import BaseMessage
+
+class ResponseCache:
+    '''Class to cache model responses on local disk, addressed by a hash of the
+    rendered messages and the model parameters. It is thread safe, and files removed by
+    another process are treated as misses
+    Attributes:
+        path: directory of the cache
+        ttl: time to live of an entry in seconds
+        max_size: maximum size of the cache in bytes, oldest used entries are evicted first
+        hits: number of cache hits
+        misses: number of cache misses
+    Methods:
+        key: calculate the key of a prompt
+        get: get the cached entry of a key
+        put: store an entry
+        evict: remove expired entries and oldest entries above max_size
+        '''
+    def __init__(self,
+                 path: str = 'cache',
+                 ttl: float = 7 * 24 * 3600,
+                 max_size: int = 50 * 1024 * 1024) -> None:
+        '''Creates a ResponseCache object
+        Args:
+            path: (str) [optional] directory of the cache, created if it does not exist
+            ttl: (float) [optional] time to live of an entry in seconds
+            max_size: (int) [optional] maximum size of the cache in bytes
+        Returns:
+            None'''
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def key(messages: list['BaseMessage'], deployment: str | None, temperature: float | None) -> str:
+        '''Calculates the key of a prompt
+        Args:
+            messages: (list[BaseMessage]) rendered messages
+            deployment: (str) model deployment name
+            temperature: (float) model temperature
+        Returns:
+            sha256 hex digest of the messages and model parameters'''
+        content = json.dumps({'messages': [[message.type, message.content] for message in messages],
+                              'deployment': deployment,
+                              'temperature': temperature},
+                             sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self.path, f'{key}.json')
+
+    def get(self, key: str) -> dict | None:
+        '''Gets the cached entry of a key
+        Args:
+            key: (str) key of the prompt (see key)
+        Returns:
+            dictionary with "created", "messages" and "content" keys or None on a miss'''
+        file_path = self._file_path(key)
+        with self._lock:
+            try:
+                with open(file_path, encoding='utf-8') as f:
+                    entry = json.load(f)
+                if time.time() - entry['created'] <= self.ttl:
+                    # touch the file so eviction removes least recently used entries first
+                    os.utime(file_path)
+                    self.hits += 1
+                    return entry
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            self.misses += 1
+            return None
+
+    def put(self, key: str, messages: list['BaseMessage'], content: str) -> None:
+        '''Stores an entry, with the rendered messages and the response content
+        Args:
+            key: (str) key of the prompt (see key)
+            messages: (list[BaseMessage]) rendered messages
+            content: (str) response content
+        Returns:
+            None'''
+        entry = {'created': time.time(),
+                 'messages': [[message.type, message.content] for message in messages],
+                 'content': content}
+        with self._lock:
+            temp_path = self._file_path(key) + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, self._file_path(key))
+            self.evict()
+
+    def evict(self) -> None:
+        with self._lock:
+            entries = []
+            for file_name in os.listdir(self.path):
+                if not file_name.endswith('.json'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.path, file_name))
+                    if time.time() - stat.st_mtime > self.ttl:
+                        os.remove(os.path.join(self.path, file_name))
+                    else:
+                        entries.append((stat.st_mtime, stat.st_size, file_name))
+                except FileNotFoundError:
+                    # already removed (e.g. by another process)
+                    continue
+            size = sum(entry[1] for entry in entries)
+            for _, file_size, file_name in sorted(entries):
+                if size <= self.max_size:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.path, file_name))
+                size -= file_size
+
+class CachedModel:
+    '''Class to wrap a chat model, answering from a ResponseCache when the same
+    messages were already sent with the same model parameters
+    Attributes:
+        model: wrapped chat model (e.g. AzureChatOpenAI or StubModel from f1gpt.prompts)
+        cache: ResponseCache object
+        bypass: if True always call the model (to get a new variant) and replace the cached entry
+    Methods:
+        predict_messages: get the response of a prompt
+        apredict_messages: async version of predict_messages
+        '''
+    def __init__(self, model, cache: ResponseCache, bypass: bool = False) -> None:
+        self.model = model
+        self.cache = cache
+        self.bypass = bypass
+
+    @property
+    def deployment_name(self) -> str | None:
+        return getattr(self.model, 'deployment_name', None)
+
+    @property
+    def temperature(self) -> float | None:
+        return getattr(self.model, 'temperature', None)
+
+    def _key(self, messages: list['BaseMessage']) -> str:
+        return self.cache.key(messages, self.deployment_name, self.temperature)
+
+    def _cached(self, key: str, bypass: bool | None) -> 'BaseMessage | None':
+        if self.bypass if bypass is None else bypass:
+            return None
+        entry = self.cache.get(key)
+        recorder.count('cache_hits' if entry else 'cache_misses')
+        if entry:
+            from langchain.schema import AIMessage
+            return AIMessage(content=entry['content'])
+        return None
+
+    def _record(self, attributes: dict, messages: list['BaseMessage'], response: 'BaseMessage', cached: bool) -> None:
+        attributes['cached'] = cached
+        attributes['prompt_tokens'] = sum(count_tokens(message.content) for message in messages)
+        attributes['response_tokens'] = count_tokens(response.content)
+        if not cached:
+            # only calls to the model are billed
+            recorder.count('prompt_tokens', attributes['prompt_tokens'])
+            recorder.count('response_tokens', attributes['response_tokens'])
+
+    def predict_messages(self, messages: list['BaseMessage'], bypass: bool | None = None) -> 'BaseMessage':
+        '''Gets the response of a prompt, from the cache when possible
+        Args:
+            messages: (list[BaseMessage]) rendered messages
+            bypass: (bool) [optional] overrides the bypass attribute for this call
+        Returns:
+            response message'''
+        with span('model.predict_messages') as attributes:
+            key = self._key(messages)
+            response = self._cached(key, bypass)
+            if response is None:
+                response = self.model.predict_messages(messages)
+                self.cache.put(key, messages, response.content)
+                self._record(attributes, messages, response, cached=False)
+            else:
+                self._record(attributes, messages, response, cached=True)
+        return response
+
+    async def apredict_messages(self, messages: list['BaseMessage'], bypass: bool | None = None) -> 'BaseMessage':
+        '''Async version of predict_messages'''
+        with span('model.predict_messages') as attributes:
+            key = self._key(messages)
+            response = self._cached(key, bypass)
+            if response is None:
+                if hasattr(self.model, 'apredict_messages'):
+                    response = await self.model.apredict_messages(messages)
+                else:
+                    # synchronous models run in a thread to not block the event loop
+                    response = await asyncio.to_thread(self.model.predict_messages, messages)
+                self.cache.put(key, messages, response.content)
+                self._record(attributes, messages, response, cached=False)
+            else:
+                self._record(attributes, messages, response, cached=True)
+        return response
@@ -1,16 +1,14 @@
 import os
 
-from langchain.chat_models import AzureChatOpenAI
-
 API_BASE = "https://eastus.api.cognitive.microsoft.com/"
 API_DEPLOYMENT = "gpt-testopenai-dev-eastus-001"
 API_KEY = os.getenv("OPENAI_API_KEY")
 API_TYPE = "azure"
 API_VERSION = "2023-03-15-preview"
 
-model = AzureChatOpenAI(openai_api_base=API_BASE,
-                        deployment_name=API_DEPLOYMENT,
-                        openai_api_key=API_KEY,
-                        openai_api_type=API_TYPE,
-                        openai_api_version=API_VERSION,
-                        temperature=0.95,)
\ No newline at end of file
+# model is created on first access (see f1gpt.prompts.get_model)
+def __getattr__(name: str):
+    if name == 'model':
+        from f1gpt.prompts import get_model
+        return get_model()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,160 @@
+import numpy
+import pandas
+
+# Compact representation of the telemetries attribute (check schema.md file). Channels are
+# narrowed to the smallest dtype that holds their range, strings become categories and
+# Date is dropped (it is the session start date + SessionTime), about 1/5 of the memory.
+
+COMPACT_DTYPES = {'RPM': 'int16',
+                  'Speed': 'int16',
+                  'nGear': 'int8',
+                  'Throttle': 'uint8',
+                  'Brake': 'bool',
+                  'DRS': 'uint8',
+                  'X': 'int32',
+                  'Y': 'int32',
+                  'Z': 'int32',
+                  'Distance': 'float32'}
+CATEGORICAL_COLUMNS = ['Source', 'Status']
+DROPPED_COLUMNS = ['Date']
+
+def narrow(values: pandas.Series, dtype: str) -> pandas.Series:
+    '''Converts a channel to a smaller dtype, when its values fit in it
+    Args:
+        values: (pandas.Series) values of the channel
+        dtype: (str) numpy dtype (e.g. "int16")
+    Returns:
+        pandas.Series with the new dtype, or with the original dtype if values do not fit
+        (integer channels with missing values become float32)'''
+    dtype = numpy.dtype(dtype)
+    if values.dtype == dtype:
+        return values
+    if dtype.kind == 'b':
+        return values.fillna(False).astype(dtype)
+    if dtype.kind == 'f':
+        return values.astype(dtype)
+    if values.isna().any():
+        return values.astype('float32')
+    limits = numpy.iinfo(dtype)
+    if len(values) and (values.min() < limits.min or values.max() > limits.max):
+        return values
+    return values.round().astype(dtype) if values.dtype.kind == 'f' else values.astype(dtype)
+
+def is_compact(telemetry: pandas.DataFrame) -> bool:
+    '''Checks if a telemetry is already in the compact representation (see compact_telemetry)'''
+    return (not any(column in telemetry.columns for column in DROPPED_COLUMNS) and
+            all(telemetry[column].dtype == dtype for column, dtype in COMPACT_DTYPES.items()
+                if column in telemetry.columns) and
+            all(telemetry[column].dtype != object for column in CATEGORICAL_COLUMNS
+                if column in telemetry.columns))
+
+def compact_telemetry(telemetry: pandas.DataFrame,
+                      drop: list[str] = DROPPED_COLUMNS,
+                      categorical: bool = True) -> pandas.DataFrame:
+    '''Converts a telemetry to the compact representation
+    Args:
+        telemetry: (pandas.DataFrame) telemetry of a lap (e.g. fastf1.core.Telemetry), it is not modified
+        drop: (list[str]) [optional] columns to be dropped
+        categorical: (bool) [optional] convert string columns to categories, if False they are dropped
+    Returns:
+        telemetry of the same type with compact dtypes (the same object if it is already compact)'''
+    drop = [column for column in telemetry.columns if column in drop or
+            (not categorical and column in CATEGORICAL_COLUMNS)]
+    if not drop and is_compact(telemetry):
+        return telemetry
+    compact = telemetry.drop(columns=drop)
+    for column in compact.columns:
+        if column in COMPACT_DTYPES:
+            compact[column] = narrow(compact[column], COMPACT_DTYPES[column])
+        elif column in CATEGORICAL_COLUMNS and compact[column].dtype == object:
+            compact[column] = compact[column].astype('category')
+    return compact
+
+class TelemetryArrays:
+    '''Class to hold the telemetry of many laps as a struct of arrays, one numpy array
+    per channel with the samples of every lap one after another
+    Attributes:
+        keys: list with the (driver, lap) key of each lap
+        offsets: numpy.ndarray with the first sample of each lap (and the total number of samples)
+        channels: dictionary with the numpy.ndarray of each channel
+        categories: dictionary with the categories of categorical channels (stored as codes)
+    Methods:
+        from_frames: create a TelemetryArrays object from telemetry frames
+        channel: get the values of a channel of a lap (a view, no copy)
+        frame: get the telemetry of a lap as a pandas.DataFrame
+        nbytes: memory used by the arrays
+        '''
+    def __init__(self,
+                 keys: list[tuple],
+                 offsets: numpy.ndarray,
+                 channels: dict[str, numpy.ndarray],
+                 categories: dict[str, pandas.Index] = {}) -> None:
+        self.keys = list(keys)
+        self.offsets = offsets
+        self.channels = channels
+        self.categories = dict(categories)
+        self._positions = {key: position for position, key in enumerate(self.keys)}
+
+    @classmethod
+    def from_frames(cls,
+                    frames: dict[tuple, pandas.DataFrame],
+                    compact: bool = True,
+                    columns: list[str] | None = None) -> 'TelemetryArrays':
+        '''Creates a TelemetryArrays object
+        Args:
+            frames: (dict[tuple, pandas.DataFrame]) telemetry of each lap by (driver, lap) key, with the same columns
+            compact: (bool) [optional] convert the frames to the compact representation first
+            columns: (list[str]) [optional] channels to be kept, by default every column
+        Returns:
+            TelemetryArrays object'''
+        keys = list(frames)
+        if compact:
+            frames = {key: compact_telemetry(frame) for key, frame in frames.items()}
+        lengths = [len(frames[key]) for key in keys]
+        offsets = numpy.concatenate([[0], numpy.cumsum(lengths)]).astype('int64')
+        channels = {}
+        categories = {}
+        if columns is None:
+            columns = frames[keys[0]].columns if keys else []
+        for column in columns:
+            values = [frames[key][column] for key in keys]
+            if isinstance(values[0].dtype, pandas.CategoricalDtype):
+                union = pandas.api.types.union_categoricals(values)
+                categories[column] = union.categories
+                channels[column] = union.codes
+            else:
+                channels[column] = numpy.concatenate([value.to_numpy() for value in values])
+        return cls(keys, offsets, channels, categories)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._positions
+
+    def _slice(self, key: tuple) -> slice:
+        position = self._positions[key]
+        return slice(self.offsets[position], self.offsets[position + 1])
+
+    def channel(self, key: tuple, name: str) -> numpy.ndarray:
+        '''Gets the values of a channel of a lap
+        Args:
+            key: (tuple) (driver, lap) key of the lap
+            name: (str) name of the channel (e.g. "Speed")
+        Returns:
+            numpy.ndarray view of the channel array (codes for categorical channels)'''
+        return self.channels[name][self._slice(key)]
+
+    def frame(self, key: tuple) -> pandas.DataFrame:
+        '''Gets the telemetry of a lap
+        Args:
+            key: (tuple) (driver, lap) key of the lap
+        Returns:
+            pandas.DataFrame with every channel of the lap'''
+        lap = self._slice(key)
+        return pandas.DataFrame({name: pandas.Categorical.from_codes(values[lap], self.categories[name])
+                                 if name in self.categories else values[lap]
+                                 for name, values in self.channels.items()})
+
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + sum(values.nbytes for values in self.channels.values())
@@ -1,47 +1,35 @@
-import datetime
+import functools
 
 import pandas
 import fastf1
 
+from f1gpt.aligners import TelemetryAligner
+from f1gpt.compactors import TelemetryArrays, compact_telemetry, is_compact
+from f1gpt.indexes import LapIndex
+from f1gpt.metrics import span, timed
+from f1gpt.pacers import RacePace, lap_pace
+from f1gpt.rosters import DriversAttribute, get_roster
+from f1gpt.sectors import MINI_SECTORS, MiniSectors
+from f1gpt.stores import TelemetryStore
+from f1gpt.tracks import TRACKS_PATH, TrackMap
+
 # For details of the schema of telemetries atribute from 
 # F1Sesseion class check schema.md file
 
-class DriversAttribute:
-    '''Class to store the drivers data
-    Attributes:
-        items: dictionary with the drivers data
-    Methods:
-        __getitem__: get the data of a driver by "number" key (str) or index
-        '''
-    def __init__(self, data: dict[str]) -> None:
-        '''Creates a DriversAttribute object
-        Args:
-            data: (dict[str]) dictionary with the drivers data
-        Returns:
-            None'''
-        self.items = data
-
-    def __getitem__(self, key: str) -> str:
-        if isinstance(key, str):
-            for item in self.items:
-                if item['number'] == key:
-                    return item
-        else:
-            raise TypeError('Key must be a string')
-
+# fallback roster of the 2023 season, sessions build their roster from the results (see f1gpt.rosters)
 drivers = DriversAttribute([
-                            {'number': '1', 'name': 'Max Versttapen', 'color': '#0700EE', 'abv': 'VER', 'team': 'Red Bull Racing'},
+                            {'number': '1', 'name': 'Max Verstappen', 'color': '#0700EE', 'abv': 'VER', 'team': 'Red Bull Racing'},
                             {'number': '2', 'name': 'Logan Sargeant', 'color': '#37BEDD', 'abv': 'SAR', 'team': 'Williams'},
-                            {'number': '3', 'name': 'Daniel Ricciardo', 'color': '#2C4563', 'abv': 'RIC', 'team': 'Alpha Tauri'},
+                            {'number': '3', 'name': 'Daniel Ricciardo', 'color': '#2C4563', 'abv': 'RIC', 'team': 'AlphaTauri'},
                             {'number': '4', 'name': 'Lando Norris', 'color': '#FF8700', 'abv': 'NOR', 'team': 'McLaren'},
                             {'number': '10', 'name': 'Pierre Gasly', 'color': '#0090FF', 'abv': 'GAS', 'team': 'Alpine'},
-                            {'number': '11', 'name': 'Sergio Peres', 'color': '#3671C6', 'abv': 'PER', 'team': 'Red Bull Racing'},
+                            {'number': '11', 'name': 'Sergio Perez', 'color': '#3671C6', 'abv': 'PER', 'team': 'Red Bull Racing'},
                             {'number': '14', 'name': 'Fernando Alonso', 'color': '#006E61', 'abv': 'ALO', 'team': 'Aston Martin'},
-                            {'number': '16', 'name': 'Charles Lecler', 'color': '#DC0000', 'abv': 'LEC', 'team': 'Ferrari'},
-                            {'number': '18', 'name': 'Lance Stroll', 'color': '#358C75', 'abv': 'STR', 'team': 'Astom Martin'},
+                            {'number': '16', 'name': 'Charles Leclerc', 'color': '#DC0000', 'abv': 'LEC', 'team': 'Ferrari'},
+                            {'number': '18', 'name': 'Lance Stroll', 'color': '#358C75', 'abv': 'STR', 'team': 'Aston Martin'},
                             {'number': '20', 'name': 'Kevin Magnussen', 'color': '#B6BABD', 'abv': 'MAG', 'team': 'Haas'},
-                            {'number': '21', 'name': 'Nyck De Vries', 'color': '#2C4563', 'abv': 'DEV', 'team': 'Alpha Tauri'},
-                            {'number': '22', 'name': 'Yuki Tsunoda', 'color': '#2C4563', 'abv': 'TSU', 'team': 'Alpha Tauri'},
+                            {'number': '21', 'name': 'Nyck de Vries', 'color': '#2C4563', 'abv': 'DEV', 'team': 'AlphaTauri'},
+                            {'number': '22', 'name': 'Yuki Tsunoda', 'color': '#2C4563', 'abv': 'TSU', 'team': 'AlphaTauri'},
                             {'number': '23', 'name': 'Alex Albon', 'color': '#015AFF', 'abv': 'ALB', 'team': 'Williams'},
                             {'number': '24', 'name': 'Guanyu Zhou', 'color': '#C92D4B', 'abv': 'ZHO', 'team': 'Alfa Romeo'},
                             {'number': '27', 'name': 'Nico Hulkenberg', 'color': '#FFFFFF', 'abv': 'HUL', 'team': 'Haas'},
@@ -50,9 +38,22 @@ drivers = DriversAttribute([
                             {'number': '44', 'name': 'Lewis Hamilton', 'color': '#01D2BD', 'abv': 'HAM', 'team': 'Mercedes'},
                             {'number': '55', 'name': 'Carlos Sainz', 'color': '#F91536', 'abv': 'SAI', 'team': 'Ferrari'},
                             {'number': '63', 'name': 'George Russell', 'color': '#6CD3BF', 'abv': 'RUS', 'team': 'Mercedes'},
-                            {'number': '77', 'name': 'Valteri Bottas', 'color': '#900000', 'abv': 'BOT', 'team': 'Alfa Romeo'},
+                            {'number': '77', 'name': 'Valtteri Bottas', 'color': '#900000', 'abv': 'BOT', 'team': 'Alfa Romeo'},
                             {'number': '81', 'name': 'Oscar Piastri', 'color': '#F58020', 'abv': 'PIA', 'team': 'McLaren'}])
 
+# order in which fastf1 data classes depend on each other, each one
+# requires the previous ones to be loaded
+DATA_CLASSES = ['results', 'laps', 'telemetry']
+
+@functools.lru_cache(maxsize=None)
+def get_event_schedule(year: int) -> fastf1.events.EventSchedule:
+    '''Gets the event schedule of a season, downloaded only once per year
+    Args:
+        year: (int) year of the season
+    Returns:
+        fastf1.events.EventSchedule object'''
+    return fastf1.get_event_schedule(year=year)
+
 class F1Event:
     '''Class to store the data of an event
     Attributes:
@@ -62,7 +63,7 @@ class F1Event:
     def __init__(self, event_name: str, year: int = 2023):
         self.event_name = event_name
         self.year = year
-        self.schedule = fastf1.get_event_schedule(year=self.year)
+        self.schedule = get_event_schedule(self.year)
         self.event = self.schedule.get_event_by_name(self.event_name)
 
 class F1Session(F1Event):
@@ -71,19 +72,39 @@ class F1Session(F1Event):
         event_name: name of the event (e.g. '"Silverstone")
         year: year of the event
         session_number: number of the session (e.g. 1 for FP1, 2 for FP2)
-        drivers: DriversAttribute object (see f1gpt.connectors)
+        drivers: DriversAttribute object (see f1gpt.rosters), by default built from the results
+        store: TelemetryStore object used to cache session data on disk (see f1gpt.stores)
+        lazy: if True each data class is only loaded on first access
+        compact: if True telemetries are kept (and stored) in the compact representation (see f1gpt.compactors)
+        results: pandas.DataFrame with the results of the session
+        laps: fastf1.core.Laps object with the laps of the session
+        car_data: dictionary of fastf1.core.Telemetry objects with the car data by driver number
+        pos_data: dictionary of fastf1.core.Telemetry objects with the position data by driver number
+        fastest_lap: pandas.DataFrame with the fastest lap of each driver
+        top_2: list with the numbers of the selected drivers
+        telemetries: list of fastf1.core.Telemetry objects with the fastest lap of the selected drivers
+        tracks_path: root directory of the cached track maps (see f1gpt.tracks)
         '''
+    tracks_path = TRACKS_PATH
+
     def __init__(self, 
                  event_name: str, 
                  session_number: int, 
-                 drivers: DriversAttribute,
-                 year: int = 2023):
+                 drivers: DriversAttribute | None = None,
+                 year: int = 2023,
+                 store: TelemetryStore | None = None,
+                 lazy: bool = False,
+                 compact: bool = True):
         '''Creates a F1Session object
         Args:
             event_name: (str) name of the event (e.g. '"Silverstone"), we use fuzzy logic from fastf1 librarey to find the event
             session_number: (int) number of the session (e.g. 1 for FP1, 2 for FP2, 3 for FP3, 4 for Q, 5 for R)
-            drivers: (DriversAttribute) object with the drivers data
+            drivers: (DriversAttribute) [optional] object with the drivers data, by default the roster
+                     of the event is built from the results (see f1gpt.rosters.get_roster)
             year: (int) [optional] year of the event
+            store: (TelemetryStore) [optional] local store, session is only loaded from fastf1 on a store miss
+            lazy: (bool) [optional] load results, laps and telemetry only when first accessed, weather and messages are never loaded
+            compact: (bool) [optional] keep telemetries with narrowed dtypes, without Date column
         Returns:
             None
         '''
@@ -91,44 +112,303 @@ class F1Session(F1Event):
         self.session_number = session_number
         self.drivers = drivers
         self.session = self.event.get_session(self.session_number)
-        self.session.load()
+        self._init_data(store, lazy, compact)
+        if not self.lazy:
+            self.results
+            self.laps
 
-    def fastests_lap(self):
-        self.fastest_lap = pandas.DataFrame(columns=['Driver', 'Fastest Lap'])
+    def _init_data(self, store: TelemetryStore | None, lazy: bool, compact: bool = True) -> None:
+        self.store = store
+        self.lazy = lazy
+        self.compact = compact
+        self.loaded = None
+        self._results = None
+        self._laps = None
+        # analysis context, computed once and shared by briefers and ploters
+        self.fastest_lap = None
+        self.top_2 = None
+        self.telemetries = None
+        self._telemetries = {}
+        self._indexes = {}
+        self._pace = None
+        self._pace_car_data = False
+        self._track = None
 
-        for driver in self.session.drivers:
-            try:
-                lap = self.session.laps.pick_driver(driver).pick_fastest()
-                laptime = (datetime.datetime(1970,1,1) + lap.LapTime).strftime("%M:%S.%f")
-                self.fastest_lap.loc[driver,'Fastest Lap'] = laptime
-                self.fastest_lap.loc[driver,'Driver'] = self.drivers[driver]['abv']
-            except:
-                self.fastest_lap.loc[driver,'Fastest Lap'] = None
+    @property
+    def drivers(self) -> DriversAttribute:
+        if self._drivers is None:
+            self._drivers = get_roster(self.year, self.event.EventName, self.results)
+        return self._drivers
+
+    @drivers.setter
+    def drivers(self, drivers: DriversAttribute | None) -> None:
+        self._drivers = drivers
+
+    @property
+    def store_key(self) -> tuple:
+        return (self.year, self.event.EventName, self.session.name)
 
+    def load(self, data: str = 'telemetry') -> None:
+        '''Loads session data from fastf1, if it was not loaded yet
+        Args:
+            data: (str) [optional] data class needed - "results", "laps" or "telemetry" (car and position data). 
+                  When not in lazy mode all data classes are loaded
+        Returns:
+            None'''
+        if not self.lazy:
+            data = 'telemetry'
+        if self.loaded and DATA_CLASSES.index(self.loaded) >= DATA_CLASSES.index(data):
+            return
+        with span('session.load', data=data):
+            self.session.load(laps=data != 'results',
+                              telemetry=data == 'telemetry',
+                              weather=not self.lazy,
+                              messages=not self.lazy)
+        self.loaded = data
+
+    @property
+    def results(self) -> pandas.DataFrame:
+        if self._results is None:
+            if self.store:
+                self._results = self.store.read_results(*self.store_key)
+            if self._results is None:
+                self.load('results')
+                self._results = self.session.results
+                if self.store:
+                    self.store.write_results(self._results, *self.store_key)
+        return self._results
+
+    @property
+    def laps(self) -> fastf1.core.Laps:
+        if self._laps is None:
+            if self.store:
+                laps = self.store.read_laps(*self.store_key)
+                if laps is not None:
+                    self._laps = fastf1.core.Laps(laps, session=self.session)
+            if self._laps is None:
+                self.load('laps')
+                self._laps = self.session.laps
+                if self.store:
+                    self.store.write_laps(self._laps, *self.store_key)
+        return self._laps
+
+    @property
+    def car_data(self) -> dict[str, fastf1.core.Telemetry]:
+        self.load('telemetry')
+        return self.session.car_data
+
+    @property
+    def pos_data(self) -> dict[str, fastf1.core.Telemetry]:
+        self.load('telemetry')
+        return self.session.pos_data
+
+    @timed('session.fastests_lap')
+    def fastests_lap(self):
+        '''Ranks the drivers by their fastest lap in a single pass over the session laps,
+        the same laps selected by fastf1 pick_fastest (personal best laps). 
+        Sets fastest_lap attribute, a pandas.DataFrame indexed by driver number with columns:
+            Driver: driver abbreviation
+            Fastest Lap: (timedelta) lap time, NaT if the driver has no valid lap
+            LapNumber: number of the fastest lap
+            Gap: (timedelta) gap to the fastest driver
+            '''
+        laps = self.laps
+        valid = laps[(laps['IsPersonalBest'] == True) & laps['LapTime'].notna()]
+        fastest = valid.loc[valid.groupby('DriverNumber')['LapTime'].idxmin()]
+        fastest = fastest.set_index('DriverNumber')
+        drivers = laps.groupby('DriverNumber', sort=False)['Driver'].first()
+
+        self.fastest_lap = pandas.DataFrame({'Driver': drivers,
+                                             'Fastest Lap': fastest['LapTime'],
+                                             'LapNumber': fastest['LapNumber']},
+                                            index=drivers.index)
+        self.fastest_lap['Gap'] = self.fastest_lap['Fastest Lap'] - self.fastest_lap['Fastest Lap'].min()
         self.fastest_lap.sort_values('Fastest Lap', inplace=True)
+        self.fastest_lap.index.name = None
 
     def get_top_2(self):
-        self.top_2 = self.fastest_lap.index[:2]
+        self.set_top_2(self.fastest_lap.index[:2])
 
     def set_top_2(self, top_2: list[str]):
+        top_2 = list(top_2)
+        # a new selection of cars invalidates the analysis context
+        if top_2 != self.top_2:
+            self.telemetries = None
         self.top_2 = top_2
 
+    def get_cars(self) -> list[str]:
+        '''Gets the selected cars, by default the two fastest drivers of the session
+        Returns:
+            top_2: list with the drivers numbers'''
+        if self.fastest_lap is None:
+            self.fastests_lap()
+        if self.top_2 is None:
+            self.get_top_2()
+        return self.top_2
+
+    def get_telemetry(self, car: str) -> fastf1.core.Telemetry:
+        '''Gets the telemetry of the fastest lap of a driver, computed only once per session
+        Args:
+            car: (str) driver number
+        Returns:
+            fastf1.core.Telemetry object, shared between consumers and must not be modified'''
+        if car in self._telemetries:
+            return self._telemetries[car]
+        if self.fastest_lap is None:
+            self.fastests_lap()
+        lap_number = self.fastest_lap.loc[car, 'LapNumber']
+        key = (*self.store_key, car, lap_number)
+        with span('session.get_telemetry', car=car) as attributes:
+            if self.store and self.store.has_telemetry(*key):
+                attributes['source'] = 'store'
+                telemetry = self.store.read_telemetry(*key)
+                telemetry = fastf1.core.Telemetry(telemetry, session=self.session, driver=car)
+                if self.compact and not is_compact(telemetry):
+                    # telemetries stored before compaction are rewritten once
+                    telemetry = compact_telemetry(telemetry)
+                    self.store.write_telemetry(telemetry, *key)
+            else:
+                attributes['source'] = 'fastf1'
+                self.load('telemetry')
+                lap = self.session.laps.pick_driver(car).pick_fastest()
+                car_data = lap.get_car_data()
+                pos = self.pos_data[car]
+                pos = pos.slice_by_lap(lap)
+                with span('session.merge_channels'):
+                    telemetry = pos.merge_channels(car_data)
+                with span('session.add_distance'):
+                    telemetry = telemetry.add_distance()
+                if self.compact:
+                    telemetry = compact_telemetry(telemetry)
+                if self.store:
+                    self.store.write_telemetry(telemetry, *key)
+        self._telemetries[car] = telemetry
+        return telemetry
+
+    @timed('session.get_race_pace')
+    def get_race_pace(self, car_data: bool | None = None) -> RacePace:
+        '''Gets the pace of every driver on every lap, computed only once per session
+        (and stored in the store), car data of each driver is sliced by all its laps at once
+        Args:
+            car_data: (bool) [optional] add the speed and throttle metrics of each lap from the car data,
+                      by default only when the car data is already loaded (laps only otherwise, so
+                      telemetry is never loaded just for the pace)
+        Returns:
+            RacePace object (see f1gpt.pacers)'''
+        if car_data is None:
+            car_data = self.loaded == 'telemetry'
+
+        def has_speed(pace: pandas.DataFrame) -> bool:
+            return bool(pace['top_speed'].notna().any())
+
+        if self._pace is None or (car_data and not self._pace_car_data):
+            pace = self.store.read_pace(*self.store_key) if self.store else None
+            # a pace stored from the laps only is rebuilt when the car data is requested
+            if pace is None or (car_data and not has_speed(pace)):
+                pace = lap_pace(self.laps, self.car_data if car_data else None)
+                if self.store:
+                    self.store.write_pace(pace, *self.store_key)
+            self._pace = RacePace(pace)
+            self._pace_car_data = car_data or has_speed(pace)
+        return self._pace
+
+    def get_track(self) -> TrackMap:
+        '''Gets the track map of the circuit, built from the fastest lap of the session
+        only when the circuit is not cached yet for the year of the session
+        Returns:
+            TrackMap object (see f1gpt.tracks)'''
+        if self._track is None:
+            from f1gpt.tracks import get_track
+
+            try:
+                self._track = get_track(self.event.Location, self.year, path=self.tracks_path)
+            except FileNotFoundError:
+                reference = self.get_telemetry(self.get_cars()[0])
+                self._track = get_track(self.event.Location, self.year, reference, path=self.tracks_path)
+        return self._track
+
+    def get_index(self, car: str) -> LapIndex:
+        '''Gets the distance index of the fastest lap of a driver, built only once per session
+        Args:
+            car: (str) driver number
+        Returns:
+            LapIndex object (see f1gpt.indexes)'''
+        if car not in self._indexes:
+            self._indexes[car] = LapIndex(self.get_telemetry(car))
+        return self._indexes[car]
+
+    def get_telemetry_arrays(self,
+                             cars: list[str] | None = None,
+                             channels: list[str] | None = None) -> TelemetryArrays:
+        '''Gets the telemetry of the fastest lap of many drivers as a struct of arrays,
+        to hold many laps in memory without a pandas.DataFrame per lap
+        Args:
+            cars: (list[str]) [optional] drivers numbers, by default every driver with a valid lap
+            channels: (list[str]) [optional] channels to be kept, by default every channel
+        Returns:
+            TelemetryArrays object (see f1gpt.compactors) with (driver, lap number) keys'''
+        if self.fastest_lap is None:
+            self.fastests_lap()
+        if cars is None:
+            cars = list(self.fastest_lap.dropna(subset=['Fastest Lap']).index)
+        return TelemetryArrays.from_frames({(car, int(self.fastest_lap.loc[car, 'LapNumber'])): self.get_telemetry(car)
+                                            for car in cars}, compact=not self.compact, columns=channels)
+
+    @timed('session.mini_sectors')
+    def get_mini_sectors(self, sectors: int = MINI_SECTORS, cars: list[str] | None = None) -> MiniSectors:
+        '''Splits the fastest lap of many drivers in mini-sectors, every driver at once
+        Args:
+            sectors: (int) [optional] number of mini-sectors
+            cars: (list[str]) [optional] drivers numbers, by default every driver with a valid lap
+        Returns:
+            MiniSectors object (see f1gpt.sectors)'''
+        return MiniSectors.from_arrays(self.get_telemetry_arrays(cars, channels=['Distance', 'Time']), sectors)
+
+    def memory_usage(self) -> int:
+        '''Estimates the memory held by the session data
+        Returns:
+            bytes of the laps, results, telemetries, (when loaded) fastf1 car and position data
+            and of the analysis built from them (distance indexes, race pace and track map)'''
+        frames = [self._laps, self._results, *self._telemetries.values()]
+        if self.loaded == 'telemetry':
+            frames += [*self.session.car_data.values(), *self.session.pos_data.values()]
+        analysis = [*self._indexes.values(), self._pace, self._track]
+        return (sum(int(frame.memory_usage(deep=True).sum()) for frame in frames if frame is not None) +
+                sum(item.memory_usage() for item in analysis if item is not None))
+
     def get_telemetries(self):
-        self.telemetries =[]
-        for car in self.top_2:
-            lap = self.session.laps.pick_driver(car).pick_fastest()
-            car_data = lap.get_car_data()
-            pos = self.session.pos_data[car]
-            pos = pos.slice_by_lap(lap)
-            telemetry = pos.merge_channels(car_data)
-            telemetry = telemetry.add_distance()
-            self.telemetries.append(telemetry)
+        self.telemetries = [self.get_telemetry(car) for car in self.top_2]
             
     def get_data(self, cars: list[str] | None = None) -> list[pandas.DataFrame]:
-        if cars:
+        '''Gets the telemetries of the selected cars, the analysis context is memoized
+        until the selection changes (see set_top_2)
+        Args:
+            cars: (list[str]) [optional] drivers numbers, by default the two fastest drivers
+        Returns:
+            telemetries: list of pandas.DataFrame shared by SessionBriefer and Ploter'''
+        if cars is not None:
             self.set_top_2(cars)
         else:
-            self.fastests_lap()
-            self.get_top_2()
-        self.get_telemetries()
+            self.get_cars()
+        if self.telemetries is None:
+            self.get_telemetries()
         return self.telemetries
+
+    @timed('session.align')
+    def align(self,
+              cars: list[str] | None = None,
+              step: float = 1.0,
+              channels: list[str] = ['Speed', 'Throttle', 'Brake', 'nGear']) -> TelemetryAligner:
+        '''Resamples the fastest lap telemetry of many drivers on a common distance grid
+        Args:
+            cars: (list[str]) [optional] drivers numbers, by default every driver with a valid lap (fastest first)
+            step: (float) [optional] distance between grid points in meters
+            channels: (list[str]) [optional] telemetry channels to be resampled
+        Returns:
+            TelemetryAligner object (see f1gpt.aligners)'''
+        if cars is None:
+            if self.fastest_lap is None:
+                self.fastests_lap()
+            cars = list(self.fastest_lap.dropna(subset=['Fastest Lap']).index)
+        telemetries = [self.get_telemetry(car) for car in cars]
+        return TelemetryAligner(telemetries, cars, step=step, channels=channels)
@@ -0,0 +1,105 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langchain.schema import BaseMessage
+
+# transient errors of the openai client (openai.error), matched by name so openai is not imported
+TRANSIENT_ERRORS = {'APIConnectionError', 'RateLimitError', 'ServiceUnavailableError', 'Timeout', 'TryAgain'}
+
+def is_transient(error: BaseException) -> bool:
+    '''Checks if a failed call is worth retrying: timeouts, connection errors, rate limits and
+    server errors (http status 429 or 5xx). Bad requests, authentication errors and errors of the
+    prompt itself (e.g. a KeyError of a template) are not
+    Args:
+        error: (BaseException) exception raised by the call
+    Returns:
+        True if the call can be retried'''
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__):
+        return True
+    status = getattr(error, 'http_status', None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+class PromptExecutor:
+    '''Class to run many skill prompts concurrently against a chat model.
+    Only transient failures are retried (see is_transient), other errors surface at once.
+    Synchronous models run in a pool of concurrency threads. A thread can't be stopped when its
+    call times out: it keeps its place in the pool until the call returns, so the retry waits for
+    a free thread and no more than concurrency calls ever run, but the timed out call may still
+    be billed by the API together with its retry
+    Attributes:
+        model: chat model with predict_messages (and optionally apredict_messages) method
+        concurrency: maximum number of calls running at the same time
+        retries: number of retries of a call that failed with a transient error or timed out
+        backoff: base delay in seconds between retries, doubled on every retry
+        timeout: maximum time in seconds of a single call
+    Methods:
+        run: run a dictionary of prompts concurrently (coroutine)
+        run_all: run a dictionary of prompts concurrently from synchronous code
+        '''
+    def __init__(self,
+                 model,
+                 concurrency: int = 4,
+                 retries: int = 3,
+                 backoff: float = 1.0,
+                 timeout: float = 60.0) -> None:
+        '''Creates a PromptExecutor object
+        Args:
+            model: chat model (e.g. AzureChatOpenAI or StubModel from f1gpt.prompts)
+            concurrency: (int) [optional] maximum number of calls running at the same time
+            retries: (int) [optional] number of retries of a call that failed with a transient error or timed out
+            backoff: (float) [optional] base delay in seconds between retries
+            timeout: (float) [optional] maximum time in seconds of a single call
+        Returns:
+            None'''
+        self.model = model
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    async def _predict(self, threads: ThreadPoolExecutor, messages: list['BaseMessage']) -> 'BaseMessage':
+        if hasattr(self.model, 'apredict_messages'):
+            return await self.model.apredict_messages(messages)
+        # synchronous models run in a thread to not block the other calls
+        return await asyncio.get_running_loop().run_in_executor(threads, self.model.predict_messages, messages)
+
+    async def _run_one(self,
+                       semaphore: asyncio.Semaphore,
+                       threads: ThreadPoolExecutor,
+                       messages: list['BaseMessage']) -> 'BaseMessage':
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    return await asyncio.wait_for(self._predict(threads, messages), self.timeout)
+            except Exception as error:
+                if attempt == self.retries or not is_transient(error):
+                    raise
+            # exponential backoff with jitter, waiting outside the semaphore
+            await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+    async def run(self, prompts: dict[str, list['BaseMessage']]) -> 'dict[str, BaseMessage | Exception]':
+        '''Runs a dictionary of prompts concurrently
+        Args:
+            prompts: (dict[str, list[BaseMessage]]) formatted messages of each prompt by name (e.g. "event")
+        Returns:
+            responses: dictionary with the response of each prompt by name, or the exception
+                       raised by its last attempt'''
+        semaphore = asyncio.Semaphore(self.concurrency)
+        threads = ThreadPoolExecutor(max_workers=self.concurrency)
+        names = list(prompts)
+        try:
+            responses = await asyncio.gather(*[self._run_one(semaphore, threads, prompts[name]) for name in names],
+                                             return_exceptions=True)
+        finally:
+            # timed out calls still running are not waited for
+            threads.shutdown(wait=False, cancel_futures=True)
+        return dict(zip(names, responses))
+
+    def run_all(self, prompts: dict[str, list['BaseMessage']]) -> 'dict[str, BaseMessage | Exception]':
+        '''Runs a dictionary of prompts concurrently from synchronous code (see run)'''
+        return asyncio.run(self.run(prompts))
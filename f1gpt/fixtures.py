@@ -0,0 +1,264 @@
+import os
+import types
+
+import numpy
+import pandas
+
+from f1gpt.connectors import F1Session, drivers as roster
+from f1gpt.rosters import DriversAttribute
+from f1gpt.stores import TelemetryStore
+
+# Synthetic sessions for offline use (benchmarks and ingestion fixtures). Data follows
+# the schemas of schema.md and is written with the TelemetryStore layout, so it is read
+# by the same code paths of a session downloaded from fastf1.
+
+TRACK_LENGTH = 5800
+TOP_SPEED = 320
+# (distance in meters, speed loss in km/h, half width in meters) of each corner
+CORNERS = [(350, 180, 60), (1200, 90, 120), (2000, 140, 80), (3100, 60, 150), (4300, 200, 50), (5650, 210, 40)]
+SESSION_START = pandas.Timestamp('2023-09-23 06:00:00')
+
+def _lap_grid(pace: float = 1.0) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    # distance (m), speed (km/h) and time (s) of a lap on a 1 meter grid
+    distance = numpy.arange(0, TRACK_LENGTH + 1, 1.0)
+    speed = numpy.full_like(distance, TOP_SPEED)
+    for position, loss, width in CORNERS:
+        speed -= loss * numpy.exp(-((distance - position) / width) ** 2)
+    speed *= pace
+    middle_speed = (speed[1:] + speed[:-1]) / 2 / 3.6
+    time = numpy.concatenate([[0], numpy.cumsum(numpy.diff(distance) / middle_speed)])
+    return distance, speed, time
+
+BASE_LAP_TIME = _lap_grid()[2][-1]
+
+def _track_line() -> tuple[numpy.ndarray, numpy.ndarray]:
+    # X and Y (1/10 m, as fastf1 position data) of the lap on a 1 meter grid, the heading turns a
+    # full circle and the turn of each corner grows with its speed loss (slow corners are tight)
+    distance = numpy.arange(0, TRACK_LENGTH + 1, 1.0)
+    turn = numpy.zeros_like(distance)
+    for position, loss, width in CORNERS:
+        turn += loss * numpy.exp(-((distance - position) / width) ** 2)
+    heading = 2 * numpy.pi * numpy.cumsum(turn) / turn.sum()
+    x, y = numpy.cumsum(numpy.cos(heading)), numpy.cumsum(numpy.sin(heading))
+    # the closing error is spread along the lap, so the lap ends where it starts
+    ramp = distance / TRACK_LENGTH
+    return 10 * (x - ramp * (x[-1] - x[0])), 10 * (y - ramp * (y[-1] - y[0]))
+
+TRACK_X, TRACK_Y = _track_line()
+
+def fixture_drivers(count: int = 20) -> DriversAttribute:
+    '''Creates the drivers of a synthetic session, real drivers first then generated ones
+    Args:
+        count: (int) [optional] number of drivers
+    Returns:
+        DriversAttribute object (see f1gpt.rosters)'''
+    items = list(roster.items[:count])
+    for number in range(len(items), count):
+        items.append({'number': str(100 + number),
+                      'name': f'Driver {number}',
+                      'color': '#FFFFFF',
+                      'abv': f'D{number:02d}',
+                      'team': f'Team {number // 2}'})
+    return DriversAttribute(items)
+
+def synthetic_telemetry(pace: float = 1.0,
+                        sample_rate: float = 10.0,
+                        lap_start: pandas.Timedelta = pandas.Timedelta(0),
+                        seed: int = 0) -> pandas.DataFrame:
+    '''Creates the telemetry (car data merged with position data) of a lap
+    Args:
+        pace: (float) [optional] speed factor of the driver, the lap time is BASE_LAP_TIME / pace
+        sample_rate: (float) [optional] samples per second
+        lap_start: (pandas.Timedelta) [optional] session time of the start of the lap
+        seed: (int) [optional] seed of the speed noise
+    Returns:
+        pandas.DataFrame with the schema of the telemetries attribute (check schema.md file)'''
+    rng = numpy.random.default_rng(seed)
+    grid_distance, grid_speed, grid_time = _lap_grid(pace)
+    seconds = numpy.arange(0, grid_time[-1], 1 / sample_rate)
+    position = numpy.interp(seconds, grid_time, grid_distance)
+    speed = numpy.interp(position, grid_distance, grid_speed) + rng.normal(0, 0.5, len(seconds))
+    speed = numpy.round(speed).astype('int64')
+    acceleration = numpy.gradient(speed, seconds) if len(seconds) > 1 else numpy.zeros(len(seconds))
+    brake = acceleration < -15
+    grid_x = numpy.interp(position, grid_distance, TRACK_X)
+    grid_y = numpy.interp(position, grid_distance, TRACK_Y)
+    time = pandas.to_timedelta(seconds, unit='s')
+    session_time = lap_start + time
+    return pandas.DataFrame({'Date': SESSION_START + session_time,
+                             'RPM': (7000 + speed % 42 / 42 * 5000).astype('int64'),
+                             'Speed': speed,
+                             'nGear': numpy.clip(numpy.ceil(speed / 42), 1, 8).astype('int64'),
+                             'Throttle': numpy.where(brake, 0, numpy.where(acceleration > 0, 100, 40)).astype('int64'),
+                             'Brake': brake,
+                             'DRS': numpy.where(speed > 290, 12, 0).astype('int64'),
+                             'Source': 'car',
+                             'Time': time,
+                             'SessionTime': session_time,
+                             'Status': 'OnTrack',
+                             'X': numpy.round(grid_x).astype('int64'),
+                             'Y': numpy.round(grid_y).astype('int64'),
+                             'Z': numpy.zeros(len(seconds), dtype='int64'),
+                             # same integration of fastf1 add_distance
+                             'Distance': numpy.cumsum(speed / 3.6 * numpy.diff(seconds, prepend=0))})
+
+def synthetic_laps(drivers: DriversAttribute, laps: int = 10, seed: int = 0) -> pandas.DataFrame:
+    '''Creates the laps of a session, every driver runs the same number of timed laps
+    Args:
+        drivers: (DriversAttribute) drivers of the session (see fixture_drivers)
+        laps: (int) [optional] number of laps of each driver
+        seed: (int) [optional] seed of the lap time noise
+    Returns:
+        pandas.DataFrame with the columns of fastf1 laps used by f1gpt (and a "Pace" column)'''
+    rng = numpy.random.default_rng(seed)
+    count = len(drivers.items)
+    # faster drivers first, with a lap to lap noise of ~0.3s
+    pace = (1 - 0.002 * numpy.arange(count))[:, None] * (1 + rng.normal(0, 0.002, (count, laps)))
+    lap_time = BASE_LAP_TIME / pace
+    out_lap = 120 + 10 * numpy.arange(count)[:, None]
+    lap_start = out_lap + numpy.cumsum(lap_time, axis=1) - lap_time
+    lap_frame = pandas.DataFrame({
+        'Time': pandas.to_timedelta((lap_start + lap_time).ravel(), unit='s'),
+        'Driver': numpy.repeat([item['abv'] for item in drivers.items], laps),
+        'DriverNumber': numpy.repeat([item['number'] for item in drivers.items], laps),
+        'LapTime': pandas.to_timedelta(lap_time.ravel(), unit='s'),
+        'LapNumber': numpy.tile(numpy.arange(1, laps + 1, dtype=float), count),
+        'Stint': 1.0,
+        'Compound': 'SOFT',
+        'TyreLife': numpy.tile(numpy.arange(1, laps + 1, dtype=float), count),
+        'LapStartTime': pandas.to_timedelta(lap_start.ravel(), unit='s'),
+        'Team': numpy.repeat([item['team'] for item in drivers.items], laps),
+        'Pace': pace.ravel()})
+    best = lap_frame.groupby('DriverNumber', sort=False)['LapTime'].cummin()
+    previous_best = best.groupby(lap_frame['DriverNumber'], sort=False).shift()
+    lap_frame['IsPersonalBest'] = previous_best.isna() | (lap_frame['LapTime'] < previous_best)
+    return lap_frame
+
+def synthetic_results(laps: pandas.DataFrame) -> pandas.DataFrame:
+    '''Creates the results of a session, ordered by the fastest lap of each driver
+    Args:
+        laps: (pandas.DataFrame) laps of the session (see synthetic_laps)
+    Returns:
+        pandas.DataFrame with the results schema (check schema.md file)'''
+    fastest = laps.groupby('DriverNumber', sort=False)['LapTime'].min().sort_values()
+    drivers = laps.drop_duplicates('DriverNumber').set_index('DriverNumber').loc[fastest.index]
+    return pandas.DataFrame({'DriverNumber': fastest.index.to_numpy(dtype=object),
+                             'Abbreviation': drivers['Driver'].to_numpy(),
+                             'TeamName': drivers['Team'].to_numpy(),
+                             'Position': numpy.arange(1, len(fastest) + 1, dtype='int64')})
+
+def synthetic_car_data(laps: pandas.DataFrame,
+                       sample_rate: float = 10.0,
+                       seed: int = 0) -> dict[str, pandas.DataFrame]:
+    '''Creates the car data of a session, every lap of every driver one after another
+    Args:
+        laps: (pandas.DataFrame) laps of the session (see synthetic_laps)
+        sample_rate: (float) [optional] samples per second
+        seed: (int) [optional] seed of the speed noise
+    Returns:
+        dictionary of pandas.DataFrame with the car data channels by driver number'''
+    columns = ['Date', 'RPM', 'Speed', 'nGear', 'Throttle', 'Brake', 'DRS', 'Source', 'Time', 'SessionTime']
+    car_data = {}
+    for driver, driver_laps in laps.groupby('DriverNumber', sort=False):
+        frames = [synthetic_telemetry(lap.Pace, sample_rate, lap.LapStartTime, seed + index)[columns]
+                  for index, lap in enumerate(driver_laps.itertuples())]
+        car_data[driver] = pandas.concat(frames, ignore_index=True)
+    return car_data
+
+def write_fixture_session(store: TelemetryStore,
+                          year: int = 2023,
+                          event: str = 'Fixture Grand Prix',
+                          session: str = 'Qualifying',
+                          drivers: int = 20,
+                          laps: int = 10,
+                          sample_rate: float = 10.0,
+                          seed: int = 0) -> DriversAttribute:
+    '''Writes a synthetic session into a store, with the telemetry of the fastest lap of every driver
+    Args:
+        store: (TelemetryStore) store where the session is written
+        year: (int) [optional] year of the event
+        event: (str) [optional] name of the event
+        session: (str) [optional] name of the session
+        drivers: (int) [optional] number of drivers
+        laps: (int) [optional] number of laps of each driver
+        sample_rate: (float) [optional] telemetry samples per second
+        seed: (int) [optional] seed of the random noise
+    Returns:
+        DriversAttribute object with the drivers of the session'''
+    session_drivers = fixture_drivers(drivers)
+    lap_frame = synthetic_laps(session_drivers, laps, seed)
+    store.write_laps(lap_frame, year, event, session)
+    store.write_results(synthetic_results(lap_frame), year, event, session)
+    fastest = lap_frame.loc[lap_frame.groupby('DriverNumber', sort=False)['LapTime'].idxmin()]
+    for number, (_, lap) in enumerate(fastest.iterrows()):
+        telemetry = synthetic_telemetry(lap['Pace'], sample_rate, lap['LapStartTime'], seed + number)
+        store.write_telemetry(telemetry, year, event, session, lap['DriverNumber'], lap['LapNumber'])
+    return session_drivers
+
+class FixtureSession(F1Session):
+    '''Class of a session read only from a store (e.g. written by write_fixture_session),
+    fastf1 is never called so it works offline
+    Attributes:
+        same attributes of F1Session (see f1gpt.connectors)
+        sample_rate: samples per second of the synthetic car data (see synthetic_car_data)
+        tracks_path: track maps are cached inside the store (<store>/tracks)
+        '''
+    def __init__(self,
+                 store: TelemetryStore,
+                 drivers: DriversAttribute,
+                 event_name: str = 'Fixture Grand Prix',
+                 session_name: str = 'Qualifying',
+                 year: int = 2023,
+                 location: str = 'Fixture',
+                 sample_rate: float = 10.0) -> None:
+        '''Creates a FixtureSession object
+        Args:
+            store: (TelemetryStore) store with the session data
+            drivers: (DriversAttribute) object with the drivers data
+            event_name: (str) [optional] name of the event in the store
+            session_name: (str) [optional] name of the session in the store
+            year: (int) [optional] year of the event
+            location: (str) [optional] location of the event
+            sample_rate: (float) [optional] samples per second of the car data
+        Returns:
+            None'''
+        self.event_name = event_name
+        self.year = year
+        self.schedule = None
+        self.event = pandas.Series({'EventName': event_name, 'Location': location})
+        self.session_number = None
+        self.drivers = drivers
+        self.session = types.SimpleNamespace(name=session_name, event=self.event)
+        self.sample_rate = sample_rate
+        self._car_data = None
+        self.tracks_path = os.path.join(store.path, 'tracks')
+        self._init_data(store, lazy=True)
+
+    @property
+    def car_data(self) -> dict[str, pandas.DataFrame]:
+        # generated from the stored laps, as the store only holds fastest lap telemetries
+        if self._car_data is None:
+            self._car_data = synthetic_car_data(self.laps, self.sample_rate)
+        return self._car_data
+
+    def load(self, data: str = 'telemetry') -> None:
+        raise FileNotFoundError(f'{data} of {self.store_key} is not in the store {self.store.path}')
+
+def create_fixture_session(path: str,
+                           drivers: int = 20,
+                           laps: int = 10,
+                           sample_rate: float = 10.0,
+                           seed: int = 0) -> FixtureSession:
+    '''Writes a synthetic session into a store and opens it
+    Args:
+        path: (str) root directory of the store
+        drivers: (int) [optional] number of drivers
+        laps: (int) [optional] number of laps of each driver
+        sample_rate: (float) [optional] telemetry samples per second
+        seed: (int) [optional] seed of the random noise
+    Returns:
+        FixtureSession object'''
+    store = TelemetryStore(path)
+    session_drivers = write_fixture_session(store, drivers=drivers, laps=laps,
+                                            sample_rate=sample_rate, seed=seed)
+    return FixtureSession(store, session_drivers, sample_rate=sample_rate)
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+# Import time budget of the command line, check it with:
+# python -m f1gpt.importtime [budget in seconds] [command ...]   (e.g. python -m f1gpt.importtime 3 live 4)
+# The command runs for real (python -X importtime main.py <command>) in a new interpreter, so
+# the imports of its whole startup are measured, not only the import of main. Without a
+# command only the dispatcher starts, and it must not import any of HEAVY_MODULES.
+IMPORT_BUDGET = 0.5
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+HEAVY_MODULES = ['fastf1', 'pandas', 'numpy', 'matplotlib', 'scipy', 'langchain', 'openai']
+# modules that a command must never import, by command
+FORBIDDEN_MODULES = {None: HEAVY_MODULES,
+                     'backfill': ['langchain', 'openai', 'matplotlib'],
+                     'live': ['langchain', 'openai', 'matplotlib']}
+
+def measure_import_time(command: list[str] | None = None) -> tuple[dict[str, float], int]:
+    '''Measures the import time of the startup of a command with python -X importtime,
+    in a new interpreter so nothing is already imported
+    Args:
+        command: (list[str]) [optional] arguments of main.py (e.g. ["event", "stub"]), None to only start the dispatcher
+    Returns:
+        import_times: dictionary with the cumulative import time in seconds of each imported module,
+                      and the total of the top level imports with the "total" key
+        returncode: exit code of the command'''
+    process = subprocess.run([sys.executable, '-X', 'importtime', MAIN_PATH, *(command or [])],
+                             capture_output=True, text=True, cwd=os.path.dirname(MAIN_PATH))
+    import_times = {'total': 0.0}
+    # lines are "import time: self [us] | cumulative | imported package", nested imports are indented
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        seconds = int(cumulative) / 1e6
+        if not name[1:].startswith(' '):
+            import_times['total'] += seconds
+        import_times[name.strip()] = seconds
+    return import_times, process.returncode
+
+def check_import_budget(command: list[str] | None = None, budget: float = IMPORT_BUDGET) -> bool:
+    '''Checks if the import time of the startup of a command is within budget and that it does not
+    import its forbidden modules (see FORBIDDEN_MODULES), printing the slowest imports
+    Args:
+        command: (list[str]) [optional] arguments of main.py, None to only start the dispatcher
+        budget: (float) [optional] import time budget in seconds
+    Returns:
+        True if the command succeeded within budget without forbidden imports'''
+    import_times, returncode = measure_import_time(command)
+    name = ' '.join(command) if command else '(no command)'
+    total = import_times.pop('total')
+    print(f'main.py {name}: {total:.3f}s of imports (budget {budget:.3f}s)')
+    for module, seconds in sorted(import_times.items(), key=lambda item: -item[1])[:10]:
+        print(f'    {seconds:.3f}s {module}')
+    forbidden = [module for module in FORBIDDEN_MODULES.get(command[0] if command else None, [])
+                 if module in import_times]
+    if forbidden:
+        print(f'main.py {name} imported {", ".join(forbidden)}')
+    if returncode:
+        print(f'main.py {name} failed with exit code {returncode}')
+    return total <= budget and not forbidden and not returncode
+
+if __name__ == '__main__':
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_BUDGET
+    sys.exit(0 if check_import_budget(sys.argv[2:] or None, budget) else 1)
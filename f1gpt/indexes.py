@@ -0,0 +1,138 @@
+import numpy
+import pandas
+
+# throttle (%) above which pressing the brake counts as brake-throttle overlap
+OVERLAP_THROTTLE = 20
+
+def transitions(mask: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+    '''Finds the runs of True values of a boolean array
+    Args:
+        mask: (numpy.ndarray) boolean array
+    Returns:
+        on: numpy.ndarray with the index of the first sample of each run
+        off: numpy.ndarray with the index of the first sample after each run'''
+    changes = numpy.diff(mask.astype(numpy.int8), prepend=0, append=0)
+    return numpy.flatnonzero(changes == 1), numpy.flatnonzero(changes == -1)
+
+class LapIndex:
+    '''Class to index the telemetry of a lap by distance, to answer range queries
+    in O(log n) plus the size of the range
+    Attributes:
+        distance: numpy.ndarray with the (sorted) distance of each sample
+        time: numpy.ndarray with the lap time of each sample in seconds
+        speed: numpy.ndarray with the speed of each sample
+        brake: numpy.ndarray with the brake (bool) of each sample
+        brake_on, brake_off: numpy.ndarray with the brake transitions (see transitions)
+        overlap: numpy.ndarray with the brake-throttle overlap (bool) of each sample
+        overlap_on, overlap_off: numpy.ndarray with the overlap transitions (see transitions)
+    Methods:
+        slice: positions of the samples inside a distance range
+        ranges_info: metrics of many distance ranges at once
+        range_info: metrics of a distance range
+        memory_usage: bytes of the index arrays
+        '''
+    def __init__(self, telemetry: pandas.DataFrame) -> None:
+        '''Creates a LapIndex object
+        Args:
+            telemetry: (pandas.DataFrame) telemetry of a lap with "Distance", "Time", "Speed", "Throttle" and "Brake" columns
+        Returns:
+            None'''
+        self.distance = telemetry['Distance'].to_numpy(dtype=float)
+        self.time = telemetry['Time'].to_numpy(dtype='timedelta64[ns]').astype('int64') / 1e9
+        self.speed = telemetry['Speed'].to_numpy(dtype=float)
+        self.brake = telemetry['Brake'].to_numpy(dtype=bool)
+        self.brake_on, self.brake_off = transitions(self.brake)
+        self.overlap = (telemetry['Throttle'].to_numpy() > OVERLAP_THROTTLE) & self.brake
+        self.overlap_on, self.overlap_off = transitions(self.overlap)
+
+    def memory_usage(self) -> int:
+        return sum(values.nbytes for values in vars(self).values() if isinstance(values, numpy.ndarray))
+
+    def slice(self, start: float, end: float) -> tuple[int, int]:
+        '''Finds the samples inside a distance range (both ends included)
+        Args:
+            start: (float) start distance of the range
+            end: (float) end distance of the range
+        Returns:
+            low, high: positions of the first sample and after the last sample of the range'''
+        low = int(numpy.searchsorted(self.distance, start, side='left'))
+        high = int(numpy.searchsorted(self.distance, end, side='right'))
+        return low, high
+
+    def ranges_info(self,
+                    starts: numpy.ndarray,
+                    ends: numpy.ndarray) -> dict[str, numpy.ndarray]:
+        '''Calculates the metrics of many distance ranges at once
+        Args:
+            starts: (numpy.ndarray) start distance of each range
+            ends: (numpy.ndarray) end distance of each range
+        Returns:
+            info_dict: dictionary with a numpy.ndarray (one value per range) for each of the keys
+                top_speed, avg_speed, lowest_speed, time, brake_start, brake_release, overlap_distance
+                (distances in meters, times in seconds), brake points are numpy.nan when there
+                is no braking in the range and every metric is numpy.nan for empty ranges'''
+        samples = len(self.distance)
+        if samples == 0:
+            # no telemetry, every range is empty
+            empty = numpy.full(len(numpy.atleast_1d(starts)), numpy.nan)
+            return {key: empty.copy() for key in ['top_speed', 'avg_speed', 'lowest_speed', 'time',
+                                                  'brake_start', 'brake_release', 'overlap_distance']}
+        low = numpy.searchsorted(self.distance, numpy.asarray(starts, dtype=float), side='left')
+        high = numpy.searchsorted(self.distance, numpy.asarray(ends, dtype=float), side='right')
+        valid = low < high
+        last = (high - 1).clip(0)
+        first = low.clip(0, samples - 1)
+
+        # reduceat over interleaved (low, high) bounds, the padding keeps high == samples valid
+        bounds = numpy.column_stack([low, high]).ravel()
+        top_speed = numpy.maximum.reduceat(numpy.append(self.speed, 0), bounds)[::2]
+        lowest_speed = numpy.minimum.reduceat(numpy.append(self.speed, 0), bounds)[::2]
+        cumsum = numpy.concatenate([[0], numpy.cumsum(self.speed)])
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            avg_speed = (cumsum[high] - cumsum[low]) / (high - low)
+        time = self.time[last] - self.time[first]
+
+        # brake points from the brake transitions, the sentinels avoid out of bounds positions
+        brake_on = numpy.append(self.brake_on, samples)
+        brake_off = numpy.append(self.brake_off, samples)
+        start = numpy.where(self.brake[first], first,
+                            brake_on[numpy.searchsorted(self.brake_on, first, side='right')])
+        has_brake = valid & (start < high)
+        release = brake_off[numpy.searchsorted(self.brake_off, start.clip(0, samples - 1), side='right')]
+        has_release = has_brake & (release < high)
+
+        # brake-throttle overlap bounds
+        overlap_on = numpy.append(self.overlap_on, samples)
+        overlap_first = numpy.where(self.overlap[first], first,
+                                    overlap_on[numpy.searchsorted(self.overlap_on, first, side='right')])
+        has_overlap = valid & (overlap_first < high)
+        overlap_off = numpy.concatenate([[0], self.overlap_off])
+        previous_off = overlap_off[numpy.searchsorted(self.overlap_off, last, side='right')]
+        overlap_last = numpy.where(self.overlap[last], last, previous_off - 1)
+
+        distance = numpy.append(self.distance, numpy.nan)
+        info_dict = {'top_speed': top_speed,
+                     'avg_speed': avg_speed,
+                     'lowest_speed': lowest_speed,
+                     'time': time,
+                     'brake_start': numpy.where(has_brake, distance[start.clip(0, samples)], numpy.nan),
+                     'brake_release': numpy.where(has_release, distance[release.clip(0, samples)], numpy.nan),
+                     'overlap_distance': numpy.where(has_overlap,
+                                                     distance[overlap_last.clip(0, samples)] - 
+                                                     distance[overlap_first.clip(0, samples)],
+                                                     0.0)}
+        for key in ['top_speed', 'avg_speed', 'lowest_speed', 'time', 'overlap_distance']:
+            info_dict[key] = numpy.where(valid, info_dict[key].astype(float), numpy.nan)
+        return info_dict
+
+    def range_info(self, start: float, end: float) -> dict[str, float]:
+        '''Calculates the metrics of a distance range
+        Args:
+            start: (float) start distance of the range
+            end: (float) end distance of the range
+        Returns:
+            info_dict: dictionary with the following keys (distances in meters, times in seconds):
+                top_speed, avg_speed, lowest_speed, time, brake_start, brake_release, overlap_distance
+                brake points are numpy.nan when there is no braking in the range'''
+        info_dict = self.ranges_info(numpy.array([start]), numpy.array([end]))
+        return {key: value[0] for key, value in info_dict.items()}
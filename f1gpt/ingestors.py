@@ -0,0 +1,123 @@
+import concurrent.futures
+import time
+
+from f1gpt.stores import TelemetryStore
+
+# An ingestion task is a (year, event, session) tuple. Sessions come from a source:
+# fastf1 (session is the session number, e.g. 4 for Q) or a fixture directory with
+# the same layout of the TelemetryStore (session is the session name, e.g. "Qualifying").
+# Both sources return the same session data dictionary, written by the same code.
+
+def load_fastf1_session(year: int, event: str, session: int | str) -> dict:
+    '''Loads a session from fastf1, with the telemetry of the fastest lap of every driver
+    Args:
+        year: (int) year of the event
+        event: (str) name of the event, we use fuzzy logic from fastf1 library to find the event
+        session: (int | str) number of the session (e.g. 1 for FP1, 2 for FP2, 3 for FP3, 4 for Q, 5 for R)
+    Returns:
+        session_data: dictionary with "event", "session", "laps", "results" and "telemetries"
+                      (dictionary of pandas.DataFrame by (driver, lap)) keys'''
+    from f1gpt.connectors import F1Session
+
+    f1_session = F1Session(event, session, year=year, lazy=True)
+    f1_session.fastests_lap()
+    laps = f1_session.fastest_lap['LapNumber'].dropna()
+    return {'event': f1_session.event.EventName,
+            'session': f1_session.session.name,
+            'laps': f1_session.laps,
+            'results': f1_session.results,
+            'telemetries': {(car, int(lap)): f1_session.get_telemetry(car) for car, lap in laps.items()}}
+
+def load_fixture_session(path: str, year: int, event: str, session: str) -> dict:
+    '''Loads a session from local fixture files (stored with the TelemetryStore layout)
+    Args:
+        path: (str) root directory of the fixture files
+        year: (int) year of the event
+        event: (str) name of the event
+        session: (str) name of the session
+    Returns:
+        session_data: dictionary with the same keys of load_fastf1_session'''
+    fixtures = TelemetryStore(path)
+    if not fixtures.has_session(year, event, session):
+        raise FileNotFoundError(f'No fixture for {year} {event} {session} in {path}')
+    return {'event': event,
+            'session': session,
+            'laps': fixtures.read_laps(year, event, session),
+            'results': fixtures.read_results(year, event, session),
+            'telemetries': {(driver, lap): fixtures.read_telemetry(year, event, session, driver, lap)
+                            for driver, lap in fixtures.list_telemetry(year, event, session)}}
+
+def ingest_session(task: tuple[int, str, int | str],
+                   store_path: str,
+                   fixtures_path: str | None = None) -> dict:
+    '''Loads a session and writes it into the store, runs in a worker process
+    Args:
+        task: (tuple) (year, event, session) of the session
+        store_path: (str) root directory of the store
+        fixtures_path: (str) [optional] root directory of fixture files, by default sessions come from fastf1
+    Returns:
+        report: dictionary with "task", "event", "session", "laps", "telemetries" and "seconds" keys'''
+    start = time.perf_counter()
+    year = task[0]
+    if fixtures_path:
+        session_data = load_fixture_session(fixtures_path, *task)
+    else:
+        session_data = load_fastf1_session(*task)
+    store = TelemetryStore(store_path)
+    event, session = session_data['event'], session_data['session']
+    store.write_laps(session_data['laps'], year, event, session)
+    store.write_results(session_data['results'], year, event, session)
+    for (driver, lap), telemetry in session_data['telemetries'].items():
+        store.write_telemetry(telemetry, year, event, session, driver, lap)
+    return {'task': task,
+            'event': event,
+            'session': session,
+            'laps': len(session_data['laps']),
+            'telemetries': len(session_data['telemetries']),
+            'seconds': round(time.perf_counter() - start, 2)}
+
+def season_tasks(year: int, sessions: list[int] = [1, 2, 3, 4, 5]) -> list[tuple[int, str, int]]:
+    '''Lists the ingestion tasks of a season (testing events are skipped)
+    Args:
+        year: (int) year of the season
+        sessions: (list[int]) [optional] numbers of the sessions of each event
+    Returns:
+        list of (year, event, session) tuples'''
+    from f1gpt.connectors import get_event_schedule
+
+    schedule = get_event_schedule(year)
+    events = schedule[schedule['RoundNumber'] > 0]['EventName']
+    return [(year, event, session) for event in events for session in sessions]
+
+def ingest(tasks: list[tuple[int, str, int | str]],
+           store_path: str = 'store',
+           fixtures_path: str | None = None,
+           max_workers: int | None = None,
+           progress=print) -> list[dict]:
+    '''Loads many sessions in a process pool and writes them into the store
+    Args:
+        tasks: (list[tuple]) (year, event, session) of each session (see season_tasks)
+        store_path: (str) [optional] root directory of the store
+        fixtures_path: (str) [optional] root directory of fixture files, by default sessions come from fastf1
+        max_workers: (int) [optional] maximum number of worker processes, by default the number of cores
+        progress: (callable) [optional] called with a progress message when each task finishes
+    Returns:
+        reports: list with the report of each task (see ingest_session), failed tasks have
+                 "task", "status" and "error" keys'''
+    reports = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(ingest_session, task, store_path, fixtures_path): task
+                   for task in tasks}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            task = futures[future]
+            try:
+                report = future.result()
+                report['status'] = 'ok'
+                message = f'{report["telemetries"]} telemetries in {report["seconds"]}s'
+            except Exception as error:
+                report = {'task': task, 'status': 'failed', 'error': repr(error)}
+                message = f'failed: {error!r}'
+            if progress:
+                progress(f'[{done}/{len(tasks)}] {task}: {message}')
+            reports.append(report)
+    return reports
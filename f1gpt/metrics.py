@@ -0,0 +1,174 @@
+import collections
+import contextlib
+import contextvars
+import datetime
+import functools
+import inspect
+import json
+import threading
+import time
+
+# Timing spans and counters of the briefing pipeline. Every stage of F1Session,
+# SessionBriefer, Ploter and the model calls records a span in the module recorder,
+# nested spans keep the name of their parent (also across asyncio tasks). Export a run with:
+# recorder.export('metrics.jsonl')  (one JSON object per run, appended to the file)
+# Work done in worker processes (e.g. Ploter.plot_many, ingestors) is not recorded.
+# The recorder is thread safe and only keeps the last MAX_SPANS spans, so a long running
+# process (e.g. the service mode) does not grow without bound.
+
+# characters per token of English text, used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+# spans kept by a recorder, the oldest spans are dropped first
+MAX_SPANS = 10000
+
+_parent = contextvars.ContextVar('parent', default=None)
+
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding('cl100k_base')
+
+def count_tokens(text: str) -> int:
+    '''Counts the tokens of a text, exact with tiktoken when installed, approximated otherwise
+    Args:
+        text: (str) text to be counted
+    Returns:
+        number of tokens'''
+    encoding = _encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+class MetricsRecorder:
+    '''Class to record timing spans and counters of a run
+    Attributes:
+        spans: deque with the dictionaries with "name", "parent", "start", "seconds" and attributes
+               of the last max_spans finished spans
+        counters: dictionary with the value of each counter (e.g. "prompt_tokens", "cache_hits")
+        callbacks: list of functions called with each finished span
+        started: time of the start of the run
+        max_spans: maximum number of spans kept
+    Methods:
+        span: context manager that records a span
+        timed: decorator that records a span of each call of a function
+        count: increment a counter
+        subscribe: add a callback
+        summary: aggregate the spans by stage
+        export: export the run as a JSON object
+        reset: start a new run
+        '''
+    def __init__(self, max_spans: int = MAX_SPANS) -> None:
+        self.callbacks = []
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.spans = collections.deque(maxlen=self.max_spans)
+            self.counters = {}
+            self.started = time.time()
+            self._clock = time.perf_counter()
+
+    def subscribe(self, callback) -> None:
+        '''Adds a callback, called with the dictionary of each finished span (e.g. to send it to a monitoring service)'''
+        self.callbacks.append(callback)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes):
+        '''Records the duration of a block of code
+        Args:
+            name: (str) name of the stage (e.g. "session.get_telemetry")
+            attributes: extra fields of the span (e.g. car="1"), the yielded dictionary
+                        can be updated inside the block (e.g. with token counts)
+        Returns:
+            context manager yielding the attributes dictionary'''
+        token = _parent.set(name)
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            seconds = time.perf_counter() - start
+            _parent.reset(token)
+            span = {'name': name,
+                    'parent': _parent.get(),
+                    'start': round(start - self._clock, 6),
+                    'seconds': round(seconds, 6),
+                    **attributes}
+            with self._lock:
+                self.spans.append(span)
+            for callback in self.callbacks:
+                callback(span)
+
+    def timed(self, name: str):
+        '''Decorator that records a span of each call of a function (or coroutine function)
+        Args:
+            name: (str) name of the stage
+        Returns:
+            decorator'''
+        def decorator(function):
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await function(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> dict[str, dict]:
+        '''Aggregates the spans by stage
+        Returns:
+            dictionary with "calls", "seconds" (total), "mean" and "max" of each stage'''
+        with self._lock:
+            spans = list(self.spans)
+        stages = {}
+        for span in spans:
+            stage = stages.setdefault(span['name'], {'calls': 0, 'seconds': 0.0, 'max': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] += span['seconds']
+            stage['max'] = max(stage['max'], span['seconds'])
+        for stage in stages.values():
+            stage['mean'] = round(stage['seconds'] / stage['calls'], 6)
+            stage['seconds'] = round(stage['seconds'], 6)
+        return stages
+
+    def export(self, path: str | None = None, **run_attributes) -> dict:
+        '''Exports the run as a JSON object
+        Args:
+            path: (str) [optional] JSON lines file where the run is appended
+            run_attributes: extra fields of the run (e.g. command="session")
+        Returns:
+            dictionary with "started", "seconds", "stages", "counters", "cache_hit_rate" and "spans" keys'''
+        with self._lock:
+            counters = dict(self.counters)
+            spans = list(self.spans)
+        lookups = counters.get('cache_hits', 0) + counters.get('cache_misses', 0)
+        run = {'started': datetime.datetime.fromtimestamp(self.started).isoformat(),
+               'seconds': round(time.perf_counter() - self._clock, 6),
+               **run_attributes,
+               'stages': self.summary(),
+               'counters': counters,
+               'cache_hit_rate': round(counters.get('cache_hits', 0) / lookups, 4) if lookups else None,
+               'spans': spans}
+        if path:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(run, default=str) + '\n')
+        return run
+
+# recorder shared by the whole pipeline
+recorder = MetricsRecorder()
+span = recorder.span
+timed = recorder.timed
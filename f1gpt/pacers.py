@@ -0,0 +1,207 @@
+import numpy
+import pandas
+
+# Race pace of every driver on every lap. Car data of a driver covers the whole session, it
+# is sliced by all lap boundaries at once (searchsorted on the sorted session time) instead
+# of calling fastf1 get_car_data / slice_by_lap once per lap.
+
+# laps slower than the median lap of the driver by more than this factor are not clean
+# (safety car, virtual safety car, traffic or incidents)
+CLEAN_THRESHOLD = 1.07
+# throttle (%) from which a sample counts as full throttle
+FULL_THROTTLE = 99
+
+def slice_by_laps(session_time: numpy.ndarray,
+                  lap_starts: numpy.ndarray,
+                  lap_ends: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+    '''Finds the samples of many laps in a sorted time series
+    Args:
+        session_time: (numpy.ndarray) sorted session time of each sample (timedelta64 or numbers)
+        lap_starts: (numpy.ndarray) session time of the start of each lap
+        lap_ends: (numpy.ndarray) session time of the end of each lap
+    Returns:
+        low: numpy.ndarray with the first sample of each lap
+        high: numpy.ndarray with the first sample after each lap (low == high for laps without samples)'''
+    low = numpy.searchsorted(session_time, lap_starts, side='left')
+    high = numpy.searchsorted(session_time, lap_ends, side='right')
+    return low, numpy.maximum(low, high)
+
+def laps_channel_stats(car_data: pandas.DataFrame,
+                       lap_starts: numpy.ndarray,
+                       lap_ends: numpy.ndarray) -> dict[str, numpy.ndarray]:
+    '''Calculates the speed and throttle metrics of many laps of a driver in one pass
+    Args:
+        car_data: (pandas.DataFrame) car data of the driver with "SessionTime", "Speed" and "Throttle" columns
+        lap_starts: (numpy.ndarray) session time (timedelta64[ns]) of the start of each lap
+        lap_ends: (numpy.ndarray) session time (timedelta64[ns]) of the end of each lap
+    Returns:
+        dictionary with top_speed, avg_speed and full_throttle (fraction of samples) arrays,
+        numpy.nan for laps without samples'''
+    session_time = car_data['SessionTime'].to_numpy(dtype='timedelta64[ns]')
+    low, high = slice_by_laps(session_time, lap_starts, lap_ends)
+    valid = low < high
+    speed = car_data['Speed'].to_numpy(dtype=float)
+    full_throttle = (car_data['Throttle'].to_numpy(dtype=float) >= FULL_THROTTLE).astype(float)
+    # reduceat over interleaved (low, high) bounds, the padding keeps high == samples valid
+    bounds = numpy.column_stack([low, high]).ravel()
+    top_speed = numpy.maximum.reduceat(numpy.append(speed, 0), bounds)[::2] if len(bounds) else numpy.array([])
+    samples = high - low
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        avg_speed = numpy.diff(numpy.concatenate([[0], numpy.cumsum(speed)])[bounds])[::2] / samples
+        full_throttle = numpy.diff(numpy.concatenate([[0], numpy.cumsum(full_throttle)])[bounds])[::2] / samples
+    return {'top_speed': numpy.where(valid, top_speed, numpy.nan),
+            'avg_speed': numpy.where(valid, avg_speed, numpy.nan),
+            'full_throttle': numpy.where(valid, full_throttle, numpy.nan)}
+
+def grouped_slope(frame: pandas.DataFrame, by: list[str], x: str, y: str, min_points: int = 3) -> pandas.Series:
+    '''Calculates the least squares slope of y over x of every group at once
+    Args:
+        frame: (pandas.DataFrame) data, rows with missing x or y are ignored
+        by: (list[str]) columns of the groups
+        x: (str) column of the x values
+        y: (str) column of the y values
+        min_points: (int) [optional] minimum number of points of a group, slope is numpy.nan otherwise
+    Returns:
+        pandas.Series with the slope of each group'''
+    data = frame[by + [x, y]].dropna()
+    data = data.assign(xx=data[x] * data[x], xy=data[x] * data[y])
+    sums = data.groupby(by)[[x, y, 'xx', 'xy']].sum()
+    count = data.groupby(by).size()
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        slope = ((count * sums['xy'] - sums[x] * sums[y]) /
+                 (count * sums['xx'] - sums[x] ** 2))
+    return slope.where((count >= min_points) & numpy.isfinite(slope))
+
+def lap_pace(laps: pandas.DataFrame,
+             car_data: dict[str, pandas.DataFrame] | None = None,
+             clean_threshold: float = CLEAN_THRESHOLD) -> pandas.DataFrame:
+    '''Builds the per lap pace table of a session
+    Args:
+        laps: (pandas.DataFrame) fastf1 laps of the session
+        car_data: (dict[str, pandas.DataFrame]) [optional] car data by driver number (e.g. F1Session.car_data),
+                  without it the speed metrics are numpy.nan
+        clean_threshold: (float) [optional] see CLEAN_THRESHOLD
+    Returns:
+        pandas.DataFrame with one row per lap and columns DriverNumber, Driver, LapNumber, Stint, Compound,
+        TyreLife, LapTime (seconds), Clean (bool), top_speed, avg_speed (km/h) and full_throttle (fraction)'''
+    columns = {'DriverNumber': laps['DriverNumber'].astype(str),
+               'Driver': laps['Driver'],
+               'LapNumber': laps['LapNumber'].astype(float),
+               'Stint': laps['Stint'].astype(float) if 'Stint' in laps else 1.0,
+               'Compound': laps['Compound'] if 'Compound' in laps else 'UNKNOWN',
+               'TyreLife': laps['TyreLife'].astype(float) if 'TyreLife' in laps else laps['LapNumber'].astype(float),
+               'LapTime': laps['LapTime'].dt.total_seconds()}
+    table = pandas.DataFrame(columns).reset_index(drop=True)
+    clean = table['LapTime'].notna().to_numpy()
+    for column in ['PitInTime', 'PitOutTime']:
+        if column in laps:
+            clean &= laps[column].isna().to_numpy()
+    if 'TrackStatus' in laps:
+        # green flag laps only
+        clean &= (laps['TrackStatus'].astype(str) == '1').to_numpy()
+    median = table['LapTime'].where(clean).groupby(table['DriverNumber']).transform('median')
+    table['Clean'] = clean & (table['LapTime'] <= median * clean_threshold).to_numpy()
+
+    for column in ['top_speed', 'avg_speed', 'full_throttle']:
+        table[column] = numpy.nan
+    if car_data:
+        lap_starts = laps['LapStartTime'].to_numpy(dtype='timedelta64[ns]')
+        lap_ends = laps['Time'].to_numpy(dtype='timedelta64[ns]')
+        for driver, rows in table.groupby('DriverNumber').indices.items():
+            if driver not in car_data:
+                continue
+            stats = laps_channel_stats(car_data[driver], lap_starts[rows], lap_ends[rows])
+            for column, values in stats.items():
+                table.loc[rows, column] = values
+    return table
+
+class RacePace:
+    '''Class to analyse the race pace of every driver from the per lap pace table
+    Attributes:
+        laps: pandas.DataFrame with the pace of each lap (see lap_pace)
+        stints: pandas.DataFrame indexed by (DriverNumber, Stint) with Driver, Compound, Laps, CleanLaps,
+                Pace (median clean lap time in seconds) and Degradation (lap time slope over tyre life
+                in seconds per lap) columns
+        drivers: pandas.DataFrame indexed by DriverNumber with Driver, Pace, Best, Consistency (std of clean
+                 lap times), Degradation (mean stint degradation weighted by clean laps), top_speed (mean
+                 of the top speed of the clean laps) and top_speed_trend (km/h per lap) columns
+    Methods:
+        table: pace of many drivers with their stints in a single column
+        summary: text summary of the pace of many drivers
+        memory_usage: bytes of the pace tables
+        '''
+    def __init__(self, laps: pandas.DataFrame) -> None:
+        '''Creates a RacePace object
+        Args:
+            laps: (pandas.DataFrame) per lap pace table (see lap_pace)
+        Returns:
+            None'''
+        self.laps = laps
+        clean = laps[laps['Clean']]
+
+        stint_groups = laps.groupby(['DriverNumber', 'Stint'])
+        clean_groups = clean.groupby(['DriverNumber', 'Stint'])
+        self.stints = pandas.DataFrame({'Driver': stint_groups['Driver'].first(),
+                                        'Compound': stint_groups['Compound'].first(),
+                                        'Laps': stint_groups.size(),
+                                        'CleanLaps': clean_groups.size(),
+                                        'Pace': clean_groups['LapTime'].median(),
+                                        'Degradation': grouped_slope(clean, ['DriverNumber', 'Stint'],
+                                                                     'TyreLife', 'LapTime')})
+        self.stints['CleanLaps'] = self.stints['CleanLaps'].fillna(0).astype(int)
+
+        weights = self.stints['CleanLaps'].where(self.stints['Degradation'].notna(), 0)
+        weighted = (self.stints['Degradation'].fillna(0) * weights).groupby(level='DriverNumber').sum()
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            degradation = weighted / weights.groupby(level='DriverNumber').sum()
+        driver_groups = laps.groupby('DriverNumber')
+        clean_drivers = clean.groupby('DriverNumber')
+        self.drivers = pandas.DataFrame({'Driver': driver_groups['Driver'].first(),
+                                         'Pace': clean_drivers['LapTime'].median(),
+                                         'Best': driver_groups['LapTime'].min(),
+                                         'Consistency': clean_drivers['LapTime'].std(),
+                                         'Degradation': degradation,
+                                         'top_speed': clean_drivers['top_speed'].mean(),
+                                         'top_speed_trend': grouped_slope(clean, ['DriverNumber'],
+                                                                          'LapNumber', 'top_speed')})
+        self.drivers = self.drivers.sort_values('Pace')
+
+    def memory_usage(self) -> int:
+        return sum(int(frame.memory_usage(deep=True).sum()) for frame in [self.laps, self.stints, self.drivers])
+
+    def table(self, cars: list[str] | None = None, top: int | None = 10) -> pandas.DataFrame:
+        '''Gets the pace of many drivers, one row per driver
+        Args:
+            cars: (list[str]) [optional] drivers numbers in presentation order, by default ordered by pace
+            top: (int) [optional] maximum number of drivers, None for every driver
+        Returns:
+            pandas.DataFrame with the columns of the drivers attribute and a Stints column with the
+            compound, laps and degradation (s/lap) of each stint (e.g. "SOFT 12 +0.045 HARD 30 +0.012")'''
+        cars = [car for car in (cars if cars is not None else self.drivers.index) if car in self.drivers.index]
+        table = self.drivers.loc[cars[:top]].copy()
+        stints = self.stints.loc[table.index]
+        text = [f'{stint.Compound} {stint.Laps} {stint.Degradation:+.3f}' if pandas.notna(stint.Degradation)
+                else f'{stint.Compound} {stint.Laps}' for stint in stints.itertuples()]
+        table['Stints'] = pandas.Series(text, index=stints.index).groupby(level='DriverNumber').agg(' '.join)
+        return table
+
+    def summary(self, cars: list[str] | None = None, top: int | None = 10) -> str:
+        '''Creates a text summary of the pace of many drivers, one line per driver
+        Args:
+            cars: (list[str]) [optional] drivers numbers in presentation order, by default ordered by pace
+            top: (int) [optional] maximum number of drivers, None for every driver
+        Returns:
+            summary: string with pace, consistency, stints (compound, laps and degradation) and top speed of each driver'''
+        cars = [car for car in (cars if cars is not None else self.drivers.index) if car in self.drivers.index]
+        lines = []
+        for car in cars[:top]:
+            driver = self.drivers.loc[car]
+            stints = self.stints.loc[car]
+            stint_text = ', '.join(f'{stint.Compound} {stint.Laps} laps {stint.Degradation:+.3f}s/lap'
+                                   if pandas.notna(stint.Degradation) else f'{stint.Compound} {stint.Laps} laps'
+                                   for stint in stints.itertuples())
+            line = f'{driver.Driver}: pace {driver.Pace:.3f}s (std {driver.Consistency:.3f}s), stints {stint_text}'
+            if pandas.notna(driver.top_speed):
+                line += f', top speed {driver.top_speed:.1f}km/h ({driver.top_speed_trend:+.2f}km/h/lap)'
+            lines.append(line)
+        return '\n'.join(lines)
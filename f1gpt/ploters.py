@@ -1,109 +1,331 @@
-import datetime
+import concurrent.futures
+import copy
+import io
 
-from matplotlib import pyplot as plt
+import numpy
 import pandas
 
+from f1gpt.aligners import TelemetryAligner
 from f1gpt.connectors import F1Session
+from f1gpt.metrics import timed
+from f1gpt.sectors import MINI_SECTORS
+
+def lttb(x: numpy.ndarray, y: numpy.ndarray, threshold: int | None) -> tuple[numpy.ndarray, numpy.ndarray]:
+    '''Downsamples a line with the largest triangle three buckets (LTTB) algorithm,
+    which keeps the visual shape of the line (peaks and valleys)
+    Args:
+        x: (numpy.ndarray) x values, sorted
+        y: (numpy.ndarray) y values
+        threshold: (int) number of points to keep, None to keep all points
+    Returns:
+        x, y: downsampled numpy.ndarray'''
+    length = len(x)
+    if threshold is None or threshold >= length or threshold < 3:
+        return x, y
+    # first and last points are kept, the others are split in threshold - 2 buckets
+    edges = numpy.linspace(1, length - 1, threshold - 1).astype(int)
+    selected = numpy.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, length - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean()
+        area = numpy.abs((x[previous] - average_x) * (y[start:end] - y[previous]) -
+                         (x[previous] - x[start:end]) * (average_y - y[previous]))
+        previous = start + int(area.argmax())
+        selected[bucket + 1] = previous
+    return x[selected], y[selected]
+
+@timed('ploter.render_chart')
+def render_chart(chart: dict) -> bytes:
+    '''Renders a comparison chart (see Ploter.chart_data) with an explicit figure
+    on the Agg canvas, no pyplot state is used so it can run in many processes
+    Args:
+        chart: (dict) chart data
+    Returns:
+        png: bytes of the chart in png format'''
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    features = chart['features']
+    len_features = len(features)
+    font_size = 14
+
+    fig = Figure(figsize=(17, 6 * len_features))
+    FigureCanvasAgg(fig)
+    fig.set_facecolor('black')
+    ax = fig.subplots(len_features, squeeze=False)[:, 0]
+
+    for feature_index, (feature, lines) in enumerate(zip(features, chart['lines'])):
+        for x, y, label, color in lines:
+            ax[feature_index].plot(x, y, label=label, color=color)
+        ax[feature_index].set_ylabel('Time Gap' if feature == 'Time_Gap' else feature, fontsize=font_size)
+        ax[feature_index].tick_params(axis='both', labelsize = font_size, labelcolor='white')
+        ax[feature_index].set_facecolor('black')
+        if feature == 'Time_Gap' or feature_index == 1:
+            ax[feature_index].legend(fontsize=font_size)
+        ax[feature_index].grid(True, color='white')
+        ax[feature_index].xaxis.label.set_color('white')
+        ax[feature_index].yaxis.label.set_color('white')
+    ax[0].set_title(chart['title'], color='white', fontsize=20)
+    ax[-1].set_xlabel(chart['axis_x'], fontsize=font_size)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', facecolor='black')
+    fig.clear()
+    return buffer.getvalue()
+
+@timed('ploter.render_track_chart')
+def render_track_chart(chart: dict) -> bytes:
+    '''Renders a track map (see Ploter.sectors_chart_data) with an explicit figure on the Agg canvas
+    Args:
+        chart: (dict) chart data
+    Returns:
+        png: bytes of the chart in png format'''
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    font_size = 14
+
+    fig = Figure(figsize=(12, 12))
+    FigureCanvasAgg(fig)
+    fig.set_facecolor('black')
+    ax = fig.subplots()
+    labels = set()
+    for x, y, label, color in chart['segments']:
+        # each driver is added to the legend once
+        ax.plot(x, y, color=color, linewidth=6, solid_capstyle='butt',
+                label=None if label in labels else label)
+        labels.add(label)
+    ax.set_aspect('equal')
+    ax.axis('off')
+    ax.legend(fontsize=font_size, facecolor='black', labelcolor='white')
+    ax.set_title(chart['title'], color='white', fontsize=20)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', facecolor='black')
+    fig.clear()
+    return buffer.getvalue()
 
 class Ploter:
     '''Class to plot a comparison between two drivers
     Attributes:
         session: F1Session object (see f1gpt.connectors)
     Methods:
+        pair: get a Ploter of another pair of drivers of the same session
+        calculate_gap: calculate the time gap between the two drivers along the lap
+        chart_data: build the data of a comparison chart
         plot_comparison: plot a comparison between the two drivers
+        plot_many: plot many comparisons in parallel worker processes
+        sectors_chart_data: build the data of a track map colored by the fastest driver of each mini-sector
+        plot_sectors: plot the track map of the mini-sectors
         '''
     def __init__(self, 
                  session: F1Session) -> None:
+        self.session = session
         self.drivers = session.drivers
         self.location = session.event.Location
         self.name = session.session.name       
         self.telemetries = session.get_data()
         self.cars = session.top_2
+        self.gap = None
+
+    def pair(self, cars: list[str]) -> 'Ploter':
+        '''Gets a Ploter of another pair of drivers of the same session, the selected
+        drivers of the session are not changed and telemetries are shared with the session
+        args:
+            cars: (list[str]) numbers of the two drivers, the first one is the reference of the gap
+        Returns:
+            Ploter object'''
+        if list(cars) == list(self.cars):
+            return self
+        ploter = copy.copy(self)
+        ploter.cars = list(cars)
+        ploter.telemetries = [self.session.get_telemetry(car) for car in ploter.cars]
+        ploter.gap = None
+        return ploter
+
+    @timed('ploter.calculate_gap')
+    def calculate_gap(self, 
+                      window_size: int = 75,
+                      step: float = 4.0) -> pandas.DataFrame:
+        '''Calculates the time gap between the two drivers along the lap,
+        telemetries are shared with other consumers so they are not modified
+        args:
+            window_size: (int) [optional] size of the rolling window used to smooth the gap, in telemetry
+                         samples of both drivers (the same distance whatever the step of the grid)
+            step: (float) [optional] distance between grid points in meters
+        Returns:
+            gap: pandas.DataFrame with "Distance", "Time" (of the first driver) and "Time_Gap" columns'''
+        aligner = TelemetryAligner(self.telemetries, self.cars, step=step, channels=[])
+        # the window covers the distance of window_size samples of both telemetries merged by distance
+        samples = sum(len(telemetry) for telemetry in self.telemetries)
+        grid_window = max(1, round(window_size * len(aligner.distance) / samples))
+        gap = aligner.gap(self.cars[1], reference=self.cars[0], window_size=grid_window)
+        self.gap = pandas.DataFrame({'Distance': aligner.distance,
+                                     'Time': pandas.to_timedelta(aligner.time[0], unit='s'),
+                                     'Time_Gap': gap})
+        return self.gap
+    
+    @timed('ploter.chart_data')
+    def chart_data(self,
+                   axis_x: str = 'Distance',
+                   features: list[str] = ['Time_Gap', 'Speed', 'Throttle', 'Brake', 'nGear'],
+                   chart_range: list[int] = None,
+                   max_points: int | None = 2000) -> dict:
+        '''Builds the data of a comparison chart, plain numpy arrays that can be sent
+        to a worker process (see render_chart)
+        args:
+            axis_x: (str) x axis of the chart - either "Distance" or "Time" (in seconds)
+            features: (list[str]) of features to be plotted - possible feature ["Time_Gap", "Speed", "Throttle", "Brake", "nGear"]
+            chart_range: (list[int]) [optional] range of the chart - e.g. [0, 100] for the first 100 meters
+            max_points: (int) [optional] maximum number of points of each line (LTTB downsampling), None to keep all points
+        Returns:
+            chart: dictionary with "title", "axis_x", "features" and "lines" (list of lines of each feature) keys'''
+        if self.gap is None:
+            self.calculate_gap()
 
-    def calculate_gap(self, window_size: int = 75) -> pandas.DataFrame:
-        merged = pandas.merge(self.telemetries[0][['Distance', 'Speed', 'Time']], 
-                              self.telemetries[1][['Distance', 'Speed', 'Time']], 
-                              on='Distance', 
-                              how='outer',
-                              suffixes=[f'_{self.cars[0]}', f'_{self.cars[1]}'])
+        def x_values(frame: pandas.DataFrame) -> numpy.ndarray:
+            if axis_x == 'Time':
+                return frame['Time'].to_numpy(dtype='timedelta64[ns]').astype('int64') / 1e9
+            return frame[axis_x].to_numpy(dtype=float)
 
-        merged = merged.sort_values('Distance')
+        # every frame is filtered once per chart, not once per feature
+        frames = [self.gap] + list(self.telemetries)
+        x_list = [x_values(frame) for frame in frames]
+        if chart_range:
+            masks = [(x >= chart_range[0]) & (x <= chart_range[1]) for x in x_list]
+        else:
+            masks = [slice(None)] * len(frames)
 
-        merged.interpolate(inplace=True)
+        colors = []
+        for car_index, car in enumerate(self.cars):
+            # second driver of the same team is drawn in yellow
+            if car_index == 1 and (self.drivers[self.cars[0]]['team'] == self.drivers[self.cars[1]]['team']):
+                colors.append('yellow')
+            else:
+                colors.append(self.drivers[car]['color'])
 
-        merged['Time_Gap'] = merged[f'Time_{self.cars[1]}'] - merged[f'Time_{self.cars[0]}']
-        merged['Time_Gap'] = merged['Time_Gap'].apply(datetime.timedelta.total_seconds)
-        merged['Time_Gap'] = merged['Time_Gap'].rolling(window=window_size).mean()
-        merged['Time_Gap'] = merged['Time_Gap'].fillna(0)
-        
-        self.telemetries[0] = pandas.merge(self.telemetries[0], merged[['Distance', 'Time_Gap']], on='Distance', how='left')
-        
-    
+        lines = []
+        for feature in features:
+            if feature == 'Time_Gap':
+                x, y = x_list[0][masks[0]], self.gap['Time_Gap'].to_numpy(dtype=float)[masks[0]]
+                label = f'GAP: {self.drivers[self.cars[0]]["abv"]} vs {self.drivers[self.cars[1]]["abv"]}'
+                lines.append([(*lttb(x, y, max_points), label, 'white')])
+                continue
+            feature_lines = []
+            for car_index, car in enumerate(self.cars):
+                mask = masks[car_index + 1]
+                x = x_list[car_index + 1][mask]
+                y = self.telemetries[car_index][feature].to_numpy(dtype=float)[mask]
+                feature_lines.append((*lttb(x, y, max_points), self.drivers[car]['abv'], colors[car_index]))
+            lines.append(feature_lines)
+
+        return {'title': f'{self.name} fastest lap comparison by {axis_x}',
+                'axis_x': axis_x,
+                'features': list(features),
+                'lines': lines}
+
+    @timed('ploter.plot_comparison')
     def plot_comparison(self,
                         axis_x: str = 'Distance',
                         features: list[str] = ['Time_Gap', 'Speed', 'Throttle', 'Brake', 'nGear'],
                         chart_range: list[int] = None,
-                        save_png: bool = True) -> None :  
-        '''Plot a comparison between the two drivers
+                        save_png: bool = True,
+                        path: str = 'chart.png',
+                        max_points: int | None = 2000) -> bytes :  
+        '''Plot a comparison between the two drivers, rendered headless (Agg backend)
         args:
             axis_x: (str) x axis of the chart - either "Distance" or "Time"
             features: (list[str]) of features to be plotted - possible feature ["Time_Gap", "Speed", "Throttle", "Brake", "nGear"]
             chart_range: (list[int]) [optional] range of the chart - e.g. [0, 100] for the first 100 meters
             save_png: (bool) [optional] save the chart as a png file
+            path: (str) [optional] path of the png file
+            max_points: (int) [optional] maximum number of points of each line, None to keep all points
+        Returns:
+            png: bytes of the chart in png format'''
+        png = render_chart(self.chart_data(axis_x, features, chart_range, max_points))
+        if save_png:
+            with open(path, 'wb') as f:
+                f.write(png)
+        return png
+
+    @timed('ploter.plot_many')
+    def plot_many(self,
+                  charts: list[dict],
+                  max_workers: int | None = None) -> list[bytes]:
+        '''Plot many comparisons (e.g. one per corner or per driver pair) in parallel worker processes
+        args:
+            charts: (list[dict]) keyword arguments of chart_data of each chart, with an optional "cars" key
+                    (pair of drivers numbers, by default the selected drivers) and an optional "path" key
+                    to save the png file
+            max_workers: (int) [optional] maximum number of worker processes, by default the number of cores
+        Returns:
+            list with the png bytes of each chart'''
+        charts = [dict(chart) for chart in charts]
+        paths = [chart.pop('path', None) for chart in charts]
+        # one Ploter per pair, so the gap of a pair is calculated once for all its charts
+        pairs = {}
+        data = []
+        for chart in charts:
+            cars = tuple(chart.pop('cars', self.cars))
+            if cars not in pairs:
+                pairs[cars] = self.pair(cars)
+            data.append(pairs[cars].chart_data(**chart))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pngs = list(executor.map(render_chart, data))
+        for path, png in zip(paths, pngs):
+            if path:
+                with open(path, 'wb') as f:
+                    f.write(png)
+        return pngs
+
+    @timed('ploter.sectors_chart_data')
+    def sectors_chart_data(self, sectors: int = MINI_SECTORS) -> dict:
+        '''Builds the data of a track map with each mini-sector in the color of its fastest driver
+        args:
+            sectors: (int) [optional] number of mini-sectors
+        Returns:
+            chart: dictionary with "title" and "segments" (x, y, label and color of each mini-sector) keys'''
+        mini_sectors = self.session.get_mini_sectors(sectors)
+        track = self.session.get_track()
+        # boundaries are fractions of the lap, mapped on the reference line of the track map
+        fractions = mini_sectors.boundaries / mini_sectors.boundaries[-1]
+        boundaries = track.distance[0] + fractions * (track.distance[-1] - track.distance[0])
+        positions = numpy.searchsorted(track.distance, boundaries)
+
+        colors = {}
+        for car in dict.fromkeys(mini_sectors.cars[index] for index in mini_sectors.fastest):
+            color = self.drivers[car]['color']
+            # team mates share a color, the other winners are drawn in yellow and white
+            if color in colors.values():
+                color = next(other for other in ['yellow', 'white', 'grey'] if other not in colors.values())
+            colors[car] = color
+
+        segments = []
+        for sector, winner in enumerate(mini_sectors.fastest):
+            car = mini_sectors.cars[winner]
+            points = slice(positions[sector], positions[sector + 1] + 1)
+            segments.append((track.x[points], track.y[points], self.drivers[car]['abv'], colors[car]))
+        return {'title': f'{self.name} fastest driver of {sectors} mini-sectors',
+                'segments': segments}
+
+    @timed('ploter.plot_sectors')
+    def plot_sectors(self,
+                     sectors: int = MINI_SECTORS,
+                     save_png: bool = True,
+                     path: str = 'sectors.png') -> bytes:
+        '''Plot the track map colored by the fastest driver of each mini-sector, rendered headless (Agg backend)
+        args:
+            sectors: (int) [optional] number of mini-sectors
+            save_png: (bool) [optional] save the chart as a png file
+            path: (str) [optional] path of the png file
         Returns:
-            None'''
-        
-        len_features = len(features)
-        font_size = 14
-        self.calculate_gap()
-        
-        fig, ax = plt.subplots(len_features, figsize=(17,6 * len_features))
-        fig.set_facecolor('black')
-        
-        if 'Time_Gap' in features:
-            telemetry = self.telemetries[0]
-            if chart_range:
-                telemetry = telemetry[telemetry[axis_x].between(chart_range[0],chart_range[1])]
-            ax[0].plot(telemetry[axis_x], 
-                    telemetry['Time_Gap'], 
-                    label = f'GAP: {self.drivers[self.cars[0]]["abv"]} vs {self.drivers[self.cars[1]]["abv"]}',
-                    color = 'white')
-            ax[0].set_ylabel('Time Gap', fontsize=font_size)
-            ax[0].xaxis.label.set_color('white')
-            ax[0].yaxis.label.set_color('white')
-            ax[0].legend(fontsize=font_size)
-            ax[0].set_title(f'{self.name} fastest lap comparison by {axis_x}', color='white', fontsize=20)
-            ax[0].tick_params(axis='both', labelsize = font_size, labelcolor='white')
-            ax[0].set_facecolor('black')
-            ax[0].grid(True, color='white')
-            
-        for feature_index in range(len_features):
-            feature = features[feature_index]
-            if feature == 'Time_Gap': continue
-            for car_index in range(len(self.cars)):
-                telemetry = self.telemetries[car_index]
-                if chart_range:
-                    telemetry = telemetry[telemetry[axis_x].between(chart_range[0],chart_range[1])]
-                car = self.cars[car_index]
-                # define chart line color    
-                if car_index == 1 and (self.drivers[self.cars[0]]['team'] == self.drivers[self.cars[1]]['team']):
-                    color = 'yellow'
-                else:
-                    color = self.drivers[car]['color']
-                ax[feature_index].plot(telemetry[axis_x], 
-                                    telemetry[feature], 
-                                    label=self.drivers[car]['abv'],
-                                    color=color)
-                ax[feature_index].set_ylabel(feature, fontsize=font_size, )
-                ax[feature_index].tick_params(axis='both', labelsize = font_size,  labelcolor='white')
-                ax[feature_index].set_facecolor('black')
-                if feature_index == 1:
-                    ax[feature_index].legend(fontsize=font_size)
-                if feature_index == len_features - 1:
-                    ax[feature_index].set_xlabel(axis_x, fontsize=font_size)
-                    ax[feature_index].tick_params(axis='x', labelsize = font_size)
-                ax[feature_index].grid(True, color='white')
-                ax[feature_index].xaxis.label.set_color('white')
-                ax[feature_index].yaxis.label.set_color('white')
-
-        if save_png: fig.savefig('chart.png', bbox_inches='tight', facecolor='black')
+            png: bytes of the chart in png format'''
+        png = render_track_chart(self.sectors_chart_data(sectors))
+        if save_png:
+            with open(path, 'wb') as f:
+                f.write(png)
+        return png
@@ -1,10 +1,17 @@
+import asyncio
+import functools
 import os
+import time
+from typing import TYPE_CHECKING
 
-from langchain.chat_models import AzureChatOpenAI
-from langchain.prompts.chat import (
-    ChatPromptTemplate,
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate)
+if TYPE_CHECKING:
+    from langchain.chat_models import AzureChatOpenAI
+    from langchain.prompts.chat import ChatPromptTemplate
+    from langchain.schema import AIMessage, BaseMessage
+
+# langchain is only imported when a prompt or the model is first used, so importing
+# this module is cheap. event_prompt, race_prompt, range_prompt, sectors_prompt,
+# session_prompt and model are still available as module attributes (see __getattr__)
 
 API_BASE = "https://eastus.api.cognitive.microsoft.com/"
 API_DEPLOYMENT = "gpt-testopenai-dev-eastus-001"
@@ -12,18 +19,23 @@ API_KEY = os.getenv("OPENAI_API_KEY")
 API_TYPE = "azure"
 API_VERSION = "2023-03-15-preview"
 
-templates_list = ['event_briefing.txt', 'race_briefing.txt', 
-                  'range_briefing.txt', 'session_briefing.txt']
+templates_list = ['event_briefing.txt', 'race_briefing.txt',
+                  'range_briefing.txt', 'sectors_briefing.txt', 'session_briefing.txt']
 
-templates_path = 'prompts/'
+templates_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prompts/')
 
-def create_prompt(file_name: str) -> ChatPromptTemplate:
+def create_prompt(file_name: str) -> 'ChatPromptTemplate':
     '''Creates a ChatPromptTemplate from a file
     Args:
         file_name: (str) name of the file to read
     Returns:
         ChatPromptTemplate object
         '''
+    from langchain.prompts.chat import (
+        ChatPromptTemplate,
+        SystemMessagePromptTemplate,
+        HumanMessagePromptTemplate)
+
     with open(file_name) as f:
         template = f.read()
 
@@ -33,14 +45,60 @@ def create_prompt(file_name: str) -> ChatPromptTemplate:
         SystemMessagePromptTemplate.from_template(system_message),
         HumanMessagePromptTemplate.from_template(user_message)])
 
-event_prompt = create_prompt(templates_path + templates_list[0])
-race_prompt = create_prompt(templates_path + templates_list[1])
-range_prompt = create_prompt(templates_path + templates_list[2])
-session_prompt = create_prompt(templates_path + templates_list[3])
-
-model = AzureChatOpenAI(openai_api_base=API_BASE,
-                        deployment_name=API_DEPLOYMENT,
-                        openai_api_key=API_KEY,
-                        openai_api_type=API_TYPE,
-                        openai_api_version=API_VERSION,
-                        temperature=0.95)
\ No newline at end of file
+@functools.lru_cache(maxsize=None)
+def get_prompt(name: str) -> 'ChatPromptTemplate':
+    '''Gets a prompt by name, the template file is read only once
+    Args:
+        name: (str) name of the prompt (e.g. "event" for prompts/event_briefing.txt)
+    Returns:
+        ChatPromptTemplate object'''
+    return create_prompt(templates_path + f'{name}_briefing.txt')
+
+@functools.lru_cache(maxsize=None)
+def get_model() -> 'AzureChatOpenAI':
+    '''Gets the Azure OpenAI chat model, created only once
+    Returns:
+        AzureChatOpenAI object'''
+    from langchain.chat_models import AzureChatOpenAI
+
+    return AzureChatOpenAI(openai_api_base=API_BASE,
+                           deployment_name=API_DEPLOYMENT,
+                           openai_api_key=API_KEY,
+                           openai_api_type=API_TYPE,
+                           openai_api_version=API_VERSION,
+                           temperature=0.95)
+
+class StubModel:
+    '''Local chat model that answers without calling any API, to run skills offline
+    Attributes:
+        delay: simulated latency of each call in seconds
+        deployment_name: name of the (fake) deployment
+        temperature: temperature of the (fake) model
+    Methods:
+        predict_messages: returns the last message prefixed by "[stub]"
+        apredict_messages: async version of predict_messages
+        '''
+    def __init__(self, delay: float = 0.0, deployment_name: str = 'stub', temperature: float = 0.0) -> None:
+        self.delay = delay
+        self.deployment_name = deployment_name
+        self.temperature = temperature
+
+    def _respond(self, messages: list['BaseMessage']) -> 'AIMessage':
+        from langchain.schema import AIMessage
+
+        return AIMessage(content=f'[stub] {messages[-1].content}')
+
+    def predict_messages(self, messages: list['BaseMessage']) -> 'AIMessage':
+        time.sleep(self.delay)
+        return self._respond(messages)
+
+    async def apredict_messages(self, messages: list['BaseMessage']) -> 'AIMessage':
+        await asyncio.sleep(self.delay)
+        return self._respond(messages)
+
+def __getattr__(name: str):
+    if name in ('event_prompt', 'race_prompt', 'range_prompt', 'sectors_prompt', 'session_prompt'):
+        return get_prompt(name[:-len('_prompt')])
+    if name == 'model':
+        return get_model()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
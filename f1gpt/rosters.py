@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+
+import numpy
+import pandas
+
+# Rosters are built per year and event from the session results, each driver is a
+# dictionary with "number", "name", "color", "abv" and "team" keys. Built rosters are
+# cached as JSON files (<path>/<year>/<event>.json) and manual overrides by driver
+# number are applied on top of them (e.g. a different color for a team mate). Sessions of
+# an event share the roster, drivers missing from it (e.g. a reserve driver in FP1) are
+# added from the results of the session where they appear.
+
+ROSTERS_PATH = 'rosters'
+DEFAULT_COLOR = '#FFFFFF'
+# {driver number: {field: value}} applied to every roster
+OVERRIDES = {}
+
+class DriversAttribute:
+    '''Class to store the drivers data, indexed by number and abbreviation
+    Attributes:
+        items: list with the data of each driver
+        table: pandas.DataFrame with the drivers data indexed by number
+    Methods:
+        __getitem__: get the data of a driver by "number" key (str)
+        by_abv: get the data of a driver by abbreviation
+        map: get a field of many drivers at once
+        '''
+    def __init__(self, data: list[dict[str]]) -> None:
+        '''Creates a DriversAttribute object
+        Args:
+            data: (list[dict[str]]) list with the data of each driver
+        Returns:
+            None'''
+        self.items = data
+        self._by_number = {item['number']: item for item in self.items}
+        self._by_abv = {item['abv']: item for item in self.items}
+        self.table = pandas.DataFrame(self.items, columns=['number', 'name', 'color', 'abv', 'team']).set_index('number')
+
+    def __getitem__(self, key: str) -> dict[str]:
+        if not isinstance(key, str):
+            raise TypeError('Key must be a string')
+        try:
+            return self._by_number[key]
+        except KeyError:
+            raise KeyError(f'Unknown driver number {key}') from None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._by_number
+
+    def by_abv(self, abv: str) -> dict[str]:
+        return self._by_abv[abv]
+
+    def map(self, numbers, field: str = 'name') -> numpy.ndarray:
+        '''Gets a field of many drivers at once
+        Args:
+            numbers: (array like) drivers numbers (e.g. fastest_lap.index or laps["DriverNumber"])
+            field: (str) [optional] "name", "color", "abv" or "team"
+        Returns:
+            numpy.ndarray with the field of each driver, the driver number for unknown numbers'''
+        numbers = numpy.asarray(numbers, dtype=str)
+        values = self.table[field].reindex(numbers).to_numpy(dtype=object)
+        missing = pandas.isna(values)
+        values[missing] = numbers[missing]
+        return values
+
+def roster_from_results(results: pandas.DataFrame, overrides: dict[str, dict] = OVERRIDES) -> list[dict[str]]:
+    '''Builds the drivers data of a session from its results
+    Args:
+        results: (pandas.DataFrame) fastf1 session results, with "DriverNumber", "FullName",
+                 "Abbreviation", "TeamName" and "TeamColor" columns
+        overrides: (dict[str, dict]) [optional] fields to be replaced by driver number
+    Returns:
+        list with the data of each driver'''
+    def column(name: str, default: str) -> pandas.Series:
+        if name not in results.columns:
+            return pandas.Series(default, index=results.index)
+        return results[name].where(results[name].notna() & (results[name] != ''), default)
+
+    numbers = results['DriverNumber'].astype(str)
+    colors = column('TeamColor', DEFAULT_COLOR[1:]).astype(str).str.lstrip('#')
+    frame = pandas.DataFrame({'number': numbers,
+                              'name': column('FullName', None).fillna(numbers),
+                              'color': '#' + colors.str.upper(),
+                              'abv': column('Abbreviation', None).fillna(numbers),
+                              'team': column('TeamName', '')})
+    items = frame.to_dict('records')
+    for item in items:
+        item.update(overrides.get(item['number'], {}))
+    return items
+
+def roster_path(year: int, event: str, path: str = ROSTERS_PATH) -> str:
+    from f1gpt.stores import slugify
+
+    return os.path.join(path, str(year), f'{slugify(event)}.json')
+
+_rosters = {}
+# guards _rosters and the cached files, sessions of an event can be opened by concurrent requests
+_lock = threading.Lock()
+
+def get_roster(year: int,
+               event: str,
+               results: pandas.DataFrame | None = None,
+               path: str = ROSTERS_PATH,
+               overrides: dict[str, dict] = OVERRIDES) -> DriversAttribute:
+    '''Gets the roster of an event, from memory, from the local cached copy or built from the results,
+    drivers of the results missing from the roster are added to it (and to the cached copy)
+    Args:
+        year: (int) year of the event
+        event: (str) name of the event
+        results: (pandas.DataFrame) [optional] session results, needed when the roster is not cached
+        path: (str) [optional] root directory of the cached rosters
+        overrides: (dict[str, dict]) [optional] fields to be replaced by driver number
+    Returns:
+        DriversAttribute object'''
+    file_path = roster_path(year, event, path)
+    with _lock:
+        if file_path not in _rosters:
+            if os.path.exists(file_path):
+                with open(file_path, encoding='utf-8') as f:
+                    _rosters[file_path] = json.load(f)
+            elif results is None:
+                raise FileNotFoundError(f'No roster for {year} {event} in {path} and no results to build it')
+            else:
+                _rosters[file_path] = []
+        if results is not None and len(results):
+            known = {item['number'] for item in _rosters[file_path]}
+            missing = ~results['DriverNumber'].astype(str).isin(known)
+            if missing.any():
+                _rosters[file_path] = _rosters[file_path] + roster_from_results(results[missing], overrides={})
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(_rosters[file_path], f, indent=4, ensure_ascii=False)
+        items = _rosters[file_path]
+    # overrides are applied on every call, so they can change without rebuilding the cached copy
+    return DriversAttribute([{**item, **overrides.get(item['number'], {})} for item in items])
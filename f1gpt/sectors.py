@@ -0,0 +1,131 @@
+import numpy
+import pandas
+
+from f1gpt.compactors import TelemetryArrays
+
+# Mini-sector dominance of the whole field. The fastest lap of every driver is split in
+# mini-sectors by fraction of its own lap distance (laps differ by a few meters), and the
+# time of every driver at every boundary is found with a single searchsorted over the
+# samples of all laps one after another (see TelemetryArrays), linear in the total samples.
+
+MINI_SECTORS = 25
+
+def boundary_times(offsets: numpy.ndarray,
+                   distance: numpy.ndarray,
+                   time: numpy.ndarray,
+                   fractions: numpy.ndarray) -> numpy.ndarray:
+    '''Interpolates the time of many laps at fractions of their distance, in one pass over every sample
+    Args:
+        offsets: (numpy.ndarray) first sample of each lap and the total number of samples
+        distance: (numpy.ndarray) distance of each sample, sorted inside each lap
+        time: (numpy.ndarray) lap time of each sample in seconds
+        fractions: (numpy.ndarray) sorted fractions of the lap distance (0 is the first and 1 the last sample)
+    Returns:
+        numpy.ndarray (laps x fractions) with the time of each lap at each fraction, numpy.nan for
+        the laps with less than 2 samples'''
+    laps = len(offsets) - 1
+    lengths = numpy.diff(offsets)
+    if not len(distance):
+        return numpy.full((laps, len(fractions)), numpy.nan)
+    lap = numpy.repeat(numpy.arange(laps), lengths)
+    # laps without samples would read out of the arrays, their times are discarded below
+    first = distance[offsets[:-1].clip(max=len(distance) - 1)]
+    span = distance[(offsets[1:] - 1).clip(min=0)] - first
+    span = numpy.where(span > 0, span, 1)
+    # laps are 2 apart in the key, so the key is sorted over all laps and laps never touch
+    key = 2 * lap + (distance - first[lap]) / span[lap]
+    targets = (2 * numpy.arange(laps)[:, None] + numpy.asarray(fractions)[None, :]).ravel()
+    target_lap = numpy.repeat(numpy.arange(laps), len(fractions))
+    right = numpy.searchsorted(key, targets, side='left')
+    right = right.clip(offsets[:-1][target_lap] + 1, offsets[1:][target_lap] - 1)
+    left = right - 1
+    width = key[right] - key[left]
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        weight = numpy.where(width > 0, (targets - key[left]) / width, 0.0).clip(0, 1)
+    times = (time[left] + weight * (time[right] - time[left])).reshape(laps, len(fractions))
+    # a lap needs two samples to interpolate, otherwise its neighbours are samples of other laps
+    times[lengths < 2] = numpy.nan
+    return times
+
+class MiniSectors:
+    '''Class to compare the fastest lap of many drivers mini-sector by mini-sector
+    Attributes:
+        cars: list of the drivers numbers
+        boundaries: numpy.ndarray with the distance of the boundaries of the mini-sectors in meters (mean lap)
+        times: numpy.ndarray (drivers x sectors) with the time of each driver through each mini-sector in seconds
+               (numpy.nan for the drivers without telemetry of their lap)
+        best: numpy.ndarray with the best time of each mini-sector
+        fastest: numpy.ndarray with the position (in cars) of the fastest driver of each mini-sector
+        theoretical_best: sum of the best time of each mini-sector in seconds
+    Methods:
+        from_arrays: create a MiniSectors object from the telemetry of many laps
+        dominance: mini-sectors won and time lost to the best mini-sectors by driver
+        leaders: runs of consecutive mini-sectors won by the same driver
+        summary: text summary of the dominance of many drivers
+        '''
+    def __init__(self, cars: list[str], boundaries: numpy.ndarray, times: numpy.ndarray) -> None:
+        '''Creates a MiniSectors object
+        Args:
+            cars: (list[str]) drivers numbers
+            boundaries: (numpy.ndarray) distance of the boundaries of the mini-sectors in meters
+            times: (numpy.ndarray) drivers x sectors array with the time through each mini-sector
+        Returns:
+            None'''
+        self.cars = list(cars)
+        self.boundaries = boundaries
+        self.times = times
+        # drivers without times never win a mini-sector
+        self.fastest = numpy.where(numpy.isnan(times), numpy.inf, times).argmin(axis=0)
+        self.best = times[self.fastest, numpy.arange(times.shape[1])]
+        self.theoretical_best = float(self.best.sum())
+
+    @classmethod
+    def from_arrays(cls, arrays: TelemetryArrays, sectors: int = MINI_SECTORS) -> 'MiniSectors':
+        '''Creates a MiniSectors object
+        Args:
+            arrays: (TelemetryArrays) telemetry of one lap per driver with (driver, lap) keys and
+                    "Distance" and "Time" channels (see F1Session.get_telemetry_arrays)
+            sectors: (int) [optional] number of mini-sectors
+        Returns:
+            MiniSectors object'''
+        distance = arrays.channels['Distance'].astype(float)
+        time = arrays.channels['Time'].astype('timedelta64[ns]').astype('int64') / 1e9
+        fractions = numpy.linspace(0, 1, sectors + 1)
+        times = numpy.diff(boundary_times(arrays.offsets, distance, time, fractions), axis=1)
+        complete = numpy.diff(arrays.offsets) > 1
+        lap_length = (distance[arrays.offsets[1:][complete] - 1] - distance[arrays.offsets[:-1][complete]]).mean()
+        return cls([key[0] for key in arrays.keys], fractions * lap_length, times)
+
+    def dominance(self) -> pandas.DataFrame:
+        '''Gets the mini-sectors won by each driver
+        Returns:
+            pandas.DataFrame indexed by driver number (most mini-sectors first) with Sectors (number of
+            mini-sectors won), Lap (sum of the mini-sectors) and Loss (time lost to the best mini-sectors) columns'''
+        lap = self.times.sum(axis=1)
+        table = pandas.DataFrame({'Sectors': numpy.bincount(self.fastest, minlength=len(self.cars)),
+                                  'Lap': lap,
+                                  'Loss': lap - self.theoretical_best},
+                                 index=pandas.Index(self.cars, name='DriverNumber'))
+        return table.sort_values(['Sectors', 'Lap'], ascending=[False, True])
+
+    def leaders(self) -> list[tuple[float, float, str]]:
+        '''Gets the runs of consecutive mini-sectors won by the same driver
+        Returns:
+            list of (start, end, driver number) tuples in lap order, distances in meters'''
+        changes = numpy.flatnonzero(numpy.diff(self.fastest)) + 1
+        starts = numpy.concatenate([[0], changes])
+        ends = numpy.concatenate([changes, [len(self.fastest)]])
+        return [(float(self.boundaries[start]), float(self.boundaries[end]), self.cars[self.fastest[start]])
+                for start, end in zip(starts, ends)]
+
+    def summary(self, drivers, top: int | None = 5) -> str:
+        '''Creates a text summary of the mini-sectors won by the drivers, one line per driver
+        Args:
+            drivers: (DriversAttribute) drivers data (see f1gpt.rosters)
+            top: (int) [optional] maximum number of drivers, None for every driver
+        Returns:
+            summary: string with the mini-sectors won and the time lost to the best mini-sectors of each driver'''
+        table = self.dominance().dropna(subset=['Lap'])
+        lines = [f'{drivers[row.Index]["name"]}: {row.Sectors} mini-sectors, {row.Loss:.3f}s slower than the theoretical best'
+                 for row in table.iloc[:top].itertuples()]
+        return '\n'.join(lines)
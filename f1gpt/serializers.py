@@ -0,0 +1,108 @@
+import datetime
+
+import numpy
+import pandas
+
+from f1gpt.metrics import count_tokens, recorder
+
+# Compact payloads of the briefings. Tables are sent as one line per row with values split
+# by SEPARATOR under a header of abbreviated keys, numbers are rounded to a fixed precision
+# (trailing zeros dropped) and only the columns used by the prompt are kept. Rows are sent
+# most important first, so a token budget is met by dropping rows from the end. The tokens
+# of each payload are counted in the metrics recorder ("payload_tokens.<name>" counters).
+
+SEPARATOR = '|'
+MISSING = '-'
+PRECISION = 3
+# token budget of each payload by name, None (or a missing name) for no budget
+TOKEN_BUDGETS = {'race.results': 250,
+                 'race.pace': 350,
+                 'range.comparison': 200,
+                 'sectors.dominance': 150}
+
+def format_value(value, precision: int = PRECISION) -> str:
+    '''Formats a value of a payload
+    Args:
+        value: value to be formatted (number, bool, string, timedelta or missing value)
+        precision: (int) [optional] decimal places of numbers (trailing zeros are dropped)
+    Returns:
+        string with the value, timedeltas in seconds and missing values as MISSING'''
+    if value is None or (not isinstance(value, str) and pandas.isna(value)):
+        return MISSING
+    if isinstance(value, (bool, numpy.bool_)):
+        return 'Y' if value else 'N'
+    if isinstance(value, (datetime.timedelta, numpy.timedelta64)):
+        value = pandas.Timedelta(value).total_seconds()
+    if isinstance(value, (float, numpy.floating)):
+        text = f'{value:.{precision}f}'
+        text = text.rstrip('0').rstrip('.') if '.' in text else text
+        return '0' if text == '-0' else text
+    return str(value).replace(SEPARATOR, '/').replace('\n', ' ')
+
+def table_lines(frame: pandas.DataFrame,
+                columns: dict[str, str],
+                precision: int | dict[str, int] = PRECISION) -> list[str]:
+    '''Converts a table into payload lines
+    Args:
+        frame: (pandas.DataFrame) table with rows in order of importance
+        columns: (dict[str, str]) abbreviated key of each column to be kept, in presentation order
+                 (missing columns are skipped)
+        precision: (int | dict[str, int]) [optional] decimal places of numbers, by column
+    Returns:
+        list with the header line and one line per row'''
+    columns = {column: key for column, key in columns.items() if column in frame.columns}
+    if not isinstance(precision, dict):
+        precision = {column: precision for column in columns}
+    values = [[format_value(value, precision.get(column, PRECISION)) for value in frame[column]]
+              for column in columns]
+    return [SEPARATOR.join(columns.values())] + [SEPARATOR.join(row) for row in zip(*values)]
+
+def fit_lines(lines: list[str], budget: int | None, keep: int = 0) -> list[str]:
+    '''Keeps the first lines that fit in a token budget
+    Args:
+        lines: (list[str]) lines in order of importance
+        budget: (int) maximum number of tokens, None to keep every line
+        keep: (int) [optional] number of first lines always kept (e.g. 1 for a header)
+    Returns:
+        list with the kept lines'''
+    if budget is None:
+        return list(lines)
+    total = 0
+    for position, line in enumerate(lines):
+        # each line break is counted as one token
+        total += count_tokens(line) + 1
+        if total > budget and position >= keep:
+            return list(lines[:position])
+    return list(lines)
+
+def serialize_lines(name: str, lines: list[str], budget: int | None = None, keep: int = 0) -> str:
+    '''Joins payload lines within the token budget of the payload and counts its tokens
+    Args:
+        name: (str) name of the payload (e.g. "race.results"), key of TOKEN_BUDGETS and of the counters
+        lines: (list[str]) lines in order of importance
+        budget: (int) [optional] maximum number of tokens, by default TOKEN_BUDGETS[name]
+        keep: (int) [optional] number of first lines always kept
+    Returns:
+        payload text'''
+    kept = fit_lines(lines, TOKEN_BUDGETS.get(name) if budget is None else budget, keep)
+    text = '\n'.join(kept)
+    recorder.count(f'payload_tokens.{name}', count_tokens(text))
+    if len(kept) < len(lines):
+        recorder.count(f'payload_trimmed_rows.{name}', len(lines) - len(kept))
+    return text
+
+def serialize_table(name: str,
+                    frame: pandas.DataFrame,
+                    columns: dict[str, str],
+                    precision: int | dict[str, int] = PRECISION,
+                    budget: int | None = None) -> str:
+    '''Serializes a table into a compact payload (see table_lines and serialize_lines)
+    Args:
+        name: (str) name of the payload (e.g. "race.results")
+        frame: (pandas.DataFrame) table with rows in order of importance
+        columns: (dict[str, str]) abbreviated key of each column to be kept
+        precision: (int | dict[str, int]) [optional] decimal places of numbers, by column
+        budget: (int) [optional] maximum number of tokens, by default TOKEN_BUDGETS[name]
+    Returns:
+        payload text, the header, the first row and the next rows that fit in the budget'''
+    return serialize_lines(name, table_lines(frame, columns, precision), budget, keep=2)
@@ -0,0 +1,268 @@
+import collections
+import concurrent.futures
+import contextlib
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+
+from f1gpt import skills
+from f1gpt.metrics import recorder, span
+
+# Service mode: a local HTTP server exposing the skills, run with python main.py serve [port]
+# Sessions are kept warm in an LRU cache, so a follow-up request on the same session (e.g.
+# another corner) reuses its loaded laps, telemetry and indexes. Endpoints (GET, query string):
+#   /event?event=Suzuka&year=2023
+#   /session?event=Suzuka&session=4&year=2023
+#   /race?event=Suzuka&year=2023
+#   /range?event=Suzuka&session=4&start=5550&end=5750&turn=chincane
+#   /range?event=Suzuka&session=4  (corner detected in the track map)
+#   /sectors?event=Suzuka&session=4
+#   /chart?event=Suzuka&session=4&start=5550&end=5750&features=Speed,Brake,Throttle  (png)
+#   /stats
+
+class SessionCache:
+    '''Class to keep recently used sessions in memory, least recently used sessions are
+    dropped when the memory of the cached sessions is above max_bytes
+    Attributes:
+        max_bytes: memory cap of the cached sessions (see F1Session.memory_usage)
+        factory: function that creates a session from (event_name, session_number, year=year)
+        hits: number of requests served by a cached (or loading) session
+        misses: number of sessions loaded
+    Methods:
+        session: context manager that yields a session, loaded only once for concurrent requests
+        stats: get the cache state
+        '''
+    def __init__(self, max_bytes: int = 512 * 2 ** 20, factory=skills.create_session) -> None:
+        '''Creates a SessionCache object
+        Args:
+            max_bytes: (int) [optional] memory cap of the cached sessions, the last used session is always kept
+            factory: (callable) [optional] function that creates a session (by default skills.create_session)
+        Returns:
+            None'''
+        self.max_bytes = max_bytes
+        self.factory = factory
+        self.hits = 0
+        self.misses = 0
+        # key -> [session, lock, memory in bytes]
+        self._sessions = collections.OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple) -> list:
+        with self._lock:
+            if key in self._sessions:
+                self._sessions.move_to_end(key)
+                self.hits += 1
+                return self._sessions[key]
+            future = self._loading.get(key)
+            loader = future is None
+            if loader:
+                future = concurrent.futures.Future()
+                self._loading[key] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not loader:
+            # concurrent requests of a loading session wait for the same load
+            return future.result()
+        try:
+            session = self.factory(key[0], key[1], year=key[2])
+            # laps and the ranking are loaded once here, not by the first request of each skill
+            session.get_cars()
+            entry = [session, threading.Lock(), session.memory_usage()]
+        except Exception as error:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(error)
+            raise
+        with self._lock:
+            del self._loading[key]
+            self._sessions[key] = entry
+            self._evict()
+        future.set_result(entry)
+        return entry
+
+    def _evict(self) -> None:
+        size = sum(entry[2] for entry in self._sessions.values())
+        while size > self.max_bytes and len(self._sessions) > 1:
+            _, entry = self._sessions.popitem(last=False)
+            size -= entry[2]
+
+    @contextlib.contextmanager
+    def session(self, event_name: str, session_number: int, year: int = 2023):
+        '''Gets a session, requests of the same session run one at a time
+        Args:
+            event_name: (str) name of the event (e.g. "Suzuka")
+            session_number: (int) number of the session (e.g. 4 for Q, 5 for R)
+            year: (int) [optional] year of the event
+        Returns:
+            context manager yielding the F1Session object'''
+        key = (event_name, int(session_number), int(year))
+        entry = self._get(key)
+        with entry[1]:
+            yield entry[0]
+            # derived data (telemetries, indexes) grows the session after each request
+            memory = entry[0].memory_usage()
+        with self._lock:
+            entry[2] = memory
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'sessions': [list(key) for key in self._sessions],
+                    'bytes': sum(entry[2] for entry in self._sessions.values()),
+                    'max_bytes': self.max_bytes,
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+class SkillService:
+    '''Class to serve the skills, independent of the transport (see serve)
+    Attributes:
+        llm_factory: function that creates the chat model (see skills.create_llm), called by the
+                     first request that needs the model, so data only requests never import langchain
+        sessions: SessionCache object
+    Methods:
+        handle: handle a request
+        llm: get the chat model, created on first use
+        '''
+    def __init__(self, llm_factory, sessions: SessionCache | None = None) -> None:
+        self.llm_factory = llm_factory
+        self.sessions = sessions or SessionCache()
+        self._llm = None
+        self._llm_lock = threading.Lock()
+        self.routes = {'event': self.event,
+                       'session': self.session,
+                       'race': self.race,
+                       'range': self.range,
+                       'sectors': self.sectors,
+                       'chart': self.chart,
+                       'stats': self.stats}
+
+    def handle(self, path: str, params: dict[str, str]) -> tuple[int, str, bytes]:
+        '''Handles a request
+        Args:
+            path: (str) path of the request (e.g. "/range")
+            params: (dict[str, str]) query parameters
+        Returns:
+            (status code, content type, body) tuple, errors are returned as JSON with an "error" key'''
+        route = path.strip('/')
+        if route not in self.routes:
+            return self._error(404, f'Unknown endpoint /{route}, use one of {sorted(self.routes)}')
+        start = time.perf_counter()
+        try:
+            with span(f'server.{route}'):
+                result = self.routes[route](params)
+        except KeyError as error:
+            return self._error(400, f'Missing or unknown parameter {error}')
+        except ValueError as error:
+            return self._error(400, str(error))
+        except Exception as error:
+            return self._error(500, repr(error))
+        if isinstance(result, bytes):
+            return 200, 'image/png', result
+        result['seconds'] = round(time.perf_counter() - start, 4)
+        return 200, 'application/json', json.dumps(result, default=str).encode('utf-8')
+
+    def _error(self, status: int, message: str) -> tuple[int, str, bytes]:
+        return status, 'application/json', json.dumps({'error': message}).encode('utf-8')
+
+    def llm(self):
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None:
+                    self._llm = self.llm_factory()
+        return self._llm
+
+    def _predict(self, skill: str, messages: list) -> dict:
+        # the model is called outside the session lock
+        return {'skill': skill, 'text': self.llm().predict_messages(messages).content}
+
+    def _session(self, params: dict[str, str], session_number: int | None = None):
+        return self.sessions.session(params['event'],
+                                     session_number or int(params['session']),
+                                     int(params.get('year', 2023)))
+
+    def event(self, params: dict[str, str]) -> dict:
+        return self._predict('event', skills.event_messages(params['event'], int(params.get('year', 2023))))
+
+    def session(self, params: dict[str, str]) -> dict:
+        with self._session(params) as session:
+            messages = skills.session_messages(session)
+        return self._predict('session', messages)
+
+    def race(self, params: dict[str, str]) -> dict:
+        with self._session(params, session_number=5) as session:
+            messages = skills.race_messages(session)
+        return self._predict('race', messages)
+
+    def range(self, params: dict[str, str]) -> dict:
+        # without start and end the corner where the two fastest drivers differ the most is used
+        chart_range = [int(params['start']), int(params['end'])] if 'start' in params else None
+        with self._session(params) as session:
+            messages = skills.range_messages(session, chart_range, params.get('turn'))
+        return self._predict('range', messages)
+
+    def sectors(self, params: dict[str, str]) -> dict:
+        with self._session(params) as session:
+            # without sectors the default number of mini-sectors is used (see f1gpt.sectors)
+            messages = skills.sectors_messages(session, int(params['sectors']) if 'sectors' in params else None)
+        return self._predict('sectors', messages)
+
+    def chart(self, params: dict[str, str]) -> bytes:
+        from f1gpt.ploters import Ploter
+
+        kwargs = {'save_png': False}
+        if 'start' in params:
+            kwargs['chart_range'] = [int(params['start']), int(params['end'])]
+        if 'features' in params:
+            kwargs['features'] = params['features'].split(',')
+        with self._session(params) as session:
+            return Ploter(session).plot_comparison(**kwargs)
+
+    def stats(self, params: dict[str, str]) -> dict:
+        # timing of the stages over the last spans kept by the recorder (see f1gpt.metrics)
+        return {**self.sessions.stats(), 'stages': recorder.summary()}
+
+class SkillRequestHandler(http.server.BaseHTTPRequestHandler):
+    '''HTTP handler of a SkillService (set as the service attribute of the server)'''
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        status, content_type, body = self.server.service.handle(url.path, params)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def create_server(service: SkillService, host: str = '127.0.0.1', port: int = 8000) -> http.server.ThreadingHTTPServer:
+    '''Creates the HTTP server of a service, each request runs in its own thread
+    Args:
+        service: (SkillService) service to be exposed
+        host: (str) [optional] host of the server, local only by default
+        port: (int) [optional] port of the server, 0 to use a free port
+    Returns:
+        http.server.ThreadingHTTPServer object, start it with serve_forever'''
+    server = http.server.ThreadingHTTPServer((host, port), SkillRequestHandler)
+    server.service = service
+    return server
+
+def serve(llm_factory, host: str = '127.0.0.1', port: int = 8000, max_bytes: int = 512 * 2 ** 20) -> None:
+    '''Runs the service until interrupted
+    Args:
+        llm_factory: function that creates the chat model on first use (see skills.create_llm)
+        host: (str) [optional] host of the server
+        port: (int) [optional] port of the server
+        max_bytes: (int) [optional] memory cap of the cached sessions
+    Returns:
+        None'''
+    server = create_server(SkillService(llm_factory, SessionCache(max_bytes)), host, port)
+    print(f'serving skills on http://{host}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
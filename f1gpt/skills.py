@@ -0,0 +1,126 @@
+# Skills of the AI (event, session, race, range and sectors). Each skill builds the messages of
+# its prompt from F1 data. Heavy libraries (fastf1, pandas, matplotlib and langchain) and
+# the model client are only imported or created when a skill needs them, so importing
+# this module (and starting main.py) is cheap.
+
+def create_llm(stub: bool = False, bypass: bool = False, cache_path: str = 'cache'):
+    '''Creates the chat model used by the skills, with responses cached on disk
+    Args:
+        stub: (bool) [optional] use a local stub model instead of the Azure OpenAI API
+        bypass: (bool) [optional] always call the model to get a new variant
+        cache_path: (str) [optional] directory of the response cache
+    Returns:
+        CachedModel object (see f1gpt.caches)'''
+    from f1gpt.caches import CachedModel, ResponseCache
+    from f1gpt.prompts import StubModel, get_model
+
+    return CachedModel(StubModel() if stub else get_model(), ResponseCache(cache_path), bypass=bypass)
+
+def create_session(event_name: str,
+                   session_number: int,
+                   year: int = 2023,
+                   store_path: str = 'store'):
+    '''Creates a lazy F1Session backed by the local telemetry store
+    Args:
+        event_name: (str) name of the event (e.g. "Suzuka")
+        session_number: (int) number of the session (e.g. 1 for FP1, 2 for FP2, 3 for FP3, 4 for Q, 5 for R)
+        year: (int) [optional] year of the event
+        store_path: (str) [optional] directory of the telemetry store
+    Returns:
+        F1Session object (see f1gpt.connectors)'''
+    from f1gpt.connectors import F1Session
+    from f1gpt.stores import TelemetryStore
+
+    return F1Session(event_name, session_number, year=year,
+                     store=TelemetryStore(store_path), lazy=True)
+
+def event_messages(event_name: str, year: int = 2023) -> list:
+    from f1gpt.connectors import F1Event
+    from f1gpt.prompts import get_prompt
+
+    return get_prompt('event').format_messages(event_info = F1Event(event_name, year).event)
+
+def session_messages(session) -> list:
+    from f1gpt.briefiers import SessionBriefer
+    from f1gpt.prompts import get_prompt
+
+    return get_prompt('session').format_messages(**SessionBriefer(session).create_session_brief())
+
+def race_messages(session, car_data: bool | None = None) -> list:
+    from f1gpt.briefiers import SessionBriefer
+    from f1gpt.prompts import get_prompt
+
+    return get_prompt('race').format_messages(**SessionBriefer(session).create_race_brief(car_data))
+
+def range_messages(session, chart_range: list[int] | None = None, turn_name: str | None = None) -> list:
+    from f1gpt.briefiers import SessionBriefer
+    from f1gpt.prompts import get_prompt
+
+    briefer = SessionBriefer(session)
+    if chart_range is None:
+        # corner detected in the track map, where the two drivers differ the most
+        turn_name, *chart_range = briefer.decisive_corner()
+    template = briefer.create_range_briefing(chart_range, turn_name = turn_name)
+    return get_prompt('range').format_messages(range_info = template)
+
+def sectors_messages(session, sectors: int | None = None) -> list:
+    from f1gpt.briefiers import SessionBriefer
+    from f1gpt.prompts import get_prompt
+    from f1gpt.sectors import MINI_SECTORS
+
+    sectors = MINI_SECTORS if sectors is None else sectors
+    return get_prompt('sectors').format_messages(**SessionBriefer(session).create_sectors_brief(sectors))
+
+def decisive_corner(session) -> tuple[str, float, float]:
+    '''Finds the corner where the selected drivers of a session differ the most (see SessionBriefer.decisive_corner)'''
+    from f1gpt.briefiers import SessionBriefer
+
+    return SessionBriefer(session).decisive_corner()
+
+# registry of skills by name, each entry builds the messages of the skill prompt
+SKILLS = {'event': event_messages,
+          'session': session_messages,
+          'race': race_messages,
+          'range': range_messages,
+          'sectors': sectors_messages}
+
+def run_skill(llm, name: str, *args, **kwargs) -> str:
+    '''Runs a skill
+    Args:
+        llm: chat model (see create_llm)
+        name: (str) name of the skill (see SKILLS)
+        args, kwargs: arguments of the skill messages builder
+    Returns:
+        text generated by the model'''
+    from f1gpt.metrics import span
+
+    with span(f'skill.{name}'):
+        with span('skill.messages'):
+            messages = SKILLS[name](*args, **kwargs)
+        return llm.predict_messages(messages).content
+
+def plot_session(session, **kwargs) -> None:
+    '''Plots the comparison of the selected drivers of a session (see Ploter.plot_comparison)'''
+    from f1gpt.ploters import Ploter
+
+    Ploter(session).plot_comparison(**kwargs)
+
+def plot_sectors(session, **kwargs) -> None:
+    '''Plots the track map colored by the fastest driver of each mini-sector (see Ploter.plot_sectors)'''
+    from f1gpt.ploters import Ploter
+
+    Ploter(session).plot_sectors(**kwargs)
+
+def follow_session(session, chunk_seconds: float = 1.0):
+    '''Replays a recorded session through a LiveSession (see f1gpt.streamers)
+    Args:
+        session: (F1Session) session with laps and car data
+        chunk_seconds: (float) [optional] duration of each telemetry chunk of the replay
+    Returns:
+        generator of the LiveSession object, after each change of the leaderboard'''
+    from f1gpt.streamers import LiveSession, replay
+
+    live = LiveSession()
+    for kind, driver, record in replay(session.laps, session.car_data, chunk_seconds):
+        if live.update(kind, driver, record):
+            yield live
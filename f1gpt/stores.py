@@ -0,0 +1,179 @@
+import os
+import re
+
+import pandas
+
+# Data is stored as parquet files (pyarrow engine) in the following layout:
+# <path>/<year>/<event>/<session>/laps.parquet
+# <path>/<year>/<event>/<session>/results.parquet
+# <path>/<year>/<event>/<session>/pace.parquet
+# <path>/<year>/<event>/<session>/telemetry/<driver>/<lap>.parquet
+# Telemetry files hold the car data merged with the position data of a lap,
+# with the same schema of the telemetries attribute (check schema.md file)
+
+def slugify(name: str) -> str:
+    '''Converts a name into a string safe to be used as a directory name
+    Args:
+        name: (str) name to be converted (e.g. "Japanese Grand Prix")
+    Returns:
+        slug: (str) lower case name with non alphanumeric characters replaced by "_"
+        '''
+    return re.sub(r'[^a-z0-9]+', '_', str(name).lower()).strip('_')
+
+class TelemetryStore:
+    '''Class to persist session data in a local columnar (parquet) store
+    Attributes:
+        path: root directory of the store
+    Methods:
+        has_session: check if laps and results of a session are stored
+        read_laps: read the laps of a session
+        write_laps: write the laps of a session
+        read_results: read the results of a session
+        write_results: write the results of a session
+        read_pace: read the per lap pace table of a session
+        write_pace: write the per lap pace table of a session
+        has_telemetry: check if the telemetry of a lap is stored
+        read_telemetry: read the telemetry of a lap
+        write_telemetry: write the telemetry of a lap
+        list_telemetry: list the laps with stored telemetry of a session
+        '''
+    def __init__(self, path: str = 'store') -> None:
+        '''Creates a TelemetryStore object
+        Args:
+            path: (str) [optional] root directory of the store, created if it does not exist
+        Returns:
+            None'''
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def session_path(self, year: int, event: str, session: str) -> str:
+        return os.path.join(self.path, str(year), slugify(event), slugify(session))
+
+    def telemetry_path(self,
+                       year: int,
+                       event: str,
+                       session: str,
+                       driver: str,
+                       lap: int) -> str:
+        return os.path.join(self.session_path(year, event, session),
+                            'telemetry',
+                            str(driver),
+                            f'{int(lap)}.parquet')
+
+    def _read(self, file_path: str) -> pandas.DataFrame | None:
+        if not os.path.exists(file_path):
+            return None
+        return pandas.read_parquet(file_path)
+
+    def _write(self, frame: pandas.DataFrame, file_path: str) -> None:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # write to a temporary file first so readers never see a partial file
+        temp_path = file_path + '.tmp'
+        pandas.DataFrame(frame).to_parquet(temp_path)
+        os.replace(temp_path, file_path)
+
+    def has_session(self, year: int, event: str, session: str) -> bool:
+        path = self.session_path(year, event, session)
+        return (os.path.exists(os.path.join(path, 'laps.parquet')) and
+                os.path.exists(os.path.join(path, 'results.parquet')))
+
+    def read_laps(self, year: int, event: str, session: str) -> pandas.DataFrame | None:
+        '''Reads the laps of a session
+        Args:
+            year: (int) year of the event
+            event: (str) name of the event
+            session: (str) name of the session
+        Returns:
+            pandas.DataFrame with the laps or None if it is not stored'''
+        return self._read(os.path.join(self.session_path(year, event, session), 'laps.parquet'))
+
+    def write_laps(self,
+                   laps: pandas.DataFrame,
+                   year: int,
+                   event: str,
+                   session: str) -> None:
+        self._write(laps, os.path.join(self.session_path(year, event, session), 'laps.parquet'))
+
+    def read_results(self, year: int, event: str, session: str) -> pandas.DataFrame | None:
+        '''Reads the results of a session
+        Args:
+            year: (int) year of the event
+            event: (str) name of the event
+            session: (str) name of the session
+        Returns:
+            pandas.DataFrame with the results or None if it is not stored'''
+        return self._read(os.path.join(self.session_path(year, event, session), 'results.parquet'))
+
+    def write_results(self,
+                      results: pandas.DataFrame,
+                      year: int,
+                      event: str,
+                      session: str) -> None:
+        self._write(results, os.path.join(self.session_path(year, event, session), 'results.parquet'))
+
+    def read_pace(self, year: int, event: str, session: str) -> pandas.DataFrame | None:
+        '''Reads the per lap pace table of a session (see f1gpt.pacers.lap_pace)
+        Args:
+            year: (int) year of the event
+            event: (str) name of the event
+            session: (str) name of the session
+        Returns:
+            pandas.DataFrame with the pace table or None if it is not stored'''
+        return self._read(os.path.join(self.session_path(year, event, session), 'pace.parquet'))
+
+    def write_pace(self,
+                   pace: pandas.DataFrame,
+                   year: int,
+                   event: str,
+                   session: str) -> None:
+        self._write(pace, os.path.join(self.session_path(year, event, session), 'pace.parquet'))
+
+    def has_telemetry(self,
+                      year: int,
+                      event: str,
+                      session: str,
+                      driver: str,
+                      lap: int) -> bool:
+        return os.path.exists(self.telemetry_path(year, event, session, driver, lap))
+
+    def read_telemetry(self,
+                       year: int,
+                       event: str,
+                       session: str,
+                       driver: str,
+                       lap: int) -> pandas.DataFrame | None:
+        '''Reads the telemetry (car data merged with position data) of a lap
+        Args:
+            year: (int) year of the event
+            event: (str) name of the event
+            session: (str) name of the session
+            driver: (str) driver number
+            lap: (int) lap number
+        Returns:
+            pandas.DataFrame with the telemetry or None if it is not stored'''
+        return self._read(self.telemetry_path(year, event, session, driver, lap))
+
+    def write_telemetry(self,
+                        telemetry: pandas.DataFrame,
+                        year: int,
+                        event: str,
+                        session: str,
+                        driver: str,
+                        lap: int) -> None:
+        self._write(telemetry, self.telemetry_path(year, event, session, driver, lap))
+
+    def list_telemetry(self, year: int, event: str, session: str) -> list[tuple[str, int]]:
+        '''Lists the laps with stored telemetry of a session
+        Args:
+            year: (int) year of the event
+            event: (str) name of the event
+            session: (str) name of the session
+        Returns:
+            list of (driver, lap) tuples'''
+        path = os.path.join(self.session_path(year, event, session), 'telemetry')
+        if not os.path.exists(path):
+            return []
+        return [(driver, int(file_name[:-len('.parquet')]))
+                for driver in sorted(os.listdir(path))
+                for file_name in sorted(os.listdir(os.path.join(path, driver)))
+                if file_name.endswith('.parquet')]
@@ -0,0 +1,154 @@
+import bisect
+import heapq
+
+import numpy
+import pandas
+
+from f1gpt.aligners import rolling_mean
+
+def replay(laps: pandas.DataFrame,
+           car_data: dict[str, pandas.DataFrame],
+           chunk_seconds: float = 1.0):
+    '''Replays a recorded session as a stream of records, in session time order
+    Args:
+        laps: (pandas.DataFrame) laps of the session (e.g. F1Session.laps)
+        car_data: (dict[str, pandas.DataFrame]) car data by driver number (e.g. F1Session.car_data)
+        chunk_seconds: (float) [optional] duration of each telemetry chunk
+    Returns:
+        generator of ("telemetry", driver, pandas.DataFrame) and ("lap", driver, pandas.Series) records'''
+    def telemetry_records(driver: str, telemetry: pandas.DataFrame):
+        seconds = telemetry['SessionTime'].dt.total_seconds().to_numpy()
+        chunks = numpy.floor(seconds / chunk_seconds)
+        bounds = numpy.flatnonzero(numpy.diff(chunks)) + 1
+        for start, end in zip(numpy.concatenate([[0], bounds]), numpy.concatenate([bounds, [len(seconds)]])):
+            # chunks are emitted at their first sample, so laps always come after their samples
+            yield seconds[start], 0, 'telemetry', driver, telemetry.iloc[start:end]
+
+    def lap_records():
+        completed = laps[laps['Time'].notna()].sort_values('Time')
+        for _, lap in completed.iterrows():
+            yield lap['Time'].total_seconds(), 1, 'lap', lap['DriverNumber'], lap
+
+    streams = [telemetry_records(driver, telemetry) for driver, telemetry in car_data.items()]
+    for _, _, kind, driver, record in heapq.merge(*streams, lap_records(), key=lambda item: item[:2]):
+        yield kind, driver, record
+
+class LiveSession:
+    '''Class to follow a session incrementally from a stream of lap and telemetry records
+    (e.g. from replay), each update costs O(new data) instead of recomputing the session:
+    the samples of a lap are resampled on the distance grid once, when the lap improves the best of its driver
+    Attributes:
+        best_laps: dictionary with (lap time, lap number, driver abbreviation) of the fastest lap by driver number
+        leaderboard: sorted list of (lap time, driver number) of the fastest lap of each driver
+        top_2: list with the numbers of the two fastest drivers
+        fastest_lap: pandas.DataFrame with the leaderboard, same schema of F1Session.fastest_lap (check schema.md file)
+        telemetries: dictionary with the telemetry (Time, Distance and channels) of the fastest lap by driver number
+        gap: pandas.DataFrame with the distance aligned time gap between the top_2 drivers
+    Methods:
+        update: process a record
+        add_telemetry: buffer telemetry samples of a driver
+        add_lap: process a completed lap
+        '''
+    def __init__(self, step: float = 4.0, window_size: int = 75) -> None:
+        '''Creates a LiveSession object
+        Args:
+            step: (float) [optional] distance between grid points of the gap in meters
+            window_size: (int) [optional] size of the rolling window (in grid points) used to smooth the gap
+        Returns:
+            None'''
+        self.step = step
+        self.window_size = window_size
+        self.best_laps = {}
+        self.leaderboard = []
+        self.top_2 = []
+        self.fastest_lap = self._create_fastest_lap()
+        self.telemetries = {}
+        self.gap = None
+        self._buffers = {}
+        # lap time in seconds at every grid point of the fastest lap, by driver number
+        self._grid_times = {}
+
+    def update(self, kind: str, driver: str, record) -> bool:
+        '''Processes a record
+        Args:
+            kind: (str) "telemetry" or "lap"
+            driver: (str) driver number
+            record: pandas.DataFrame with telemetry samples or pandas.Series with a completed lap
+        Returns:
+            True if the leaderboard changed'''
+        if kind == 'telemetry':
+            self.add_telemetry(driver, record)
+            return False
+        return self.add_lap(record)
+
+    def add_telemetry(self, driver: str, samples: pandas.DataFrame) -> None:
+        '''Buffers telemetry samples (with "SessionTime" and "Speed" columns) of a driver'''
+        self._buffers.setdefault(driver, []).append(samples)
+
+    def _take_lap_samples(self, driver: str, lap: pandas.Series) -> pandas.DataFrame:
+        # only the samples buffered since the previous lap are processed, then dropped
+        buffer = pandas.concat(self._buffers.pop(driver, [pandas.DataFrame(columns=['SessionTime'])]))
+        self._buffers[driver] = [buffer[buffer['SessionTime'] > lap['Time']]]
+        return buffer[buffer['SessionTime'].between(lap['LapStartTime'], lap['Time'])]
+
+    def add_lap(self, lap: pandas.Series) -> bool:
+        '''Processes a completed lap (with "DriverNumber", "Driver", "LapNumber", "LapTime",
+        "LapStartTime" and "Time" fields), updating the leaderboard and the gap.
+        The lap is ranked when it improves the running best of its driver (a live feed has no
+        "IsPersonalBest" field, fastf1 computes it after the session); deleted laps are not ranked
+        Returns:
+            True if the leaderboard changed'''
+        driver = lap['DriverNumber']
+        lap_time = lap['LapTime']
+        samples = self._take_lap_samples(driver, lap)
+        best = self.best_laps.get(driver)
+        if lap.get('Deleted') == True or pandas.isna(lap_time):
+            return False
+        if best is not None and lap_time >= best[0]:
+            return False
+
+        if best is not None:
+            self.leaderboard.pop(bisect.bisect_left(self.leaderboard, (best[0], driver)))
+        bisect.insort(self.leaderboard, (lap_time, driver))
+        self.best_laps[driver] = (lap_time, lap['LapNumber'], lap.get('Driver'))
+        self.fastest_lap = self._create_fastest_lap()
+        if len(samples) > 1:
+            telemetry = samples.copy()
+            telemetry['Time'] = telemetry['SessionTime'] - lap['LapStartTime']
+            seconds = telemetry['Time'].dt.total_seconds().to_numpy()
+            # same integration of fastf1 add_distance
+            telemetry['Distance'] = numpy.cumsum(telemetry['Speed'].to_numpy() / 3.6 *
+                                                 numpy.diff(seconds, prepend=0))
+            self.telemetries[driver] = telemetry
+            grid = numpy.arange(0, telemetry['Distance'].iloc[-1], self.step)
+            self._grid_times[driver] = numpy.interp(grid, telemetry['Distance'].to_numpy(), seconds)
+        else:
+            self.telemetries.pop(driver, None)
+            self._grid_times.pop(driver, None)
+
+        top_2 = [car for _, car in self.leaderboard[:2]]
+        if top_2 != self.top_2 or driver in top_2:
+            self.top_2 = top_2
+            self._update_gap()
+        return True
+
+    def _update_gap(self) -> None:
+        if len(self.top_2) < 2 or not all(car in self._grid_times for car in self.top_2):
+            self.gap = None
+            return
+        # same gap of TelemetryAligner, from the grid times kept since each lap was completed
+        reference, other = (self._grid_times[car] for car in self.top_2)
+        points = min(len(reference), len(other))
+        self.gap = pandas.DataFrame({'Distance': numpy.arange(points) * self.step,
+                                     'Time_Gap': rolling_mean(other[:points] - reference[:points],
+                                                              self.window_size)})
+
+    def _create_fastest_lap(self) -> pandas.DataFrame:
+        # the leaderboard is already sorted, so the table is only built when a lap changes it
+        drivers = [driver for _, driver in self.leaderboard]
+        fastest_lap = pandas.DataFrame({'Driver': [self.best_laps[driver][2] for driver in drivers],
+                                        'Fastest Lap': [self.best_laps[driver][0] for driver in drivers],
+                                        'LapNumber': [self.best_laps[driver][1] for driver in drivers]},
+                                       index=drivers)
+        fastest_lap['Gap'] = fastest_lap['Fastest Lap'] - fastest_lap['Fastest Lap'].min()
+        return fastest_lap
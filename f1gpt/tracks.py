@@ -0,0 +1,304 @@
+import json
+import os
+import threading
+
+import numpy
+import pandas
+
+from f1gpt.aligners import rolling_mean
+from f1gpt.indexes import transitions
+
+# Track map of a circuit, built from the X/Y position data of a reference lap resampled on a
+# distance grid and indexed with a KD-tree, so any position is mapped to its track distance
+# (and its lateral offset to the reference line) with a nearest point query. Corners are
+# detected from the curvature of the line and the braking zones of the lap, and cached with
+# the line as JSON files (<path>/<year>/<location>.json), once per circuit and year as layouts
+# change between seasons. Corner names of the cached file can be edited by hand (e.g. "Turn 16"
+# to "Casio Triangle").
+
+TRACKS_PATH = 'tracks'
+# distance between points of the reference line in meters
+STEP = 2.0
+# window of the smoothing of the line and of its curvature in meters
+SMOOTHING = 40.0
+# radius in meters below which the track is in a corner
+CORNER_RADIUS = 350.0
+# corners closer than this distance in meters are one corner (e.g. chicanes)
+MERGE_DISTANCE = 50.0
+# corners shorter than this distance in meters are dropped
+MIN_CORNER_LENGTH = 20.0
+# braking zones ending less than this distance in meters before a corner belong to it
+BRAKE_DISTANCE = 150.0
+# distance in meters added after the end of each corner (corner exit)
+EXIT_DISTANCE = 30.0
+
+def smooth(values: numpy.ndarray, window_size: int) -> numpy.ndarray:
+    '''Calculates the centered rolling mean of an array, ends are padded with the first and last values
+    Args:
+        values: (numpy.ndarray) 1d array to be smoothed
+        window_size: (int) size of the rolling window
+    Returns:
+        numpy.ndarray with the same shape of values'''
+    if window_size <= 1:
+        return numpy.asarray(values, dtype=float)
+    padded = numpy.pad(numpy.asarray(values, dtype=float),
+                       (window_size // 2, window_size - 1 - window_size // 2), mode='edge')
+    return rolling_mean(padded, window_size)[window_size - 1:]
+
+class TrackMap:
+    '''Class to index the layout of a circuit by position, from a reference lap
+    Attributes:
+        distance: numpy.ndarray with the distance of each point of the reference line in meters
+        x, y: numpy.ndarray with the position of each point (fastf1 position units)
+        brake_zones: list of (start, end) distances of the braking zones of the reference lap
+        scale: position units per meter (1/10 m in fastf1 position data)
+        heading: numpy.ndarray with the direction of the line in radians
+        curvature: numpy.ndarray with the smoothed curvature in 1/m, positive turning left
+        tree: scipy.spatial.cKDTree of the reference line
+        corners: list of (turn_name, start, end) corner ranges in meters
+    Methods:
+        from_telemetry: create a TrackMap object from the telemetry of a lap
+        locate: track distance and lateral offset of positions
+        distance_at: track distance of positions
+        detect_corners: find the corners from curvature and braking zones
+        corner_at: name of the corner of a distance range
+        to_dict: data to be cached (see get_track)
+        memory_usage: bytes of the line arrays and of the KD-tree
+        '''
+    def __init__(self,
+                 distance: numpy.ndarray,
+                 x: numpy.ndarray,
+                 y: numpy.ndarray,
+                 brake_zones: list[tuple[float, float]] = [],
+                 corners: list[tuple[str, float, float]] | None = None) -> None:
+        '''Creates a TrackMap object
+        Args:
+            distance: (numpy.ndarray) distance of each point of the line on a regular grid in meters
+            x: (numpy.ndarray) X position of each point
+            y: (numpy.ndarray) Y position of each point
+            brake_zones: (list[tuple[float, float]]) [optional] braking zones of the lap
+            corners: (list[tuple[str, float, float]]) [optional] corner ranges, detected when None
+        Returns:
+            None'''
+        self.distance = numpy.asarray(distance, dtype=float)
+        self.x = numpy.asarray(x, dtype=float)
+        self.y = numpy.asarray(y, dtype=float)
+        self.brake_zones = [(float(start), float(end)) for start, end in brake_zones]
+        step = self.distance[1] - self.distance[0] if len(self.distance) > 1 else STEP
+        length = self.distance[-1] - self.distance[0] if len(self.distance) > 1 else 0
+        self.scale = numpy.hypot(numpy.diff(self.x), numpy.diff(self.y)).sum() / length if length else 1.0
+
+        # the position data is sampled at ~4Hz, the line is smoothed before taking derivatives
+        window = max(int(round(SMOOTHING / step)), 1)
+        smooth_x, smooth_y = smooth(self.x, window), smooth(self.y, window)
+        self.heading = numpy.unwrap(numpy.arctan2(numpy.gradient(smooth_y), numpy.gradient(smooth_x)))
+        self.curvature = smooth(numpy.gradient(self.heading) / step, window)
+        from scipy.spatial import cKDTree
+
+        self.tree = cKDTree(numpy.column_stack([self.x, self.y]))
+        self.corners = self.detect_corners() if corners is None else [(str(name), float(start), float(end))
+                                                                      for name, start, end in corners]
+
+    @classmethod
+    def from_telemetry(cls,
+                       telemetry: pandas.DataFrame,
+                       step: float = STEP,
+                       corners: list[tuple[str, float, float]] | None = None) -> 'TrackMap':
+        '''Creates a TrackMap object from the telemetry of a lap
+        Args:
+            telemetry: (pandas.DataFrame) telemetry of a lap with "Distance", "X", "Y" and "Brake" columns
+            step: (float) [optional] distance between points of the reference line in meters
+            corners: (list[tuple[str, float, float]]) [optional] corner ranges, detected when None
+        Returns:
+            TrackMap object'''
+        distance, first = numpy.unique(telemetry['Distance'].to_numpy(dtype=float), return_index=True)
+        grid = numpy.arange(distance[0], distance[-1], step)
+        x = numpy.interp(grid, distance, telemetry['X'].to_numpy(dtype=float)[first])
+        y = numpy.interp(grid, distance, telemetry['Y'].to_numpy(dtype=float)[first])
+        brake_on, brake_off = transitions(telemetry['Brake'].to_numpy(dtype=bool)[first])
+        brake_zones = list(zip(distance[brake_on], distance[brake_off - 1]))
+        return cls(grid, x, y, brake_zones, corners)
+
+    def locate(self, x: numpy.ndarray, y: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        '''Finds the nearest point of the reference line of many positions
+        Args:
+            x: (numpy.ndarray) X of each position
+            y: (numpy.ndarray) Y of each position
+        Returns:
+            distance: numpy.ndarray with the track distance of each position in meters
+            offset: numpy.ndarray with the lateral offset to the line in meters, positive to the left'''
+        points = numpy.column_stack([numpy.asarray(x, dtype=float), numpy.asarray(y, dtype=float)])
+        gap, nearest = self.tree.query(points)
+        # side of the line from the cross product of the line direction and the offset vector
+        side = (numpy.cos(self.heading[nearest]) * (points[:, 1] - self.y[nearest]) -
+                numpy.sin(self.heading[nearest]) * (points[:, 0] - self.x[nearest]))
+        return self.distance[nearest], numpy.where(side < 0, -gap, gap) / self.scale
+
+    def distance_at(self, x: numpy.ndarray, y: numpy.ndarray) -> numpy.ndarray:
+        return self.locate(x, y)[0]
+
+    def detect_corners(self,
+                       corner_radius: float = CORNER_RADIUS,
+                       merge_distance: float = MERGE_DISTANCE,
+                       min_length: float = MIN_CORNER_LENGTH,
+                       brake_distance: float = BRAKE_DISTANCE,
+                       exit_distance: float = EXIT_DISTANCE) -> list[tuple[str, float, float]]:
+        '''Finds the corners of the track, sections with a radius below corner_radius and braking
+        zones, each corner starts at its braking point (when there is one)
+        Args:
+            corner_radius, merge_distance, min_length, brake_distance, exit_distance: (float) [optional]
+                see the constants of this module
+        Returns:
+            list of ("Turn <n>", start, end) tuples in lap order, distances in meters'''
+        if len(self.distance) < 2:
+            return []
+        curve_on, curve_off = transitions(numpy.abs(self.curvature) > 1 / corner_radius)
+        sections = [[self.distance[on], self.distance[off - 1]] for on, off in zip(curve_on, curve_off)
+                    if self.distance[off - 1] - self.distance[on] >= min_length]
+        for brake_start, brake_end in self.brake_zones:
+            following = [section for section in sections
+                         if section[1] >= brake_start and section[0] - brake_end <= brake_distance]
+            if following:
+                following[0][0] = min(following[0][0], brake_start)
+            else:
+                # braking with no curvature detected (e.g. a hairpin missed by the position data)
+                sections.append([brake_start, brake_end + exit_distance])
+        sections.sort()
+
+        merged = []
+        for start, end in sections:
+            if merged and start - merged[-1][1] <= merge_distance:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        lap_end = self.distance[-1]
+        corners = []
+        for number, (start, end) in enumerate(merged):
+            end = min(end + exit_distance, merged[number + 1][0] if number + 1 < len(merged) else lap_end)
+            corners.append((f'Turn {number + 1}', round(float(start), 1), round(float(end), 1)))
+        return corners
+
+    def corner_at(self, start: float, end: float) -> str | None:
+        '''Gets the name of the corner with the largest overlap with a distance range
+        Args:
+            start: (float) start distance of the range
+            end: (float) end distance of the range
+        Returns:
+            name of the corner, None when the range does not overlap any corner'''
+        overlaps = [(min(end, corner_end) - max(start, corner_start), name)
+                    for name, corner_start, corner_end in self.corners]
+        overlaps = [overlap for overlap in overlaps if overlap[0] > 0]
+        return max(overlaps)[1] if overlaps else None
+
+    def memory_usage(self) -> int:
+        arrays = sum(values.nbytes for values in vars(self).values() if isinstance(values, numpy.ndarray))
+        return arrays + self.tree.data.nbytes + self.tree.indices.nbytes
+
+    def to_dict(self) -> dict:
+        return {'distance': [round(float(value), 2) for value in self.distance],
+                'x': [round(float(value), 1) for value in self.x],
+                'y': [round(float(value), 1) for value in self.y],
+                'brake_zones': [list(zone) for zone in self.brake_zones],
+                'corners': [list(corner) for corner in self.corners]}
+
+def compare_lines(telemetry: pandas.DataFrame,
+                  other: pandas.DataFrame,
+                  start: float | None = None,
+                  end: float | None = None) -> dict[str, float]:
+    '''Compares the racing line of a lap to the line of a reference lap in a distance range, projecting
+    each position of the lap on the nearest segment of the reference line around its distance,
+    without building a track map
+    Args:
+        telemetry: (pandas.DataFrame) telemetry of the reference lap with "Distance", "X" and "Y" columns
+        other: (pandas.DataFrame) telemetry of the compared lap with "Distance", "X" and "Y" columns
+        start: (float) [optional] start distance of the compared range in meters
+        end: (float) [optional] end distance of the compared range in meters
+    Returns:
+        dictionary with the following keys (meters, numpy.nan when the range has less than 2 positions):
+            mean_offset: mean distance of the compared line to the reference line
+            max_offset: largest distance of the compared line to the reference line
+            inside_offset: mean offset towards the inside of the corner (negative is wider)'''
+    missing = {'mean_offset': numpy.nan, 'max_offset': numpy.nan, 'inside_offset': numpy.nan}
+    distance = telemetry['Distance'].to_numpy(dtype=float)
+    if len(distance) < 2:
+        return missing
+    start = distance[0] if start is None else start
+    end = distance[-1] if end is None else end
+    # line of the reference lap a bit beyond the range, so the positions at its ends have a segment
+    low, high = numpy.searchsorted(distance, [start - MERGE_DISTANCE, end + MERGE_DISTANCE])
+    line = slice(max(low - 1, 0), high + 1)
+    distance = distance[line]
+    x = telemetry['X'].to_numpy(dtype=float)[line]
+    y = telemetry['Y'].to_numpy(dtype=float)[line]
+    # repeated positions (the position data is slower than the car data) make empty segments
+    moved = numpy.concatenate([[True], (numpy.diff(x) != 0) | (numpy.diff(y) != 0)])
+    distance, x, y = distance[moved], x[moved], y[moved]
+    other_distance = other['Distance'].to_numpy(dtype=float)
+    inside = (other_distance >= start) & (other_distance <= end)
+    if len(x) < 3 or inside.sum() < 2 or distance[-1] <= distance[0]:
+        return missing
+
+    segment_x, segment_y = numpy.diff(x), numpy.diff(y)
+    # candidate segments of each compared position (rows), the segments starting less than
+    # MERGE_DISTANCE away from its distance (the distances of two laps drift apart a few meters)
+    other_distance = other_distance[inside]
+    low = numpy.searchsorted(distance[:-1], other_distance - MERGE_DISTANCE).clip(0, len(segment_x) - 1)
+    high = numpy.maximum(numpy.searchsorted(distance[:-1], other_distance + MERGE_DISTANCE, side='right'), low + 1)
+    candidates = numpy.minimum(low[:, None] + numpy.arange((high - low).max()), high[:, None] - 1)
+    # offset vectors of each position to the nearest point of each candidate segment
+    point_x = other['X'].to_numpy(dtype=float)[inside, None] - x[candidates]
+    point_y = other['Y'].to_numpy(dtype=float)[inside, None] - y[candidates]
+    candidate_x, candidate_y = segment_x[candidates], segment_y[candidates]
+    along = ((point_x * candidate_x + point_y * candidate_y) / (candidate_x ** 2 + candidate_y ** 2)).clip(0, 1)
+    point_x -= along * candidate_x
+    point_y -= along * candidate_y
+    gap = numpy.hypot(point_x, point_y)
+    rows = numpy.arange(len(gap))
+    closest = gap.argmin(axis=1)
+    nearest = candidates[rows, closest]
+    # side of the line from the cross product of the segment direction and the offset vector
+    side = segment_x[nearest] * point_y[rows, closest] - segment_y[nearest] * point_x[rows, closest]
+    scale = numpy.hypot(segment_x, segment_y).sum() / (distance[-1] - distance[0])
+    offset = numpy.where(side < 0, -1, 1) * gap[rows, closest] / scale
+    # direction of the corner at each segment, positive turning left
+    turn = numpy.sign(smooth(numpy.gradient(numpy.unwrap(numpy.arctan2(segment_y, segment_x))), 3))[nearest]
+    return {'mean_offset': float(numpy.abs(offset).mean()),
+            'max_offset': float(numpy.abs(offset).max()),
+            'inside_offset': float((offset * turn).mean())}
+
+def track_path(location: str, year: int, path: str = TRACKS_PATH) -> str:
+    from f1gpt.stores import slugify
+
+    return os.path.join(path, str(year), f'{slugify(location)}.json')
+
+_tracks = {}
+# guards _tracks and the cached files, tracks can be requested by concurrent requests
+_lock = threading.Lock()
+
+def get_track(location: str,
+              year: int,
+              telemetry: pandas.DataFrame | None = None,
+              path: str = TRACKS_PATH) -> TrackMap:
+    '''Gets the track map of a circuit, from memory, from the local cached copy or built from a lap
+    Args:
+        location: (str) location of the circuit (e.g. "Suzuka")
+        year: (int) year of the event, the layout of a circuit can change between seasons
+        telemetry: (pandas.DataFrame) [optional] telemetry of a reference lap, needed when the track is not cached
+        path: (str) [optional] root directory of the cached tracks
+    Returns:
+        TrackMap object'''
+    file_path = track_path(location, year, path)
+    with _lock:
+        if file_path not in _tracks:
+            if os.path.exists(file_path):
+                with open(file_path, encoding='utf-8') as f:
+                    _tracks[file_path] = TrackMap(**json.load(f))
+            elif telemetry is not None:
+                track = TrackMap.from_telemetry(telemetry)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(track.to_dict(), f, ensure_ascii=False)
+                _tracks[file_path] = track
+            else:
+                raise FileNotFoundError(f'No track for {year} {location} in {path} and no telemetry to build it')
+        return _tracks[file_path]
@@ -1,47 +1,89 @@
-from f1gpt.briefiers import SessionBriefer
-from f1gpt.connectors import F1Event, F1Session, drivers
-from f1gpt.ploters import Ploter
-from f1gpt.prompts import (
-    event_prompt,
-    model,
-    race_prompt,
-    range_prompt,
-    session_prompt)
+from f1gpt import skills
 
 if __name__ == "__main__":
     import sys
 
+    if 'backfill' in sys.argv:
+        from f1gpt.ingestors import ingest, season_tasks
+
+        # load every session of a season into the local store, in parallel processes
+        year = int(sys.argv[sys.argv.index('backfill') + 1])
+        reports = ingest(season_tasks(year))
+        failed = [report for report in reports if report['status'] == 'failed']
+        print(f'{len(reports) - len(failed)} sessions loaded, {len(failed)} failed')
+        sys.exit(1 if failed else 0)
+
+    # responses are cached on disk, add 'stub' to use a local model and 'new' to get a new variant,
+    # add 'metrics' to append the timing of each stage, token counts and cache hits to metrics.jsonl.
+    # The model (and langchain) is only created by the commands that call it
+    def create_llm():
+        return skills.create_llm(stub='stub' in sys.argv, bypass='new' in sys.argv)
+
     if 'event' in sys.argv:
-        next_event = F1Event('Suzuka')
-        response = model.predict_messages(event_prompt.format_messages(event_info = next_event.event))
-        print(response.content)
+        print(skills.run_skill(create_llm(), 'event', 'Suzuka'))
     elif 'session' in sys.argv:
         session_number = sys.argv[sys.argv.index('session') + 1]
-        session = F1Session('Suzuka', session_number, drivers)
-        briefer = SessionBriefer(session)
-        kwargs = briefer.create_session_brief()
-        response = model.predict_messages(session_prompt.format_messages(**kwargs))
-        print(response.content)
-        ploter = Ploter(session)
-        ploter.plot_comparison()
+        session = skills.create_session('Suzuka', session_number)
+        print(skills.run_skill(create_llm(), 'session', session))
+        skills.plot_session(session)
     elif 'race' in sys.argv:
-        session = F1Session('Suzuka', 5, drivers)
-        briefer = SessionBriefer(session)
-        kwargs = briefer.create_race_brief()
-        response = model.predict_messages(race_prompt.format_messages(**kwargs))
-        print(response.content)
+        session = skills.create_session('Suzuka', 5)
+        # the top speed of each driver needs the car data of the whole race, only loaded with 'telemetry'
+        print(skills.run_skill(create_llm(), 'race', session, car_data='telemetry' in sys.argv))
     elif 'range' in sys.argv:
         index = sys.argv.index('range')
         session_number = sys.argv[index + 1]
-        range_start = int(sys.argv[index + 2])
-        range_end = int(sys.argv[index + 3])
-        lap_section = [range_start, range_end]
-        session = F1Session('Suzuka', session_number, drivers)
-        briefer = SessionBriefer(session)
-        template = briefer.create_range_briefing(lap_section, turn_name = 'chincane')
-        response = model.predict_messages(range_prompt.format_messages(range_info = template))
-        print(response.content)
-        ploter = Ploter(session)
-        ploter.plot_comparison(chart_range=lap_section,
-                               features= ['Speed', 'Brake', 'Throttle'])  
-                               
\ No newline at end of file
+        session = skills.create_session('Suzuka', session_number)
+        if len(sys.argv) > index + 3 and sys.argv[index + 2].isdigit():
+            lap_section = [int(sys.argv[index + 2]), int(sys.argv[index + 3])]
+            turn_name = None
+        else:
+            # no range given, use the corner of the track map where the two fastest drivers differ the most
+            turn_name, *lap_section = skills.decisive_corner(session)
+        print(skills.run_skill(create_llm(), 'range', session, lap_section, turn_name = turn_name))
+        skills.plot_session(session,
+                            chart_range=lap_section,
+                            features= ['Speed', 'Brake', 'Throttle'])
+    elif 'sectors' in sys.argv:
+        session_number = sys.argv[sys.argv.index('sectors') + 1]
+        session = skills.create_session('Suzuka', session_number)
+        print(skills.run_skill(create_llm(), 'sectors', session))
+        skills.plot_sectors(session)
+    elif 'live' in sys.argv:
+        session_number = sys.argv[sys.argv.index('live') + 1]
+        session = skills.create_session('Suzuka', session_number)
+        # replay the session lap by lap, printing the top 3 and the gap of the top 2 on every change
+        for live in skills.follow_session(session):
+            top_3 = live.fastest_lap.iloc[:3]
+            standings = ', '.join(f'{driver} {lap_time.total_seconds():.3f}'
+                                  for driver, lap_time in zip(top_3['Driver'], top_3['Fastest Lap']))
+            gap = '' if live.gap is None or live.gap.empty else f' (gap at the line {live.gap["Time_Gap"].iloc[-1]:+.3f}s)'
+            print(f'{standings}{gap}')
+    elif 'serve' in sys.argv:
+        from f1gpt.servers import serve
+
+        # keep sessions warm in memory between requests (see f1gpt/servers.py for the endpoints)
+        index = sys.argv.index('serve')
+        port = int(sys.argv[index + 1]) if len(sys.argv) > index + 1 and sys.argv[index + 1].isdigit() else 8000
+        serve(create_llm, port=port)
+    elif 'weekend' in sys.argv:
+        from f1gpt.executors import PromptExecutor
+
+        # all posts of the weekend, LLM calls run concurrently
+        qualifying = skills.create_session('Suzuka', 4)
+        corners = qualifying.get_track().corners
+        race = skills.create_session('Suzuka', 5)
+        prompts = {'event': skills.event_messages('Suzuka'),
+                   'qualifying': skills.session_messages(qualifying),
+                   'race': skills.race_messages(race)}
+        for turn_name, range_start, range_end in corners:
+            prompts[turn_name] = skills.range_messages(qualifying, [range_start, range_end], turn_name)
+        executor = PromptExecutor(create_llm(), concurrency=4)
+        for name, response in executor.run_all(prompts).items():
+            print(f'--- {name}')
+            print(response if isinstance(response, Exception) else response.content)
+
+    if 'metrics' in sys.argv:
+        from f1gpt.metrics import recorder
+
+        recorder.export('metrics.jsonl', argv=sys.argv[1:])
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain.schema import HumanMessage
+
+from f1gpt.executors import PromptExecutor, is_transient
+from f1gpt.prompts import StubModel
+
+class SyncStubModel:
+    '''StubModel without apredict_messages (runs in the thread pool), failing its first calls
+    and counting the calls running at the same time'''
+    def __init__(self, delay: float = 0.0, errors: list[Exception] | None = None) -> None:
+        self.stub = StubModel(delay)
+        self.errors = list(errors or [])
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def predict_messages(self, messages):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            error = self.errors.pop(0) if self.errors else None
+        try:
+            if error is not None:
+                raise error
+            return self.stub.predict_messages(messages)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+def create_prompts(count: int) -> dict:
+    return {f'prompt_{number}': [HumanMessage(content=f'prompt {number}')] for number in range(count)}
+
+def test_wall_time_bounded_by_slowest_call():
+    executor = PromptExecutor(StubModel(delay=0.2), concurrency=8)
+    start = time.perf_counter()
+    responses = executor.run_all(create_prompts(8))
+    assert time.perf_counter() - start < 0.6
+    assert responses['prompt_3'].content == '[stub] prompt 3'
+
+def test_concurrency_limit():
+    model = SyncStubModel(delay=0.05)
+    responses = PromptExecutor(model, concurrency=2).run_all(create_prompts(6))
+    assert all(response.content.startswith('[stub]') for response in responses.values())
+    assert model.max_running == 2
+
+def test_retries_transient_errors():
+    model = SyncStubModel(errors=[ConnectionError('reset'), ConnectionError('reset')])
+    responses = PromptExecutor(model, concurrency=1, retries=3, backoff=0.0).run_all(create_prompts(1))
+    assert responses['prompt_0'].content == '[stub] prompt 0'
+    assert model.calls == 3
+
+def test_does_not_retry_other_errors():
+    model = SyncStubModel(errors=[KeyError('driver')])
+    responses = PromptExecutor(model, concurrency=1, retries=3, backoff=0.0).run_all(create_prompts(1))
+    assert isinstance(responses['prompt_0'], KeyError)
+    assert model.calls == 1
+
+def test_timeouts_stay_within_concurrency():
+    model = SyncStubModel(delay=0.3)
+    executor = PromptExecutor(model, concurrency=2, retries=1, backoff=0.0, timeout=0.05)
+    responses = executor.run_all(create_prompts(4))
+    assert all(isinstance(response, asyncio.TimeoutError) for response in responses.values())
+    # timed out calls keep their thread, so retries never run on top of them
+    assert model.max_running <= 2
+
+def test_is_transient_api_errors():
+    error = pytest.importorskip('openai.error')
+    assert is_transient(error.RateLimitError('slow down'))
+    assert is_transient(error.APIError('bad gateway', http_status=502))
+    assert not is_transient(error.InvalidRequestError('bad request', param=None))
+    assert not is_transient(error.AuthenticationError('no key'))